@@ -8,6 +8,7 @@ import ConfigParser
 import errno
 import logging
 import os
+import select
 
 # only posix has resource module (from supporable systems)
 if os.name == "posix":
@@ -21,6 +22,7 @@ from common.utilities import config_util
 from common.utilities import constants
 from common.utilities import poller
 from common.utilities import util
+from block_device.utilities import block_store
 
 if not hasattr(os, 'O_BINARY'):
     os.O_BINARY = 0
@@ -37,6 +39,12 @@ POLL_TYPE = {
     "poll": poller.Poller,
     "select": poller.Select
 }
+# epoll is only available on Linux
+if hasattr(select, "epoll"):
+    POLL_TYPE["epoll"] = poller.Epoll
+
+## Default poll type, epoll if available
+DEFAULT_POLL_TYPE = "epoll" if "epoll" in POLL_TYPE else "poll"
 
 ## Parse Arguments for running the Block Device Server
 def parse_args():
@@ -62,8 +70,8 @@ def parse_args():
     parser.add_argument(
         '--poll-type',
         choices=POLL_TYPE.keys(),
-        default=sorted(POLL_TYPE.keys())[0],
-        help='poll or select, default: poll'
+        default=DEFAULT_POLL_TYPE,
+        help='epoll, poll or select, default: %(default)s'
     )
     parser.add_argument(
         '--max-buffer',
@@ -75,6 +83,13 @@ def parse_args():
         type=int,
         default=1000,
     )
+    parser.add_argument(
+        '--keep-alive-timeout',
+        type=int,
+        default=constants.DEFAULT_KEEP_ALIVE_TIMEOUT,
+        help='Seconds to keep an idle connection, 0 disables keep-alive, ' +
+        'default: %(default)s',
+    )
     parser.add_argument(
         '--config-file',
         type=str,
@@ -109,23 +124,20 @@ def main():
     # parse the config file
     config_sections = config_util.parse_config(args.config_file)
 
-    # check that the disk file and dis info file is ok before running the
-    # server create file if necessary
+    # handle daemon state
+    if args.daemon:
+        daemonize()
+
+    # allocate the disk file up to its capacity, then open it for the
+    # lifetime of the server with the storage backend of the config, create
+    # file if necessary
     try:
-        disk_fd = os.open(
-            config_sections["Server"]["disk_name"],
-            os.O_RDONLY | os.O_CREAT | os.O_BINARY,
-            0o666
-        )
-        os.close(disk_fd)
+        block_store.preallocate(config_sections["Server"])
+        store = block_store.create_block_store(config_sections["Server"])
     except Exception as e:
         logging.critical("BLOCK DEVICE STARTUP UNSUCCESSFUL:\t %s" % e)
         return
 
-    # handle daemon state
-    if args.daemon:
-        daemonize()
-
     application_context = {
         "server_type": constants.BLOCK_DEVICE_SERVER,
         "bind_address": constants.DEFAULT_HTTP_ADDRESS,
@@ -135,15 +147,37 @@ def main():
         "poll_timeout": args.poll_timeout,
         "max_connections": args.max_connections,
         "max_buffer": args.max_buffer,
+        "keep_alive_timeout": args.keep_alive_timeout,
         "disk_name": config_sections["Server"]["disk_name"],
         "disk_info_name": config_sections["Server"]["disk_info_name"],
+        "block_store": store,
         "multicast_group": config_sections["MulticastGroup"],
         "authentication": config_sections["Authentication"],
         "server_info": config_sections["Server"],
         "config_file": args.config_file,
     }
     server = async_server.AsyncServer(application_context)
-    server.run()
+
+    # sync the written data of the block store periodically, if needed
+    if store.get_sync_interval() is not None:
+        application_context["timers"].call_every(
+            store.get_sync_interval(),
+            store.sync
+        )
+
+    # flush the write-back buffer of the block store periodically, if it has
+    # one
+    if store.get_flush_interval() is not None:
+        application_context["timers"].call_every(
+            store.get_flush_interval(),
+            store.flush
+        )
+
+    try:
+        server.run()
+    finally:
+        # don't lose the buffered writes
+        store.close()
 
 
 def daemonize():
@@ -0,0 +1,85 @@
+#!/usr/bin/python
+## @package RAID5.block_device.services.get_allocation_service
+# Module that implements the Block Device GetAllocationService
+#
+
+import errno
+import logging
+import os
+import socket
+import time
+import traceback
+
+from common.services import base_service
+from common.utilities import constants
+from common.utilities import util
+
+## A Block Device Service that sends the Frontend the allocation map of the
+## disk file, the extents of blocks that have data. The disk file is sparse,
+## blocks that were never written are holes and read as zeros. The content
+## is the extents as first$count$first$count...
+class GetAllocationService(base_service.BaseService):
+
+    ## Constructor for GetAllocationService
+    # @param entry (pollable) the entry (probably @ref
+    # common.pollables.service_socket) using the service
+    # @param pollables (dict) All the pollables currently in the server
+    # @param args (dict) Arguments for this service
+    def __init__(self, entry, pollables, args):
+        super(GetAllocationService, self).__init__(
+            ["Authorization"],
+            [],
+            args
+        )
+
+    ## Name of the service
+    # needed for Frontend purposes, creating clients
+    # required by common.services.base_service.BaseService
+    # @returns (str) service name
+    @staticmethod
+    def get_name():
+        return "/allocmap"
+
+    ## What the service does before sending a response status
+    # see @ref common.services.base_service.BaseService
+    # function finds the extents of the disk file that have data
+    # @param entry (pollable) the entry that the service is assigned to
+    # @returns (bool) if finished and ready to move on
+    def before_response_status(self, entry):
+        if not util.check_frontend_login(entry):
+            #login was unsucsessful, notify the user agent
+            self._response_status = 401
+            logging.debug("%s:\tIncorrect Long password (%s)" % (
+                entry,
+                self._response_status
+            ))
+            return
+
+        # login was successful
+        try:
+            extents = []
+            for start, end in entry.application_context[
+                "block_store"
+            ].allocated_ranges():
+                # a block with some data is allocated
+                first = start // constants.BLOCK_SIZE
+                last = (end + constants.BLOCK_SIZE - 1) // constants.BLOCK_SIZE
+                if len(extents) and extents[-1][0] + extents[-1][1] >= first:
+                    extents[-1][1] = last - extents[-1][0]
+                else:
+                    extents.append([first, last - first])
+
+            self._response_content = constants.MY_SEPERATOR.join(
+                "%s%s%s" % (first, constants.MY_SEPERATOR, count)
+                for first, count in extents
+            )
+            self._response_headers = {
+                "Content-Length": len(self._response_content)
+            }
+
+        except Exception as e:
+            traceback.print_exc()
+            logging.error("%s :\t %s " % (entry, e))
+            self._response_status = 500
+
+        return True
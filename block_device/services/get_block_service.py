@@ -29,17 +29,6 @@ class GetBlockService(base_service.BaseService):
             ["block_num"],
             args
         )
-        try:
-            ## File descriptor of disk file
-            self._fd = os.open(
-                entry.application_context["disk_name"],
-                os.O_RDWR | os.O_BINARY,
-                0o666
-            )
-        except OSError as e:
-            self._fd = None
-            raise e
-
 
     ## Name of the service
     # needed for Frontend purposes, creating clients
@@ -69,18 +58,9 @@ class GetBlockService(base_service.BaseService):
             if not self.check_args():
                 raise RuntimeError("Invalid args")
 
-            os.lseek(
-                self._fd,
-                (
-                    constants.BLOCK_SIZE *
-                    int(self._args["block_num"][0])
-                ),
-                os.SEEK_SET,
-            )
-            self._response_content = util.read(
-                self._fd,
-                constants.BLOCK_SIZE
-            )
+            self._response_content = entry.application_context[
+                "block_store"
+            ].read_blocks(int(self._args["block_num"][0]), 1)
             self._response_headers = {
                 "Content-Length": len(self._response_content)
             }
@@ -91,9 +71,3 @@ class GetBlockService(base_service.BaseService):
             self._response_status = 500
 
         return True
-
-    ## What the service needs to do before terminating
-    # see @ref common.services.base_service.BaseService
-    # closes the disk file descriptor
-    def before_terminate(self, entry):
-        os.close(self._fd)
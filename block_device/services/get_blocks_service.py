@@ -0,0 +1,119 @@
+#!/usr/bin/python
+## @package RAID5.block_device.services.get_blocks_service
+# Module that implements the Block Device GetBlocksService
+#
+
+import errno
+import logging
+import os
+import socket
+import time
+import traceback
+
+from common.services import base_service
+from common.utilities import constants
+from common.utilities import util
+
+## A Block Device Service that allows the Frontend Server to request a range
+## of contiguous blocks in a single response. The blocks are read from the
+## disk file in large chunks and streamed to the Frontend. Like
+## @ref block_device.services.get_block_service.GetBlockService, blocks past
+## the end of the disk file are not sent (the content is shorter).
+class GetBlocksService(base_service.BaseService):
+
+    ## Constructor for GetBlocksService
+    # @param entry (pollable) the entry (probably @ref
+    # common.pollables.service_socket) using the service
+    # @param pollables (dict) All the pollables currently in the server
+    # @param args (dict) Arguments for this service
+    def __init__(self, entry, pollables, args):
+        super(GetBlocksService, self).__init__(
+            ["Authorization"],
+            ["first", "count"],
+            args
+        )
+
+        ## Offset in the disk file of the next chunk we send
+        self._offset = 0
+
+        ## Amount of bytes left to send
+        self._left = 0
+
+        ## Block store of the disk file
+        self._block_store = entry.application_context["block_store"]
+
+    ## Name of the service
+    # needed for Frontend purposes, creating clients
+    # required by common.services.base_service.BaseService
+    # @returns (str) service name
+    @staticmethod
+    def get_name():
+        return "/getblocks"
+
+    ## What the service does before sending a response status
+    # see @ref common.services.base_service.BaseService
+    # function computes the range of the disk file that will be sent
+    # @param entry (pollable) the entry that the service is assigned to
+    # @returns (bool) if finished and ready to move on
+    def before_response_status(self, entry):
+        if not util.check_frontend_login(entry):
+            #login was unsucsessful, notify the user agent
+            self._response_status = 401
+            logging.debug("%s:\tIncorrect Long password (%s)" % (
+                entry,
+                self._response_status
+            ))
+            return
+
+        # login was successful
+        try:
+            if not self.check_args():
+                raise RuntimeError("Invalid args")
+
+            first = int(self._args["first"][0])
+            count = int(self._args["count"][0])
+            if first < 0 or count < 0:
+                raise RuntimeError("Invalid range of blocks")
+
+            # don't send anything past the end of the disk file
+            self._offset = first * constants.BLOCK_SIZE
+            self._left = max(
+                0,
+                min(
+                    count * constants.BLOCK_SIZE,
+                    self._block_store.get_size() - self._offset
+                )
+            )
+            self._response_headers = {
+                "Content-Length": self._left
+            }
+
+        except Exception as e:
+            traceback.print_exc()
+            logging.error("%s :\t %s " % (entry, e))
+            self._response_status = 500
+
+        return True
+
+    ## What the service does before sending the response content
+    # see @ref common.services.base_service.BaseService
+    # function reads the next chunk of blocks from the disk file, but only
+    # once the previous chunk has mostly been sent
+    # @param entry (pollable) the entry that the service is assigned to
+    # @returns (bool) if finished and ready to move on
+    def before_response_content(self, entry):
+        if self._response_status != 200:
+            return True
+
+        if len(entry.data_to_send) < constants.MAX_READ_CHUNK:
+            chunk = self._block_store.read(
+                self._offset,
+                min(self._left, constants.MAX_READ_CHUNK)
+            )
+            if len(chunk) == 0 and self._left > 0:
+                raise RuntimeError("Disk file has been truncated")
+
+            self._response_content = chunk
+            self._offset += len(chunk)
+            self._left -= len(chunk)
+        return self._left == 0
@@ -76,7 +76,8 @@ class LoginService(base_service.BaseService):
         entry.application_context["authentication"]["long_password"] = (
             password
         )
-        entry.application_context["server_info"]["volume_UUID"] = (
+        # config fields are lower case, the declarer announces this one
+        entry.application_context["server_info"]["volume_uuid"] = (
             volume_UUID
         )
 
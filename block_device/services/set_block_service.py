@@ -30,18 +30,12 @@ class SetBlockService(base_service.BaseService):
             args
         )
 
-        ## Content of block recieved
-        self._content = ""
-        try:
-            ## File descriptor os disk file
-            self._fd = os.open(
-                entry.application_context["disk_name"],
-                os.O_RDWR | os.O_BINARY,
-                0o666
-            )
-        except OSError as e:
-            self._fd = None
-            raise e
+        ## Offset in the disk file of the next content we write
+        self._offset = 0
+
+        ## Content of a block that was only partly recieved, written once
+        ## the rest of it is recieved
+        self._partial = ""
 
     ## Name of the service
     # needed for Frontend purposes, creating clients
@@ -53,7 +47,7 @@ class SetBlockService(base_service.BaseService):
 
 
     ## What the service does before recieving the content
-    # function prepares the file descriptor for writing in correct place
+    # function computes the offset of the block in the disk file
     # @param entry (pollable) the entry that the service is assigned to
     # @returns (bool) if finished and ready to move on
     def before_content(self, entry):
@@ -67,20 +61,13 @@ class SetBlockService(base_service.BaseService):
             return True
 
         # login was successful
-        if self._fd is None:
-            return True
-
         try:
             if not self.check_args():
                 raise RuntimeError("Invalid args")
 
-            os.lseek(
-                self._fd,
-                (
-                    constants.BLOCK_SIZE *
-                    int(self._args["block_num"][0])
-                ),
-                os.SEEK_SET,
+            self._offset = (
+                constants.BLOCK_SIZE *
+                int(self._args["block_num"][0])
             )
 
             self._response_headers = {
@@ -93,23 +80,47 @@ class SetBlockService(base_service.BaseService):
         return True
 
     ## Handle the content that entry socket has recieved
-    # write to disk file with file desciptor
+    # write to disk file at the offset of the block, whole blocks only
+    # until the content has all been recieved
     # @param entry (pollable) the entry that the service is assigned to
     # @param content (str) content recieved from the frontend
     def handle_content(self, entry, content):
         if self._response_status == 200:
-            self._content += content
             try:
-                while self._content:
-                    self._content = self._content[
-                        os.write(self._fd, self._content):
-                    ]
+                if self._partial:
+                    content = self._partial + content
+                end = len(content)
+                if entry.request_context["headers"]["Content-Length"] > 0:
+                    end -= end % constants.BLOCK_SIZE
+                self._partial = content[end:]
+
+                if end > 0:
+                    entry.application_context["block_store"].write(
+                        self._offset,
+                        content[:end]
+                    )
+                    self._offset += end
             except Exception as e:
                 logging.error("%s :\t %s " % (entry, e))
                 self._response_status = 500
+
+        # the content is all written, acknowledge it once it is synced
+        if (
+            self._response_status == 200 and
+            entry.request_context["headers"]["Content-Length"] == 0 and
+            entry.application_context["block_store"].wait_for_sync(
+                entry.application_context["timers"],
+                lambda error: self.on_synced(entry, error)
+            )
+        ):
+            entry.state = constants.SLEEPING_STATE
         return True
 
-    ## What the service needs to do before terminating
-    # closes the disk file descriptor
-    def before_terminate(self, entry):
-        os.close(self._fd)
+    ## Called once the written content is synced by a group commit, lets
+    ## the response be sent
+    # @param entry (pollable) the entry that the service is assigned to
+    # @param error (Exception) error of the sync, None if successful
+    def on_synced(self, entry, error):
+        if error is not None:
+            self._response_status = 500
+        entry.state = constants.SEND_STATUS_STATE
@@ -0,0 +1,180 @@
+#!/usr/bin/python
+## @package RAID5.block_device.services.set_blocks_service
+# Module that implements the Block Device SetBlocksService
+#
+
+import errno
+import logging
+import os
+import socket
+import time
+import traceback
+
+from common.services import base_service
+from common.utilities import constants
+from common.utilities import util
+
+## A Block Device Service that allows the Frontend Server to set many blocks
+## in a single request. The blocks are either a contiguous run of blocks
+## (first=block_num) or a list of blocks (blocks=block_num,block_num,...),
+## and the content is the data of all the blocks one after the other. The
+## content is written to the disk file as it is recieved.
+class SetBlocksService(base_service.BaseService):
+
+    ## Constructor for SetBlocksService
+    # @param entry (pollable) the entry (probably @ref
+    # common.pollables.service_socket) using the service
+    # @param pollables (dict) All the pollables currently in the server
+    # @param args (dict) Arguments for this service
+    def __init__(self, entry, pollables, args):
+        super(SetBlocksService, self).__init__(
+            ["Authorization"],
+            [],
+            args
+        )
+
+        ## Runs of contiguous blocks left to write, in the order of the
+        ## content. list of [offset, length]
+        self._runs = []
+
+        ## Content of a block that was only partly recieved, written once
+        ## the rest of it is recieved
+        self._partial = ""
+
+    ## Name of the service
+    # needed for Frontend purposes, creating clients
+    # required by common.services.base_service.BaseService
+    # @returns (str) service name
+    @staticmethod
+    def get_name():
+        return "/setblocks"
+
+    ## Checks that we got either the first arg or the blocks arg
+    ## @returns (bool) if args match
+    def check_args(self):
+        return (
+            len(self._args) == 1 and
+            (
+                "first" in self._args.keys() or
+                "blocks" in self._args.keys()
+            )
+        )
+
+    ## What the service does before recieving the content
+    # function computes the runs of blocks the content will be written to
+    # @param entry (pollable) the entry that the service is assigned to
+    # @returns (bool) if finished and ready to move on
+    def before_content(self, entry):
+        if not util.check_frontend_login(entry):
+            # login was unsucsessful, notify the user agent
+            self._response_status = 401
+            logging.debug("%s:\tIncorrect Long password (%s)" % (
+                entry,
+                self._response_status
+            ))
+            return True
+
+        # login was successful
+        try:
+            if not self.check_args():
+                raise RuntimeError("Invalid args")
+
+            content_length = int(
+                entry.request_context["headers"].get("Content-Length", 0)
+            )
+            if content_length % constants.BLOCK_SIZE != 0:
+                raise RuntimeError("Content is not made of whole blocks")
+
+            if "first" in self._args.keys():
+                blocks = range(
+                    int(self._args["first"][0]),
+                    (
+                        int(self._args["first"][0]) +
+                        content_length // constants.BLOCK_SIZE
+                    )
+                )
+            else:
+                blocks = [
+                    int(block_num)
+                    for block_num in self._args["blocks"][0].split(",")
+                ]
+                if len(blocks) * constants.BLOCK_SIZE != content_length:
+                    raise RuntimeError("Content doesn't match the blocks")
+
+            # merge contiguous blocks so each run is written at once
+            for block_num in blocks:
+                if block_num < 0:
+                    raise RuntimeError("Invalid block_num %s" % block_num)
+                offset = block_num * constants.BLOCK_SIZE
+                if (
+                    len(self._runs) and
+                    sum(self._runs[-1]) == offset
+                ):
+                    self._runs[-1][1] += constants.BLOCK_SIZE
+                else:
+                    self._runs.append([offset, constants.BLOCK_SIZE])
+
+            self._response_headers = {
+                "Content-Length": "0",
+            }
+
+        except Exception as e:
+            logging.error("%s :\t %s " % (entry, e))
+            self._response_status = 500
+        return True
+
+    ## Handle the content that entry socket has recieved
+    # write to disk file, each part at the offset of its run, whole blocks
+    # only until the content has all been recieved
+    # @param entry (pollable) the entry that the service is assigned to
+    # @param content (str) content recieved from the frontend
+    def handle_content(self, entry, content):
+        if self._response_status != 200:
+            return True
+
+        try:
+            if self._partial:
+                content = self._partial + content
+            end = len(content)
+            if entry.request_context["headers"]["Content-Length"] > 0:
+                end -= end % constants.BLOCK_SIZE
+            self._partial = content[end:]
+
+            index = 0
+            while index < end:
+                if len(self._runs) == 0:
+                    raise RuntimeError("Too much content")
+
+                offset, length = self._runs[0]
+                buf = content[index:min(index + length, end)]
+                entry.application_context["block_store"].write(offset, buf)
+                index += len(buf)
+
+                if len(buf) == length:
+                    self._runs.pop(0)
+                else:
+                    self._runs[0] = [offset + len(buf), length - len(buf)]
+        except Exception as e:
+            logging.error("%s :\t %s " % (entry, e))
+            self._response_status = 500
+
+        # the content is all written, acknowledge it once it is synced
+        if (
+            self._response_status == 200 and
+            entry.request_context["headers"]["Content-Length"] == 0 and
+            entry.application_context["block_store"].wait_for_sync(
+                entry.application_context["timers"],
+                lambda error: self.on_synced(entry, error)
+            )
+        ):
+            entry.state = constants.SLEEPING_STATE
+        return True
+
+    ## Called once the written content is synced by a group commit, lets
+    ## the response be sent
+    # @param entry (pollable) the entry that the service is assigned to
+    # @param error (Exception) error of the sync, None if successful
+    def on_synced(self, entry, error):
+        if error is not None:
+            self._response_status = 500
+        entry.state = constants.SEND_STATUS_STATE
@@ -0,0 +1,105 @@
+#!/usr/bin/python
+## @package RAID5.block_device.services.trim_service
+# Module that implements the Block Device TrimService
+#
+
+import errno
+import logging
+import os
+import socket
+import time
+import traceback
+
+from common.services import base_service
+from common.utilities import constants
+from common.utilities import util
+
+## A Block Device Service that allows the Frontend Server to discard a range
+## of contiguous blocks (first=block_num&count=amount). A hole is punched in
+## the disk file, so the blocks are freed and read as zeros. Like a write,
+## the response is sent once the discard is synced (in the group durability
+## mode).
+class TrimService(base_service.BaseService):
+
+    ## Constructor for TrimService
+    # @param entry (pollable) the entry (probably @ref
+    # common.pollables.service_socket) using the service
+    # @param pollables (dict) All the pollables currently in the server
+    # @param args (dict) Arguments for this service
+    def __init__(self, entry, pollables, args):
+        super(TrimService, self).__init__(
+            ["Authorization"],
+            ["first", "count"],
+            args
+        )
+
+    ## Name of the service
+    # needed for Frontend purposes, creating clients
+    # required by common.services.base_service.BaseService
+    # @returns (str) service name
+    @staticmethod
+    def get_name():
+        return "/trim"
+
+    ## What the service does before recieving the content
+    # function punches a hole for the range of blocks in the disk file
+    # @param entry (pollable) the entry that the service is assigned to
+    # @returns (bool) if finished and ready to move on
+    def before_content(self, entry):
+        if not util.check_frontend_login(entry):
+            # login was unsucsessful, notify the user agent
+            self._response_status = 401
+            logging.debug("%s:\tIncorrect Long password (%s)" % (
+                entry,
+                self._response_status
+            ))
+            return True
+
+        # login was successful
+        try:
+            if not self.check_args():
+                raise RuntimeError("Invalid args")
+
+            first = int(self._args["first"][0])
+            count = int(self._args["count"][0])
+            if first < 0 or count < 0:
+                raise RuntimeError("Invalid range of blocks")
+
+            entry.application_context["block_store"].trim(
+                first * constants.BLOCK_SIZE,
+                count * constants.BLOCK_SIZE
+            )
+            self._response_headers = {
+                "Content-Length": "0",
+            }
+
+        except Exception as e:
+            traceback.print_exc()
+            logging.error("%s :\t %s " % (entry, e))
+            self._response_status = 500
+        return True
+
+    ## Handle the content that entry socket has recieved
+    # there is no content, the response waits for the discard to be synced
+    # @param entry (pollable) the entry that the service is assigned to
+    # @param content (str) content recieved from the frontend
+    def handle_content(self, entry, content):
+        if (
+            self._response_status == 200 and
+            entry.request_context["headers"]["Content-Length"] == 0 and
+            entry.application_context["block_store"].wait_for_sync(
+                entry.application_context["timers"],
+                lambda error: self.on_synced(entry, error)
+            )
+        ):
+            entry.state = constants.SLEEPING_STATE
+        return True
+
+    ## Called once the discard is synced by a group commit, lets the
+    ## response be sent
+    # @param entry (pollable) the entry that the service is assigned to
+    # @param error (Exception) error of the sync, None if successful
+    def on_synced(self, entry, error):
+        if error is not None:
+            self._response_status = 500
+        entry.state = constants.SEND_STATUS_STATE
@@ -82,17 +82,11 @@ class UpdateLevelService(base_service.BaseService):
             "Content-Length": len(self._response_content)
         }
 
-        # set back to beginning
-        os.lseek(
+        # write new disk info with incremented level, at the beginning
+        util.pwrite(
             self._fd,
-            0,
-            os.SEEK_SET
-        )
-
-        # write new disk info with incremented level
-        util.write(
-            self._fd,
-            constants.MY_SEPERATOR.join(disk_info)
+            constants.MY_SEPERATOR.join(disk_info),
+            0
         )
 
     ## What the service needs to do before terminating
@@ -0,0 +1,3 @@
+#!/usr/bin/python
+## @package RAID5.block_device.utilities
+## Utilities for Block Device Server
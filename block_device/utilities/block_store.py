@@ -0,0 +1,658 @@
+#!/usr/bin/python
+## @package RAID5.block_device.utilities.block_store
+# Module that defines the BlockStore and MmapBlockStore classes, the disk
+# file of a block device
+#
+
+import collections
+import logging
+import mmap
+import os
+import time
+
+from block_device.utilities import write_back_buffer
+from common.utilities import constants
+from common.utilities import util
+
+## BlockStore class that keeps the disk file of the block device open for
+## the lifetime of the server. All the services read and write the disk file
+## through the block store, at the offsets of the blocks (os.pread and
+## os.pwrite when available), so a request costs no open, seek or close.
+##
+## Writes are made durable according to the durability mode:
+## none - left to the kernel
+## group - group commit, a write that waits for a sync (see wait_for_sync)
+## is acknowledged once the disk file is synced, which happens every
+## group_commit_interval or once group_commit_bytes were written
+## dsync - every write is synced (the disk file is opened with O_DSYNC)
+##
+## Writes can be kept in a write-back buffer, which is flushed every
+## write_back_interval, once it has write_back_size bytes, and before a
+## sync. Contiguous dirty blocks are flushed with a single write, and reads
+## of dirty blocks are served from the buffer. A write in the dsync mode
+## isn't buffered.
+class BlockStore(object):
+
+    ## Constructor for BlockStore, creates the disk file if necessary
+    ## @param file_name (string) name of the disk file
+    ## @param durability (string) durability mode
+    ## @param group_commit_interval (float) max time (in seconds) a write
+    ## waits for a group commit
+    ## @param group_commit_bytes (int) amount of written bytes after which
+    ## a group commit starts right away
+    ## @param write_back_size (int) size (in bytes) of the write-back buffer,
+    ## 0 for no write-back buffer
+    ## @param write_back_interval (float) time (in seconds) between flushes
+    ## of the write-back buffer
+    def __init__(
+        self,
+        file_name,
+        durability=constants.DEFAULT_DURABILITY,
+        group_commit_interval=constants.DEFAULT_GROUP_COMMIT_INTERVAL / 1000.,
+        group_commit_bytes=constants.DEFAULT_GROUP_COMMIT_BYTES,
+        write_back_size=constants.DEFAULT_WRITE_BACK_SIZE,
+        write_back_interval=constants.DEFAULT_WRITE_BACK_INTERVAL / 1000.,
+    ):
+        if durability not in constants.DURABILITY_MODES:
+            raise RuntimeError("Invalid durability mode: %s" % durability)
+
+        ## Name of the disk file
+        self._file_name = file_name
+
+        ## Durability mode
+        self._durability = durability
+
+        ## Max time a write waits for a group commit
+        self._group_commit_interval = group_commit_interval
+
+        ## Amount of written bytes after which a group commit starts
+        self._group_commit_bytes = group_commit_bytes
+
+        ## Amount of bytes written since the last sync, that aren't synced
+        self._pending_bytes = 0
+
+        ## Callbacks of the writes that wait for the next group commit
+        self._waiters = []
+
+        ## Timer of the next group commit, None if there is none
+        self._commit_timer = None
+
+        ## Amount of syncs
+        self._syncs = 0
+
+        ## Total time (in seconds) of the syncs
+        self._sync_time = 0.0
+
+        ## Longest time (in seconds) of a sync
+        self._max_sync_time = 0.0
+
+        ## Write-back buffer, None if writes aren't buffered
+        self._write_back = None
+        if (
+            write_back_size > 0 and
+            durability != constants.DURABILITY_DSYNC
+        ):
+            self._write_back = write_back_buffer.WriteBackBuffer(
+                write_back_size
+            )
+
+        ## Time between flushes of the write-back buffer
+        self._write_back_interval = write_back_interval
+
+        ## Amount of flushes of the write-back buffer
+        self._flushes = 0
+
+        ## Amount of writes the write-back buffer was flushed with
+        self._flushed_runs = 0
+
+        ## Amount of blocks the write-back buffer was flushed with
+        self._flushed_blocks = 0
+
+        ## File descriptor of the disk file, None once closed
+        self._fd = os.open(self._file_name, self.get_open_flags(), 0o666)
+
+    ## Flags the disk file is opened with
+    ## @returns flags (int)
+    def get_open_flags(self):
+        flags = os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0)
+        if self._durability == constants.DURABILITY_DSYNC:
+            flags |= getattr(os, "O_DSYNC", getattr(os, "O_SYNC", 0))
+        return flags
+
+    ## Size of the disk file, including the dirty blocks
+    ## @returns size (int) size in bytes
+    def get_size(self):
+        size = os.fstat(self._fd).st_size
+        if self._write_back is not None:
+            size = max(size, self._write_back.get_end())
+        return size
+
+    ## Reads from the disk file, shorter at the end of the file. Dirty blocks
+    ## are read from the write-back buffer.
+    ## @param offset (int) offset to read from
+    ## @param length (int) amount of bytes to read
+    ## @returns data (string) the data
+    def read(self, offset, length):
+        data = util.pread(self._fd, length, offset)
+        if self._write_back is None or len(self._write_back) == 0:
+            return data
+
+        # the dirty blocks might be past the end of the disk file, the gap
+        # before them reads as zeros
+        data = data.ljust(
+            min(length, self._write_back.get_end() - offset),
+            "\x00"
+        )
+        blocks = self._write_back.get_range(
+            offset // constants.BLOCK_SIZE,
+            (offset + length - 1) // constants.BLOCK_SIZE + 1
+        )
+        if len(blocks) == 0:
+            return data
+
+        data = bytearray(data)
+        for block_num, block in blocks:
+            block_offset = block_num * constants.BLOCK_SIZE
+            start = max(block_offset, offset)
+            end = min(block_offset + len(block), offset + length)
+            if start >= end:
+                continue
+            data[start - offset:end - offset] = block[
+                start - block_offset:end - block_offset
+            ]
+        return bytes(data)
+
+    ## Reads a range of blocks from the disk file, blocks past the end of the
+    ## file are left out
+    ## @param first (int) block_num of the first block
+    ## @param count (int) amount of blocks
+    ## @returns data (string) the data of the blocks
+    def read_blocks(self, first, count):
+        return self.read(
+            first * constants.BLOCK_SIZE,
+            count * constants.BLOCK_SIZE
+        )
+
+    ## Writes to the disk file, or to the write-back buffer
+    ## @param offset (int) offset to write to
+    ## @param data (string) data to write
+    def write(self, offset, data):
+        if self._write_back is not None:
+            self.write_back(offset, data)
+            self._pending_bytes += len(data)
+            if self._write_back.is_full():
+                self.flush()
+            return
+
+        start = time.time()
+        util.pwrite(self._fd, data, offset)
+        if self._durability == constants.DURABILITY_DSYNC:
+            self.add_sync_time(time.time() - start)
+        else:
+            self._pending_bytes += len(data)
+
+    ## Writes to the write-back buffer. A block that is only partly written
+    ## is merged with its current data.
+    ## @param offset (int) offset to write to
+    ## @param data (string) data to write
+    def write_back(self, offset, data):
+        index = 0
+        while index < len(data):
+            block_num = (offset + index) // constants.BLOCK_SIZE
+            start = (offset + index) % constants.BLOCK_SIZE
+            length = min(constants.BLOCK_SIZE - start, len(data) - index)
+            piece = data[index:index + length]
+
+            if length != constants.BLOCK_SIZE:
+                block = self._write_back.get(block_num)
+                if block is None:
+                    block = util.pread(
+                        self._fd,
+                        constants.BLOCK_SIZE,
+                        block_num * constants.BLOCK_SIZE
+                    )
+                piece = (
+                    block[:start].ljust(start, "\x00") +
+                    piece +
+                    block[start + length:]
+                )
+            self._write_back.add(block_num, piece)
+            index += length
+
+    ## Flushes the write-back buffer to the disk file
+    def flush(self):
+        if self._write_back is None or len(self._write_back) == 0:
+            return
+        runs = self._write_back.get_runs()
+        for offset, data in runs:
+            util.pwrite(self._fd, data, offset)
+        self._flushes += 1
+        self._flushed_runs += len(runs)
+        self._flushed_blocks += len(self._write_back)
+        self._write_back.clear()
+
+    ## Interval between flushes of the write-back buffer
+    ## @returns interval (float) interval in seconds, None if there is no
+    ## write-back buffer
+    def get_flush_interval(self):
+        if self._write_back is None:
+            return None
+        return self._write_back_interval
+
+    ## Discards a range of the disk file, the range reads as zeros and its
+    ## blocks are freed (a hole is punched). Dirty blocks of the range are
+    ## dropped. Like a write, the discard is synced according to the
+    ## durability mode.
+    ## @param offset (int) offset of the range, of a whole block
+    ## @param length (int) length of the range, of whole blocks
+    def trim(self, offset, length):
+        if self._write_back is not None:
+            self._write_back.discard(
+                offset // constants.BLOCK_SIZE,
+                (offset + length) // constants.BLOCK_SIZE
+            )
+        util.punch_hole(self._fd, offset, length)
+        self._pending_bytes += length
+        if self._durability == constants.DURABILITY_DSYNC:
+            self.sync()
+
+    ## Returns the ranges of the disk file that have data
+    ## @returns ranges (list) list of (start, end) offsets of the data
+    def allocated_ranges(self):
+        self.flush()
+        return util.allocated_ranges(self._fd)
+
+    ## Lets a write wait for the next group commit, if the durability mode
+    ## is group commit. The callback is called (from a timer) with the error
+    ## of the sync, None if it was successful.
+    ## @param timers (@ref common.utilities.timers.Timers) timers of the
+    ## server
+    ## @param callback (function) called once the write is synced
+    ## @returns waiting (bool) if the write waits for the callback
+    def wait_for_sync(self, timers, callback):
+        if self._durability != constants.DURABILITY_GROUP:
+            return False
+        self._waiters.append(callback)
+
+        if self._pending_bytes >= self._group_commit_bytes:
+            # enough was written, no point in waiting for more
+            if self._commit_timer is not None:
+                self._commit_timer.cancel()
+            self._commit_timer = timers.call_later(0, self.commit)
+        elif self._commit_timer is None:
+            self._commit_timer = timers.call_later(
+                self._group_commit_interval,
+                self.commit
+            )
+        return True
+
+    ## Group commit, syncs the disk file and lets the waiting writes go on
+    def commit(self):
+        self._commit_timer = None
+        waiters, self._waiters = self._waiters, []
+        error = None
+        try:
+            self.sync()
+        except OSError as e:
+            logging.error("Group commit failed: %s" % e)
+            error = e
+        for callback in waiters:
+            callback(error)
+
+    ## Interval between syncs of the written data, if the store needs to be
+    ## synced periodically
+    ## @returns interval (float) interval in seconds, None if there is none
+    def get_sync_interval(self):
+        return None
+
+    ## Syncs the written data to the disk file, if there is any
+    def sync(self):
+        self.flush()
+        if self._pending_bytes == 0:
+            return
+        start = time.time()
+        self.sync_data()
+        self._pending_bytes = 0
+        self.add_sync_time(time.time() - start)
+
+    ## Syncs the data of the disk file
+    def sync_data(self):
+        getattr(os, "fdatasync", os.fsync)(self._fd)
+
+    ## Adds a sync to the statistics
+    ## @param duration (float) time (in seconds) the sync took
+    def add_sync_time(self, duration):
+        self._syncs += 1
+        self._sync_time += duration
+        self._max_sync_time = max(self._max_sync_time, duration)
+
+    ## Returns the statistics of the store, for choosing the durability mode
+    ## @returns stats (dict) name : value
+    def get_stats(self):
+        return collections.OrderedDict([
+            ("durability", self._durability),
+            ("syncs", self._syncs),
+            (
+                "avg_sync_latency_ms",
+                "%.3f" % (
+                    1000 * self._sync_time / self._syncs
+                    if self._syncs else 0
+                )
+            ),
+            ("max_sync_latency_ms", "%.3f" % (1000 * self._max_sync_time)),
+            ("pending_bytes", self._pending_bytes),
+            ("waiting_writes", len(self._waiters)),
+            (
+                "dirty_blocks",
+                len(self._write_back) if self._write_back is not None else 0
+            ),
+            ("flushes", self._flushes),
+            ("flushed_blocks", self._flushed_blocks),
+            ("flushed_writes", self._flushed_runs),
+            ("size", self.get_size()),
+        ])
+
+    ## Closes the disk file, flushes the write-back buffer
+    def close(self):
+        if self._fd is not None:
+            self.flush()
+            os.close(self._fd)
+            self._fd = None
+
+
+## MmapBlockStore class, a BlockStore that maps the disk file to memory.
+## Reads return views of the mapping (memoryview, or buffer on python-2) that
+## are sent as is, and writes are copied into the mapping.
+##
+## The mapping grows by MMAP_GROW_SIZE (growing the file, sparse) when a
+## write is past its end. The size of the data is recorded in the size file
+## (disk file name + MMAP_SIZE_SUFFIX) on every grow and sync, so the sparse
+## end of the disk file isn't taken for data once the disk file is opened
+## again. close() truncates the disk file back to the size of the data and
+## removes the size file. A view keeps the mapping it was made of, so a
+## mapping is never closed while its views are still waiting to be sent.
+## Like a read from the page cache, a view of a range that is written before
+## it is sent sends the new data.
+##
+## Written pages reach the disk file according to the msync policy:
+## never - left to the kernel
+## always - after every write
+## interval - every interval, see get_sync_interval
+## The durability mode applies too, the dsync mode msyncs every write.
+class MmapBlockStore(BlockStore):
+
+    ## Constructor for MmapBlockStore
+    ## @param file_name (string) name of the disk file
+    ## @param msync (string) msync policy, MSYNC_NEVER, MSYNC_ALWAYS or an
+    ## interval in milliseconds
+    ## @param durability (string) durability mode
+    ## @param group_commit_interval (float) max time (in seconds) a write
+    ## waits for a group commit
+    ## @param group_commit_bytes (int) amount of written bytes after which
+    ## a group commit starts right away
+    def __init__(
+        self,
+        file_name,
+        msync=constants.DEFAULT_MSYNC,
+        durability=constants.DEFAULT_DURABILITY,
+        group_commit_interval=constants.DEFAULT_GROUP_COMMIT_INTERVAL / 1000.,
+        group_commit_bytes=constants.DEFAULT_GROUP_COMMIT_BYTES,
+    ):
+        super(MmapBlockStore, self).__init__(
+            file_name,
+            durability,
+            group_commit_interval,
+            group_commit_bytes
+        )
+
+        if msync not in (constants.MSYNC_NEVER, constants.MSYNC_ALWAYS):
+            try:
+                if float(msync) <= 0:
+                    raise ValueError()
+            except ValueError:
+                raise RuntimeError("Invalid msync policy: %s" % msync)
+
+        ## msync policy
+        self._msync = msync
+
+        ## Name of the size file, that records the size of the data while
+        ## the disk file is bigger
+        self._size_file_name = file_name + constants.MMAP_SIZE_SUFFIX
+
+        ## Size of the data in the disk file, the file itself might be
+        ## bigger as it grows by MMAP_GROW_SIZE
+        self._size = self.load_size()
+
+        ## Size of the data the size file records
+        self._recorded_size = self._size
+
+        ## The mapping of the disk file, None while the file is empty
+        self._mmap = None
+
+        ## Range of written pages that weren't synced yet, [start, end] or
+        ## None
+        self._dirty = None
+
+        ## If blocks of the disk file were allocated or freed since the last
+        ## sync (it grew, or holes were punched), so its metadata needs to be
+        ## synced too
+        self._extents_changed = False
+
+        if self._size > 0:
+            self._mmap = mmap.mmap(self._fd, self._size)
+
+    ## Flags the disk file is opened with, O_DSYNC doesn't apply to the
+    ## mapping
+    ## @returns flags (int)
+    def get_open_flags(self):
+        return os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0)
+
+    ## Size of the data in the disk file
+    ## @returns size (int) size in bytes
+    def get_size(self):
+        return self._size
+
+    ## Loads the size of the data of the disk file. The size file is used if
+    ## it matches the disk file, a grow might not have reached the disk file
+    ## before a crash. Otherwise the whole disk file is data.
+    ## @returns size (int) size in bytes
+    def load_size(self):
+        file_size = os.fstat(self._fd).st_size
+        try:
+            with open(self._size_file_name, "r") as f:
+                size, grown_size = [
+                    int(field) for field in f.read().split(
+                        constants.MY_SEPERATOR
+                    )
+                ]
+        except (IOError, OSError, ValueError):
+            return file_size
+
+        if size <= file_size <= grown_size:
+            return size
+        logging.warning(
+            "Ignoring size file %s, the disk file has changed" % (
+                self._size_file_name,
+            )
+        )
+        return file_size
+
+    ## Records the size of the data in the size file
+    ## @param size (int) size of the data
+    ## @param grown_size (int) size of the disk file once it has grown
+    def record_size(self, size, grown_size):
+        with open(self._size_file_name + ".tmp", "w") as f:
+            f.write("%s%s%s" % (size, constants.MY_SEPERATOR, grown_size))
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(self._size_file_name + ".tmp", self._size_file_name)
+        self._recorded_size = size
+
+    ## Returns a view of the mapping, shorter at the end of the data
+    ## @param offset (int) offset to read from
+    ## @param length (int) amount of bytes to read
+    ## @returns data (memoryview or buffer) view of the data
+    def read(self, offset, length):
+        length = min(length, self._size - offset)
+        if length <= 0:
+            return ""
+        try:
+            return memoryview(self._mmap)[offset:offset + length]
+        except TypeError:
+            # python-2 mmap only has the old buffer interface
+            return buffer(self._mmap, offset, length)
+
+    ## Writes to the mapping, grows it if needed
+    ## @param offset (int) offset to write to
+    ## @param data (string) data to write
+    def write(self, offset, data):
+        end = offset + len(data)
+        if self._mmap is None or end > len(self._mmap):
+            self.grow(end)
+        self._mmap[offset:end] = data
+        self._size = max(self._size, end)
+
+        # msync works on whole pages
+        start = offset - offset % mmap.PAGESIZE
+        if self._dirty is None:
+            self._dirty = [start, end]
+        else:
+            self._dirty = [min(self._dirty[0], start), max(self._dirty[1], end)]
+        self._pending_bytes += len(data)
+
+        if (
+            self._msync == constants.MSYNC_ALWAYS or
+            self._durability == constants.DURABILITY_DSYNC
+        ):
+            self.sync()
+
+    ## Maps a bigger part of the disk file, at least up to an offset. The
+    ## previous mapping isn't closed, views of it might still be in use. The
+    ## size of the data, with the write that grows it, is recorded before
+    ## the disk file grows past it.
+    ## @param end (int) the offset
+    def grow(self, end):
+        size = (
+            (end + constants.MMAP_GROW_SIZE - 1) //
+            constants.MMAP_GROW_SIZE * constants.MMAP_GROW_SIZE
+        )
+        if os.fstat(self._fd).st_size < size:
+            self.record_size(max(self._size, end), size)
+            os.ftruncate(self._fd, size)
+            self._extents_changed = True
+        self._mmap = mmap.mmap(self._fd, size)
+
+    ## Discards a range of the disk file, the mapping of the range reads as
+    ## zeros once the hole is punched
+    ## @param offset (int) offset of the range, of a whole block
+    ## @param length (int) length of the range, of whole blocks
+    def trim(self, offset, length):
+        self._extents_changed = True
+        super(MmapBlockStore, self).trim(offset, length)
+
+    ## Syncs the written pages to the disk file, the metadata of the disk
+    ## file if its blocks changed, and the size of the data if it changed
+    def sync_data(self):
+        if self._dirty is not None:
+            start, end = self._dirty
+            self._dirty = None
+            self._mmap.flush(start, end - start)
+        if self._extents_changed:
+            self._extents_changed = False
+            os.fsync(self._fd)
+        if self._size != self._recorded_size:
+            self.record_size(self._size, os.fstat(self._fd).st_size)
+
+    ## Interval between syncs, if the msync policy is an interval
+    ## @returns interval (float) interval in seconds, None if there is none
+    def get_sync_interval(self):
+        if self._msync in (constants.MSYNC_NEVER, constants.MSYNC_ALWAYS):
+            return None
+        return float(self._msync) / 1000
+
+    ## Closes the disk file, syncs the written pages. The disk file is
+    ## truncated back to the size of the data, so the size file isn't needed
+    ## anymore.
+    def close(self):
+        if self._fd is None:
+            return
+        self.sync()
+        self._mmap = None
+        if os.fstat(self._fd).st_size > self._size:
+            os.ftruncate(self._fd, self._size)
+            os.fsync(self._fd)
+        if os.path.exists(self._size_file_name):
+            os.remove(self._size_file_name)
+        super(MmapBlockStore, self).close()
+
+
+## Allocates the disk file up to the capacity of the config, so that it isn't
+## fragmented by sparse writes. Done before the block store is created, the
+## storage backends see the whole capacity as the size of the disk file.
+## @param server_config (dict) the [Server] section of the config
+def preallocate(server_config):
+    capacity = int(
+        server_config.get("capacity", constants.DEFAULT_CAPACITY)
+    )
+    if capacity <= 0:
+        return
+
+    # whole blocks only
+    capacity += -capacity % constants.BLOCK_SIZE
+    fd = os.open(
+        server_config["disk_name"],
+        os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0),
+        0o666
+    )
+    try:
+        util.fallocate(fd, 0, capacity)
+    finally:
+        os.close(fd)
+
+
+## Creates the block store of the disk file, with the storage backend and
+## durability of the config
+## @param server_config (dict) the [Server] section of the config
+## @returns block_store (BlockStore) the block store
+def create_block_store(server_config):
+    durability_args = (
+        server_config.get("durability", constants.DEFAULT_DURABILITY),
+        float(
+            server_config.get(
+                "group_commit_interval",
+                constants.DEFAULT_GROUP_COMMIT_INTERVAL
+            )
+        ) / 1000,
+        int(
+            server_config.get(
+                "group_commit_bytes",
+                constants.DEFAULT_GROUP_COMMIT_BYTES
+            )
+        ),
+    )
+
+    storage = server_config.get("storage", constants.DEFAULT_STORAGE)
+    if storage == constants.STORAGE_MMAP:
+        return MmapBlockStore(
+            server_config["disk_name"],
+            server_config.get("msync", constants.DEFAULT_MSYNC),
+            *durability_args
+        )
+    if storage != constants.STORAGE_FILE:
+        raise RuntimeError("Unknown storage backend: %s" % storage)
+    return BlockStore(
+        server_config["disk_name"],
+        *durability_args,
+        write_back_size=int(
+            server_config.get(
+                "write_back_size",
+                constants.DEFAULT_WRITE_BACK_SIZE
+            )
+        ),
+        write_back_interval=float(
+            server_config.get(
+                "write_back_interval",
+                constants.DEFAULT_WRITE_BACK_INTERVAL
+            )
+        ) / 1000
+    )
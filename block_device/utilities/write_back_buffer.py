@@ -0,0 +1,120 @@
+#!/usr/bin/python
+## @package RAID5.block_device.utilities.write_back_buffer
+# Module that defines the WriteBackBuffer class, the dirty blocks of a block
+# store that weren't written to the disk file yet
+#
+
+from common.utilities import constants
+
+## WriteBackBuffer class that keeps the data of written blocks in memory,
+## until they are flushed to the disk file. Blocks are kept whole, a block
+## shorter than BLOCK_SIZE is only the last block of the disk file.
+class WriteBackBuffer(object):
+
+    ## Constructor for WriteBackBuffer
+    ## @param max_size (int) size (in bytes) of the dirty blocks after which
+    ## the buffer needs to be flushed
+    def __init__(self, max_size):
+        ## Size of the dirty blocks after which the buffer needs to be
+        ## flushed
+        self._max_size = max_size
+
+        ## Dirty blocks, block_num : data
+        self._blocks = {}
+
+        ## Offset after the end of the last dirty block
+        self._end = 0
+
+    ## Amount of dirty blocks
+    ## @returns length (int)
+    def __len__(self):
+        return len(self._blocks)
+
+    ## Offset after the end of the last dirty block
+    ## @returns end (int)
+    def get_end(self):
+        return self._end
+
+    ## Returns if the buffer needs to be flushed
+    ## @returns full (bool)
+    def is_full(self):
+        return len(self._blocks) * constants.BLOCK_SIZE >= self._max_size
+
+    ## Returns the data of a dirty block
+    ## @param block_num (int) the block
+    ## @returns data (string) the data, None if the block isn't dirty
+    def get(self, block_num):
+        return self._blocks.get(block_num)
+
+    ## Adds a dirty block, replaces its previous data
+    ## @param block_num (int) the block
+    ## @param data (string) data of the block
+    def add(self, block_num, data):
+        self._blocks[block_num] = data
+        self._end = max(
+            self._end,
+            block_num * constants.BLOCK_SIZE + len(data)
+        )
+
+    ## Returns the dirty blocks in a range
+    ## @param first (int) block_num of the first block
+    ## @param last (int) block_num after the last block
+    ## @returns blocks (list) list of (block_num, data)
+    def get_range(self, first, last):
+        if last - first > len(self._blocks):
+            return sorted(
+                (block_num, data)
+                for block_num, data in self._blocks.items()
+                if first <= block_num < last
+            )
+        return [
+            (block_num, self._blocks[block_num])
+            for block_num in range(first, last)
+            if block_num in self._blocks
+        ]
+
+    ## Removes the dirty blocks in a range, without writing them
+    ## @param first (int) block_num of the first block
+    ## @param last (int) block_num after the last block
+    def discard(self, first, last):
+        for block_num, data in self.get_range(first, last):
+            del self._blocks[block_num]
+        self._end = max([
+            block_num * constants.BLOCK_SIZE + len(data)
+            for block_num, data in self._blocks.items()
+        ] + [0])
+
+    ## Returns all the dirty blocks, coalesced into runs of contiguous
+    ## blocks, so each run can be written at once
+    ## @returns runs (list) list of (offset, data)
+    def get_runs(self):
+        runs = []
+        run_first = None
+        run_blocks = []
+        for block_num in sorted(self._blocks.keys()):
+            # a short block ends its run, the next block isn't right after
+            # its data
+            if (
+                run_first is None or
+                run_first + len(run_blocks) != block_num or
+                len(run_blocks[-1]) != constants.BLOCK_SIZE
+            ):
+                if run_blocks:
+                    runs.append((
+                        run_first * constants.BLOCK_SIZE,
+                        "".join(run_blocks)
+                    ))
+                run_first = block_num
+                run_blocks = []
+            run_blocks.append(self._blocks[block_num])
+        if run_blocks:
+            runs.append((
+                run_first * constants.BLOCK_SIZE,
+                "".join(run_blocks)
+            ))
+        return runs
+
+    ## Removes all the dirty blocks, once they were written
+    def clear(self):
+        self._blocks = {}
+        self._end = 0
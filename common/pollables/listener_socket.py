@@ -68,6 +68,10 @@ class ListenerSocket(pollable.Pollable):
         # set to non blocking
         new_socket.setblocking(0)
 
+        # responses are sent in a few large chunks, don't let the small
+        # first chunk (status and headers) delay the rest
+        new_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
         # add to database
         new_http_socket = service_socket.ServiceSocket(
             new_socket,
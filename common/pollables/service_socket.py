@@ -14,6 +14,7 @@ import traceback
 from common.pollables import callable
 from common.pollables import pollable
 from common.services import base_service
+from common.utilities import buffers
 from common.utilities import constants
 from common.utilities import http_util
 from common.utilities import util
@@ -55,10 +56,10 @@ class ServiceSocket(pollable.Pollable, callable.Callable):
         self._fd = socket.fileno()
 
         ## Data that the socket has recieved
-        self._recvd_data = ""
+        self._recvd_data = buffers.RecvBuffer()
 
         ## Data that the socket wishes to send
-        self._data_to_send = ""
+        self._data_to_send = buffers.SendBuffer()
 
         ## Current state of the ServiceSocket. Initialized to the first state
         self._state = state
@@ -69,6 +70,13 @@ class ServiceSocket(pollable.Pollable, callable.Callable):
         ## Dict of all the pollables in the server
         self._pollables = pollables
 
+        ## If the connection may be kept alive after the current request,
+        ## cleared once the socket has had an error
+        self._keep_alive = True
+
+        ## Time of the last activity on the socket, for keep-alive timeouts
+        self._last_activity = time.time()
+
     ## State getter
     # @returns State (int)
     @property
@@ -157,13 +165,63 @@ class ServiceSocket(pollable.Pollable, callable.Callable):
     def fd(self):
         return self._fd
 
+    ## Keep alive property. The connection is kept alive only if the server
+    ## allows it, the client asked for it and the response has a known length
+    # @returns keep_alive (bool)
+    @property
+    def keep_alive(self):
+        return (
+            self._keep_alive and
+            self._application_context["keep_alive_timeout"] > 0 and
+            self._request_context["headers"].get(
+                "Connection", ""
+            ).lower() == "keep-alive" and
+            "Content-Length" in self._service.response_headers
+        )
+
     ## What ServiceSocket does on error.
     ## Sets state to closing state, and adds an error status
     ## see @ref common.pollables.pollable.Pollable
     def on_error(self, e):
         http_util.add_status(self, 500, e)
+        self._keep_alive = False
         self._state = constants.CLOSING_STATE
 
+    ## What ServiceSocket does when system is on idle.
+    ## Closes a connection that has been waiting for a request for longer
+    ## than the keep-alive timeout.
+    ## see @ref common.pollables.pollable.Pollable
+    def on_idle(self):
+        timeout = self._application_context["keep_alive_timeout"]
+        if (
+            timeout > 0 and
+            self._state == constants.GET_REQUEST_STATE and
+            len(self._recvd_data) == 0 and
+            time.time() - self._last_activity > timeout
+        ):
+            logging.debug("%s :\t Keep-alive timeout, closing" % self)
+            self._state = constants.CLOSING_STATE
+
+    ## Prepares the socket for the next request on a keep-alive connection.
+    ## Lets the finished service terminate, and handles a request that has
+    ## already been recieved (if any).
+    def reset_request(self):
+        self._service.before_terminate(self)
+        self._service = base_service.BaseService()
+        self._request_context = {
+            "headers": {},
+            "args" : [],
+            "method": "uknown",
+            "uri": "uknown",
+        }
+        self._data_to_send.clear()
+        self._state = constants.GET_REQUEST_STATE
+        self._last_activity = time.time()
+        logging.debug("%s :\t Keeping connection alive" % self)
+
+        if len(self._recvd_data):
+            self.handle_recvd_data()
+
     ## What ServiceSocket does on close.
     ## Calls the before_terminate service function then closes the socket
     ## required by @ref common.pollables.pollable.Pollable
@@ -178,7 +236,7 @@ class ServiceSocket(pollable.Pollable, callable.Callable):
         # check if ready to terminate
         return (
             self._state == constants.CLOSING_STATE
-            and self._data_to_send == ""
+            and len(self._data_to_send) == 0
         )
 
     ## States for the request state machine. Not implemented with the
@@ -221,6 +279,23 @@ class ServiceSocket(pollable.Pollable, callable.Callable):
     def on_read(self):
         try:
             http_util.get_buf(self)
+        except util.Disconnect as e:
+            # client closed the connection, nothing left to respond to
+            logging.debug("%s :\t Client disconnected" % self)
+            self._data_to_send.clear()
+            self._state = constants.CLOSING_STATE
+            return
+        except Exception as e:
+            traceback.print_exc()
+            logging.error("%s :\t Closing socket, got : %s " % (self, e))
+            self.on_error(e)
+            return
+        self._last_activity = time.time()
+        self.handle_recvd_data()
+
+    ## Lets the state machine and service handle the data recieved so far
+    def handle_recvd_data(self):
+        try:
             while (self._state < constants.SEND_STATUS_STATE and (
                 ServiceSocket.STATES[self._state]["function"](self)
             )):
@@ -244,7 +319,12 @@ class ServiceSocket(pollable.Pollable, callable.Callable):
     ## The on_finish method, lets the socket wake up after being in sleep mode
     ## see @ref common.pollables.callable.Callable
     def on_finish(self):
-        self._service.on_finish(self)
+        try:
+            self._service.on_finish(self)
+        except Exception as e:
+            traceback.print_exc()
+            logging.error("%s :\t Closing socket, got : %s " % (self, e))
+            self.on_error(e)
 
     ## What ServiceSocket does on write.
     ## First let state machine and service update any content they may have,
@@ -268,11 +348,25 @@ class ServiceSocket(pollable.Pollable, callable.Callable):
                 )
             if self._state != constants.SLEEPING_STATE:
                 http_util.send_buf(self)
+        except socket.error as e:
+            # client is gone, no point in sending an error status
+            logging.error("%s :\t Closing socket, got : %s " % (self, e))
+            self._data_to_send.clear()
+            self._keep_alive = False
+            self._state = constants.CLOSING_STATE
         except Exception as e:
             traceback.print_exc()
             logging.error("%s :\t Closing socket, got : %s " % (self, e))
             self.on_error(e)
 
+        # response has been sent, wait for the next request if kept alive
+        if (
+            self._state == constants.CLOSING_STATE and
+            len(self._data_to_send) == 0 and
+            self.keep_alive
+        ):
+            self.reset_request()
+
     ## Specifies what events the ServiceSocket listens to.
     ## Decide based on state and data in buffer.
     ## see @ref common.pollables.pollable.Pollable
@@ -12,7 +12,8 @@ class BaseService(object):
     ## Constructor for BaseService
     ## @param (optional) wanted_headers (list) list of all the headers that
     ## the Service is interested in. Will always be interested in the
-    ## Content-Length header to check validity of content
+    ## Content-Length header to check validity of content, and in the
+    ## Connection header to know if the connection should be kept alive
     ## @param (optional) wanted_args (list) list of all the wanted args that
     ## the service is intersted in
     ## @param (optional) args (dict) dict of the actual args that have been
@@ -25,10 +26,11 @@ class BaseService(object):
         wanted_args=[],
         args={}
     ):
-        ## The wanted headers, with the unavoiable Content-length
+        ## The wanted headers, with the unavoiable Content-length and
+        ## Connection headers
         # if Content-length is already in the wanted headers, remove it
         self._wanted_headers = list(set(
-            wanted_headers + ["Content-Length"]
+            wanted_headers + ["Content-Length", "Connection"]
         ))
 
         ## The wanted args
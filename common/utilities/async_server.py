@@ -20,6 +20,8 @@ from common.pollables import listener_socket
 from common.pollables import service_socket
 from common.utilities import constants
 from common.utilities import poller
+from common.utilities import route_util
+from common.utilities import timers
 from common.utilities import util
 from frontend.pollables import identifier_socket
 
@@ -34,6 +36,15 @@ class AsyncServer(object):
         ## Application_context
         self._application_context = application_context
 
+        ## Timers of the server, pollables and services can add timers too
+        self._timers = timers.Timers()
+        self._application_context["timers"] = self._timers
+
+        ## Services of the server, built once
+        self._application_context["routes"] = route_util.RouteTable(
+            self._application_context["server_type"]
+        )
+
         ## Pollables (start with none).
         ## Key: file descriptor
         ## Value: Pollable object
@@ -42,6 +53,14 @@ class AsyncServer(object):
         ## Callables (start with none)
         self._callables = []
 
+        ## Persistent poller, used if the poll type keeps its registrations
+        self._poller = None
+
+        ## Registrations of the persistent poller.
+        ## Key: file descriptor
+        ## Value: (Pollable object, registered events)
+        self._registered = {}
+
     ## Add a ListenerSocket to the pollables dict
     def add_listener(self):
         sock = socket.socket(
@@ -163,8 +182,9 @@ class AsyncServer(object):
                 logging.error("%s:\tSocket disconnected, closing...", entry)
                 entry.on_close()
 
-    ## Handles the file descriptors when on timeout. Calls the on_idle
-    ## function they have implemented
+    ## Handles the file descriptors periodically, every poll timeout, no
+    ## matter how busy the server is. Calls the on_idle function they have
+    ## implemented
     def timeout_event(self):
         # if poll went off on timeout, call for an "update" on system status
         for fd, entry in self._pollables.items():
@@ -186,22 +206,31 @@ class AsyncServer(object):
         logging.debug("STARTED RUNNING..\n")
         self.on_start()
         logging.debug("READY FOR REQUESTS")
+        # let the pollables do their housekeeping periodically
+        self._timers.call_every(
+            float(self._application_context["poll_timeout"]) / 1000,
+            self.timeout_event
+        )
         # start running
         while len(self._pollables):
             try:
                 self.close_needed()
                 poll_obj = self.create_poller()
 
-                # handle events from poller
+                # handle events from poller, wait no longer than the next
+                # timer
                 events = poll_obj.poll(
-                    self._application_context["poll_timeout"])
+                    self._timers.get_timeout(
+                        self._application_context["poll_timeout"]
+                    )
+                )
 
                 if len(events):
                     # got some event, check it and let pollable respond
                     self.handle_events(events)
-                else:
-                    # went out on timeout. Call on_idle for all pollables
-                    self.timeout_event()
+
+                # call the timers that should go off by now
+                self._timers.run_expired()
 
             except Exception as e:
                 logging.critical(traceback.print_exc())
@@ -209,11 +238,18 @@ class AsyncServer(object):
         logging.debug("SERVER TERMINATING")
 
     ## Creates a new poller based on the poll type specified in the
-    ## application_context
+    ## application_context. If the poll type keeps its registrations, the
+    ## same poller is updated instead.
     ## @returns poll_obj (poller object) returns a poller object
     def create_poller(self):
-        poll_obj = self._application_context["poll_type"]()
+        poll_type = self._application_context["poll_type"]
+        if poll_type.PERSISTENT:
+            if self._poller is None:
+                self._poller = poll_type()
+            self.update_registrations()
+            return self._poller
 
+        poll_obj = poll_type()
         for fd, entry in self._pollables.items():
             poll_obj.register(
                 fd,
@@ -221,6 +257,26 @@ class AsyncServer(object):
             )
         return poll_obj
 
+    ## Updates the registrations of the persistent poller. Pollables that
+    ## are gone are unregistered, and only pollables whose events have
+    ## changed are modified.
+    def update_registrations(self):
+        for fd, (entry, event) in self._registered.items():
+            # pollable is gone, or the fd now belongs to a new pollable
+            if self._pollables.get(fd) is not entry:
+                self._poller.unregister(fd)
+                del self._registered[fd]
+
+        for fd, entry in self._pollables.items():
+            event = entry.get_events()
+            if fd not in self._registered:
+                self._poller.register(fd, event)
+            elif self._registered[fd][1] != event:
+                self._poller.modify(fd, event)
+            else:
+                continue
+            self._registered[fd] = (entry, event)
+
     ## Pollables property
     ## @returns pollables (dict)
     @property
@@ -0,0 +1,197 @@
+#!/usr/bin/python
+## @package RAID5.common.utilities.buffers
+# Module that defines the SendBuffer and RecvBuffer classes, the socket
+# buffers of the pollables. Data is not copied again on every send and recv.
+#
+
+import collections
+import errno
+import socket
+
+## Size under which appended data is merged into the previous chunk, so small
+## writes (such as headers) don't each become a separate send
+SMALL_CHUNK = 1024
+
+## Initial size of a RecvBuffer
+INITIAL_RECV_SIZE = 4096
+
+## Types of data that are sent without being copied. On python-2 views of a
+## mmap are buffer objects.
+try:
+    BUFFER_TYPES = (bytes, bytearray, memoryview, buffer)
+except NameError:
+    BUFFER_TYPES = (bytes, bytearray, memoryview)
+
+## Buffer of data waiting to be sent. Data is kept as a queue of chunks, a
+## partial send only creates a memoryview of the rest of the first chunk.
+class SendBuffer(object):
+
+    ## Constructor for SendBuffer
+    def __init__(self):
+        ## Chunks waiting to be sent, strings, bytearrays or memoryviews
+        self._chunks = collections.deque()
+
+        ## Total length of the chunks
+        self._length = 0
+
+        ## Last bytearray we allocated for small data, the only chunk small
+        ## data is merged into. Data of the caller is never changed.
+        self._tail = None
+
+    ## Length of the data waiting to be sent
+    ## @returns length (int)
+    def __len__(self):
+        return self._length
+
+    ## Adds data to the end of the buffer. The data isn't copied, unless it
+    ## is small and merged into the previous chunk (if we allocated it).
+    ## @param data (string) data to add
+    def append(self, data):
+        if not isinstance(data, BUFFER_TYPES):
+            data = data.encode("utf-8")
+        if len(data) == 0:
+            return
+        self._length += len(data)
+
+        if len(data) < SMALL_CHUNK:
+            if len(self._chunks) and self._chunks[-1] is self._tail:
+                self._tail.extend(data)
+            else:
+                self._tail = bytearray(data)
+                self._chunks.append(self._tail)
+        else:
+            self._chunks.append(data)
+
+    ## Sends as much of the buffer as the socket can take
+    ## @param sock (socket) socket to send on
+    ## @returns sent (int) amount of bytes sent
+    def send(self, sock):
+        sent = 0
+        try:
+            while len(self._chunks):
+                chunk = self._chunks[0]
+                n = sock.send(chunk)
+                sent += n
+                self._length -= n
+                if n == len(chunk):
+                    self._chunks.popleft()
+                    continue
+
+                # socket is full, keep the rest of the chunk for later
+                self._chunks[0] = view(chunk, n)
+                break
+        except socket.error as e:
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+        return sent
+
+    ## Removes all the data from the buffer
+    def clear(self):
+        self._chunks.clear()
+        self._length = 0
+        self._tail = None
+
+
+## Returns a view of the data from an offset, without copying it
+## @param data (string) the data
+## @param offset (int) the offset
+## @returns view (memoryview or buffer) view of the rest of the data
+def view(data, offset):
+    try:
+        return memoryview(data)[offset:]
+    except TypeError:
+        # python-2 buffer objects only have the old buffer interface
+        return buffer(data, offset)
+
+
+## Buffer of recieved data. Data is recieved straight into a preallocated
+## bytearray, and is parsed by offsets from the start of the unread data.
+class RecvBuffer(object):
+
+    ## Constructor for RecvBuffer
+    def __init__(self):
+        ## The buffer
+        self._buf = bytearray(INITIAL_RECV_SIZE)
+
+        ## Offset of the first unread byte
+        self._start = 0
+
+        ## Offset after the last recieved byte
+        self._end = 0
+
+    ## Length of the unread data
+    ## @returns length (int)
+    def __len__(self):
+        return self._end - self._start
+
+    ## Recieves data from a socket into the buffer
+    ## @param sock (socket) socket to recieve from
+    ## @param size (int) max amount of bytes to recieve
+    ## @returns recieved (int) amount of bytes recieved, 0 if the socket was
+    ## closed
+    def recv(self, sock, size):
+        if len(self._buf) - self._end < size:
+            self.make_room(size)
+        view = memoryview(self._buf)
+        try:
+            n = sock.recv_into(view[self._end:self._end + size], size)
+        finally:
+            # release the view so the buffer can be resized
+            del view
+        self._end += n
+        return n
+
+    ## Makes room for more data at the end of the buffer. Moves the unread
+    ## data to the start of the buffer, and grows the buffer if needed.
+    ## @param size (int) amount of bytes we need room for
+    def make_room(self, size):
+        length = len(self)
+        if length + size > len(self._buf):
+            buf = bytearray(max(length + size, 2 * len(self._buf)))
+            buf[:length] = self._buf[self._start:self._end]
+            self._buf = buf
+        else:
+            self._buf[:length] = self._buf[self._start:self._end]
+        self._start = 0
+        self._end = length
+
+    ## Finds a string in the unread data
+    ## @param sub (string) string to find
+    ## @param start (optional) (int) offset in the unread data to search from
+    ## @returns index (int) offset of sub in the unread data, -1 if not found
+    def find(self, sub, start=0):
+        index = self._buf.find(sub, self._start + start, self._end)
+        if index == -1:
+            return -1
+        return index - self._start
+
+    ## Returns unread data, without consuming it
+    ## @param start (int) offset in the unread data
+    ## @param end (int) offset after the last byte to return
+    ## @returns data (string)
+    def peek(self, start, end):
+        return memoryview(self._buf)[
+            self._start + start:self._start + min(end, len(self))
+        ].tobytes()
+
+    ## Consumes unread data
+    ## @param size (optional) (int) amount of bytes, all of them if None
+    ## @returns data (string) the consumed data
+    def get(self, size=None):
+        if size is None or size > len(self):
+            size = len(self)
+        data = self.peek(0, size)
+        self.skip(size)
+        return data
+
+    ## Skips unread data
+    ## @param size (int) amount of bytes to skip
+    def skip(self, size):
+        self._start = min(self._start + size, self._end)
+        if self._start == self._end:
+            # nothing left, start over from the beginning of the buffer
+            self._start = self._end = 0
+
+    ## Removes all the unread data
+    def clear(self):
+        self._start = self._end = 0
@@ -28,6 +28,30 @@ def create_bds_config(filename, index):
             constants.DISK_NAME,
             index
         ))
+        parser.set("Server", "capacity", constants.DEFAULT_CAPACITY)
+        parser.set("Server", "storage", constants.DEFAULT_STORAGE)
+        parser.set("Server", "msync", constants.DEFAULT_MSYNC)
+        parser.set("Server", "durability", constants.DEFAULT_DURABILITY)
+        parser.set(
+            "Server",
+            "group_commit_interval",
+            constants.DEFAULT_GROUP_COMMIT_INTERVAL
+        )
+        parser.set(
+            "Server",
+            "group_commit_bytes",
+            constants.DEFAULT_GROUP_COMMIT_BYTES
+        )
+        parser.set(
+            "Server",
+            "write_back_size",
+            constants.DEFAULT_WRITE_BACK_SIZE
+        )
+        parser.set(
+            "Server",
+            "write_back_interval",
+            constants.DEFAULT_WRITE_BACK_INTERVAL
+        )
         parser.write(config_file)
 
 ## function creates a frontend configuration file in filename specified
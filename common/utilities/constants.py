@@ -14,6 +14,16 @@ POLLIN, POLLOUT, POLLERR, POLLHUP = (
     select.POLLIN, select.POLLOUT, select.POLLERR, select.POLLHUP,
 )
 
+## Seek whences for sparse files, os only defines them from python 3.3 (the
+## values are the same on Linux, Solaris and FreeBSD)
+SEEK_DATA = getattr(os, "SEEK_DATA", 3)
+SEEK_HOLE = getattr(os, "SEEK_HOLE", 4)
+
+## Modes of the fallocate system call (Linux), for punching holes in a file
+## without changing its size
+FALLOC_FL_KEEP_SIZE = 0x01
+FALLOC_FL_PUNCH_HOLE = 0x02
+
 ## Polling event names (for debugging purposes mostly)
 POLL_EVENTS = {
     POLLIN : "POLLIN",
@@ -35,6 +45,40 @@ DEFAULT_HTTP_ADDRESS = "0.0.0.0"
 # constant thoughout entire system
 BLOCK_SIZE = 4096
 
+## Max size of a single read from a disk file when sending a range of blocks
+MAX_READ_CHUNK = 64 * BLOCK_SIZE
+
+## Max amount of blocks the Frontend requests from a Block Device at once
+MAX_EXTENT_BLOCKS = 64
+
+## Max amount of stripes the Frontend discards at once
+MAX_DISCARD_BLOCKS = 2**16
+
+## Default amount of extent reads a single disk read keeps in flight
+DEFAULT_READ_WINDOW = 4
+
+## Default amount of blocks a single disk read keeps in memory, both in flight
+## and waiting to be sent to the client
+DEFAULT_READ_BUFFER_BLOCKS = DEFAULT_READ_WINDOW * MAX_EXTENT_BLOCKS
+
+## Default amount of extents a disk rebuild keeps in flight
+DEFAULT_REBUILD_WINDOW = 4
+
+## Default bandwidth (in MB/s) a disk rebuild can use on each disk, 0 for no
+## limit
+DEFAULT_REBUILD_BANDWIDTH = 64
+
+## Default amount of requests per second a disk rebuild can send to each disk,
+## 0 for no limit
+DEFAULT_REBUILD_IOPS = 0
+
+## Default latency (in miliseconds) of client requests to the block devices
+## above which disk rebuilds back off, 0 to never back off
+DEFAULT_FOREGROUND_LATENCY = 50
+
+## Default memory budget (in bytes) of the frontend block cache
+DEFAULT_BLOCK_CACHE_SIZE = 16 * 1024 * 1024
+
 ## My Seperator
 MY_SEPERATOR = '$'
 
@@ -54,8 +98,9 @@ MAX_NUMBER_OF_HEADERS = 100
 ## Max size of a disk info file
 MAX_INFO_SIZE = 1000
 
-## Maximum size of a cache. Once exceeded this amount, only block numbers are
-## stored in cache (no data)
+## Maximum size of the data kept in the cache of an offline disk. Once
+## exceeded, the rest of the dirty blocks are only marked in the bitmap (no
+## data)
 MAX_CACHE_SIZE = 2**20
 
 ## Standard input and outputs
@@ -66,6 +111,18 @@ STANDARD_ERROR = 2
 ## Default base directory for requested files
 DEFAULT_BASE_DIRECTORY = "frontend/files"
 
+## Default directory for the spill logs of the caches of offline disks
+DEFAULT_SPILL_DIRECTORY = "frontend/spill"
+
+## Default directory for the rebuild checkpoints of offline disks
+DEFAULT_CHECKPOINT_DIRECTORY = "frontend/checkpoints"
+
+## Time (in seconds) between checkpoints of a disk rebuild
+REBUILD_CHECKPOINT_INTERVAL = 1
+
+## Time (in seconds) between saves of the progress of a parity scrub
+SCRUB_CHECKPOINT_INTERVAL = 5
+
 ## Default location for block devices configuraiton files
 DEFAULT_BLOCK_CONFIG_DIR = "block_device/disks/"
 
@@ -78,6 +135,69 @@ DISK_NAME = "block_device/disks/disk"
 ## Name of block_device disk info. (This will be concatenated with the disk num)
 DISK_INFO_NAME = "block_device/disks/disk_info"
 
+## Storage backends of the block device disk file, set by the storage field
+## of the [Server] section in its config
+STORAGE_FILE = "file"
+STORAGE_MMAP = "mmap"
+STORAGE_BACKENDS = (STORAGE_FILE, STORAGE_MMAP)
+
+## Default storage backend of the block device disk file
+DEFAULT_STORAGE = STORAGE_FILE
+
+## msync policies of the mmap storage backend, set by the msync field of the
+## [Server] section. Any other value is the interval (in milliseconds)
+## between msyncs of the written pages.
+MSYNC_NEVER = "never"
+MSYNC_ALWAYS = "always"
+
+## Default msync policy of the mmap storage backend
+DEFAULT_MSYNC = "1000"
+
+## Size (in bytes) by which the mapping of the mmap storage backend grows when
+## a write is past its end
+MMAP_GROW_SIZE = 2**24
+
+## Suffix of the file that records the size of the data of a disk file while
+## the mmap storage backend grew the disk file past it (the disk file name is
+## concatenated with it)
+MMAP_SIZE_SUFFIX = ".size"
+
+## Durability modes of the block device disk file, set by the durability
+## field of the [Server] section:
+## none - writes are synced by the kernel
+## group - writes are acknowledged once they are synced by a group commit
+## dsync - every write is synced
+DURABILITY_NONE = "none"
+DURABILITY_GROUP = "group"
+DURABILITY_DSYNC = "dsync"
+DURABILITY_MODES = (DURABILITY_NONE, DURABILITY_GROUP, DURABILITY_DSYNC)
+
+## Default durability mode of the block device disk file
+DEFAULT_DURABILITY = DURABILITY_NONE
+
+## Default max time (in milliseconds) a write waits for a group commit, set
+## by the group_commit_interval field of the [Server] section
+DEFAULT_GROUP_COMMIT_INTERVAL = 5
+
+## Default amount of written bytes after which a group commit starts right
+## away, set by the group_commit_bytes field of the [Server] section
+DEFAULT_GROUP_COMMIT_BYTES = 2**20
+
+## Default size (in bytes) of the write-back buffer of the block device disk
+## file, set by the write_back_size field of the [Server] section. 0 for no
+## write-back buffer, buffered writes are lost if the block device dies
+## before they are flushed.
+DEFAULT_WRITE_BACK_SIZE = 0
+
+## Default time (in milliseconds) between flushes of the write-back buffer,
+## set by the write_back_interval field of the [Server] section
+DEFAULT_WRITE_BACK_INTERVAL = 100
+
+## Default capacity (in bytes) of the block device disk file, set by the
+## capacity field of the [Server] section. The disk file is allocated up to
+## its capacity when the block device starts, 0 leaves it sparse.
+DEFAULT_CAPACITY = 0
+
 ## Temporary file name
 TMP_FILE_NAME = "tmp_file"
 
@@ -90,6 +210,22 @@ DISCONNECT_TIME = 5
 ## Disk wiill be totally removed from list
 TERMINATE_TIME = 20
 
+## Default time (in seconds) a block device keeps an idle keep-alive
+## connection open before closing it
+DEFAULT_KEEP_ALIVE_TIMEOUT = 30
+
+## Default time (in seconds) the frontend keeps an idle pooled connection to a
+## block device. Must be shorter than the block device keep-alive timeout so
+## that the frontend is always the one closing idle connections
+DEFAULT_POOL_IDLE_TIMEOUT = 10
+
+## Default maximum number of idle connections pooled per block device
+DEFAULT_POOL_MAX_IDLE = 8
+
+## Default time (in seconds) a new pooled connection may take to connect to a
+## block device before the block device is considered refused
+DEFAULT_POOL_CONNECT_TIMEOUT = 5
+
 ## HTML headers
 HTML_DEFAULT_HEADER = "RAID5 - Message"
 HTML_ERROR_HEADER = "RAID5 - Disk Error"
@@ -157,11 +293,16 @@ DEFAULT_FRONTEND_POLL_TIMEOUT = 200
 MODULE_DICT = {
     BLOCK_DEVICE_SERVER: [
         "block_device.services.get_block_service",
+        "block_device.services.get_blocks_service",
+        "block_device.services.get_allocation_service",
         "block_device.services.set_block_service",
+        "block_device.services.set_blocks_service",
         "block_device.services.login_service",
         "block_device.services.get_disk_info_service",
         "block_device.services.set_disk_info_service",
         "block_device.services.update_level_service",
+        "block_device.services.block_store_service",
+        "block_device.services.trim_service",
         "common.services.get_file_service",
         "common.services.form_service",
     ],
@@ -172,6 +313,10 @@ MODULE_DICT = {
         "frontend.services.write_disk_service",
         "frontend.services.init_service",
         "frontend.services.display_disks_service",
+        "frontend.services.block_cache_service",
+        "frontend.services.scrub_service",
+        "frontend.services.scrub_progress_service",
+        "frontend.services.discard_service",
         "common.services.get_file_service",
         "common.services.form_service",
     ],
@@ -199,6 +344,20 @@ DISK_STATES = {
     STARTUP: "STARTUP STATE"
 }
 
+## States the parity scrub of a volume can be in
+(
+    SCRUB_RUNNING,
+    SCRUB_PAUSED,
+    SCRUB_DONE,
+) = range(3)
+
+## State of scrubs as informative strings
+SCRUB_STATES = {
+    SCRUB_RUNNING: "running",
+    SCRUB_PAUSED: "paused",
+    SCRUB_DONE: "done",
+}
+
 ## HTTP States
 (
     GET_STATUS_STATE,
@@ -213,4 +372,5 @@ DISK_STATES = {
     LISTEN_STATE,
     CLOSING_STATE,
     OFFLINE_STATE,
-) = range(12)
+    IDLE_STATE,
+) = range(13)
@@ -43,10 +43,18 @@ def html_progress_bar(disk, volume_UUID):
     rebuild_prcntg = disk["cache"].get_rebuild_percentage()
     if rebuild_prcntg < 0:
         return "Rebuilding first from scratch..."
+    rebuild_limit = ""
+    if disk.get("rebuild_limit") is not None:
+        rebuild_limit = " (limit %.2f MB/s)" % (
+            float(disk["rebuild_limit"]) / 2**20
+        )
     return (
         "Rebuilding progress:<br><progress value='%s' max='100'></progress>"
+        "<br>%.2f MB/s%s"
         % (
-            rebuild_prcntg
+            rebuild_prcntg,
+            disk.get("rebuild_rate", 0),
+            rebuild_limit,
         )
     )
 
@@ -6,7 +6,6 @@
 import argparse
 import contextlib
 import errno
-import importlib
 import logging
 import os
 import select
@@ -14,7 +13,6 @@ import socket
 import time
 import traceback
 
-from common.services import base_service
 from common.utilities import constants
 from common.utilities import html_util
 from common.utilities import util
@@ -35,6 +33,12 @@ STATUS_CODES = {
     500: "Internal Error",
 }
 
+## Connection header values, based on if the connection is kept alive
+CONNECTION_TYPES = {
+    True: "keep-alive",
+    False: "close",
+}
+
 ## State function that recvs and updates the status of a http response.
 ## @param entry (@ref common.pollables.pollable.Pollable)
 ## The current Pollable Socket we're dealing with
@@ -44,12 +48,9 @@ def get_status_state(entry):
     if index == -1:
         return False
 
-    status, rest = (
-        entry.recvd_data[:index].decode('utf-8'),
-        entry.recvd_data[index + len(constants.CRLF_BIN):]
-    )
+    status = entry.recvd_data.get(index).decode('utf-8')
+    entry.recvd_data.skip(len(constants.CRLF_BIN))
     entry.client_update["status"] = status.split(" ")[1]
-    entry.recvd_data = rest
     return True
 
 ## State function that recvs and handles the first line of a http status.
@@ -61,12 +62,10 @@ def get_request_state(entry):
     if index == -1:
         return False
 
-    req, rest = (
-        entry.recvd_data[:index].decode('utf-8'),
-        entry.recvd_data[index + len(constants.CRLF_BIN):]
-    )
+    req = entry.recvd_data.get(index).decode('utf-8')
+    # the rest is saved for next time
+    entry.recvd_data.skip(len(constants.CRLF_BIN))
     handle_request(entry, req)
-    entry.recvd_data = rest  # save the rest for next time
     return True
 
 ## State function that recvs and handles the headers of a http request.
@@ -75,27 +74,27 @@ def get_request_state(entry):
 ## The current pollable Socket we're dealing with
 ## @returns next_state (bool) if finished recving headers (got \\r\\n\\r\\n)
 def get_headers_state(entry):
-    lines = entry.recvd_data.split(constants.CRLF_BIN)
-    if "" not in lines:
-        return False
+    # find the empty line that ends the headers
+    lines = []
+    start = 0
+    while True:
+        index = entry.recvd_data.find(constants.CRLF_BIN, start)
+        if index == -1:
+            return False
+        if index == start:
+            break
+        lines.append((start, index))
+        if len(lines) > constants.MAX_NUMBER_OF_HEADERS:
+            raise RuntimeError('Too many headers')
+        start = index + len(constants.CRLF_BIN)
 
     # got all the headers, process them
     entry.request_context["headers"] = {}
-    for index in range(len(lines)):
-        line = lines[index]
-        if (
-            len(entry.request_context["headers"].items()) >
-            constants.MAX_NUMBER_OF_HEADERS
-        ):
-            raise RuntimeError('Too many headers')
-
-        if line == "":
-            entry.recvd_data = constants.CRLF_BIN.join(lines[index + 1:])
-            break
-
-        k, v = util.parse_header(line)
+    for line_start, line_end in lines:
+        k, v = util.parse_header(entry.recvd_data.peek(line_start, line_end))
         if k in entry.service.wanted_headers:
             entry.request_context["headers"][k] = v
+    entry.recvd_data.skip(start + len(constants.CRLF_BIN))
 
     entry.service.before_content(entry)
     return True
@@ -108,17 +107,18 @@ def get_content_state(entry):
     if "Content-Length" not in entry.request_context["headers"].keys():
         return True
 
+    # only take the content of this request, anything after it belongs to
+    # the next request on a keep-alive connection
+    content_length = int(entry.request_context["headers"]["Content-Length"])
+    content = entry.recvd_data.get(content_length)
+
     # update content_length
     entry.request_context["headers"]["Content-Length"] = (
-        int(entry.request_context["headers"]["Content-Length"]) -
-        len(entry.recvd_data)
+        content_length - len(content)
     )
-    entry.service.handle_content(entry, entry.recvd_data)
-    entry.recvd_data = ""
+    entry.service.handle_content(entry, content)
 
-    if entry.request_context["headers"]["Content-Length"] < 0:
-        raise RuntimeError("Too much content")
-    elif entry.request_context["headers"]["Content-Length"] > 0:
+    if entry.request_context["headers"]["Content-Length"] > 0:
         return False
     return True
 
@@ -128,7 +128,7 @@ def get_content_state(entry):
 ## @returns next_state (bool) if finished updating the data_to_send.
 def send_status_state(entry):
     entry.service.before_response_status(entry)
-    entry.data_to_send += (
+    entry.data_to_send.append(
         (
             '%s %s %s\r\n'
         ) % (
@@ -145,8 +145,9 @@ def send_status_state(entry):
 ## @returns next_state (bool) if finished updating the data_to_send.
 def send_headers_state(entry):
     entry.service.before_response_headers(entry)
+    headers = ""
     for header, content in entry.service.response_headers.items():
-        entry.data_to_send += (
+        headers += (
             (
                 "%s : %s\r\n"
             ) % (
@@ -154,7 +155,10 @@ def send_headers_state(entry):
                 content,
             )
         )
-    entry.data_to_send += "\r\n"
+    headers += "Connection : %s\r\n" % (
+        CONNECTION_TYPES[entry.keep_alive]
+    )
+    entry.data_to_send.append(headers + "\r\n")
     return True
 
 ## State function that sends the content of a http response.
@@ -163,7 +167,7 @@ def send_headers_state(entry):
 ## @returns next_state (bool) if finished updating the data_to_send.
 def send_content_state(entry):
     finished_content = entry.service.before_response_content(entry)
-    entry.data_to_send += entry.service.response_content
+    entry.data_to_send.append(entry.service.response_content)
     entry.service.response_content = ""
     return finished_content
 
@@ -172,23 +176,26 @@ def send_content_state(entry):
 ## The current pollable Socket we're dealing with
 ## @returns next_state (bool) if finished updating the data_to_send.
 def send_request_state(entry):
-    entry.data_to_send += "%s %s" % (
+    request = "%s %s" % (
         entry.request_context["method"],
         entry.request_context["service"]
     )
     if len(entry.request_context["args"]) != 0:
-        entry.data_to_send += "?"
-
-        for arg_name, arg_content in entry.request_context["args"].items():
-            entry.data_to_send += "%s=%s&" % (
-                arg_name,
-                arg_content
-            )
-        entry.data_to_send = entry.data_to_send[:-1]
+        request += "?" + "&".join(
+            [
+                "%s=%s" % (arg_name, arg_content)
+                for arg_name, arg_content in (
+                    entry.request_context["args"].items()
+                )
+            ]
+        )
 
-    entry.data_to_send += " %s%s" % (
-        constants.HTTP_SIGNATURE,
-        constants.CRLF_BIN
+    entry.data_to_send.append(
+        "%s %s%s" % (
+            request,
+            constants.HTTP_SIGNATURE,
+            constants.CRLF_BIN
+        )
     )
     return True
 
@@ -198,14 +205,8 @@ def send_request_state(entry):
 ## function that sends whatever the socket has in data_to_send
 ## @param entry (@ref common.pollables.pollable.Pollable)
 def send_buf(entry):
-    try:
-        while entry.data_to_send != "":
-            entry.data_to_send = entry.data_to_send[
-                entry.socket.send(entry.data_to_send):
-            ]
-    except socket.error as e:
-        if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
-            raise
+    entry.data_to_send.send(entry.socket)
+    if len(entry.data_to_send):
         logging.debug("%s :\t Haven't finished reading yet" % entry)
 
 ## function that recieves whatever the socket can recieve and updates
@@ -213,12 +214,13 @@ def send_buf(entry):
 ## @param entry (@ref common.pollables.pollable.Pollable)
 def get_buf(entry):
     try:
-        t = entry.socket.recv(entry.application_context["max_buffer"])
-        if not t:
+        if not entry.recvd_data.recv(
+            entry.socket,
+            entry.application_context["max_buffer"]
+        ):
             raise util.Disconnect(
                 'Disconnected while recieving content'
             )
-        entry.recvd_data += t
 
     except socket.error as e:
         traceback.print_exc()
@@ -232,7 +234,7 @@ def get_buf(entry):
 ## @param code (int) the (error) code which we got from service
 ## @param extra (string) extra info reagrading the error
 def add_status(entry, code, extra):
-    entry.data_to_send += (
+    entry.data_to_send.append(
         (
             '%s %s %s\r\n'
             'Content-Type: text/html\r\n'
@@ -285,18 +287,11 @@ def handle_request(entry, request):
     parse = urlparse.urlparse(entry.request_context["uri"])
     entry.request_context["args"] = urlparse.parse_qs(parse.query)
 
-    # import only the services permitted to this server
-    for service in constants.MODULE_DICT[
-        entry.application_context["server_type"]
-    ]:
-        importlib.import_module(service)
-
-    services = {}
-    for service_class in base_service.BaseService.__subclasses__():
-        services[service_class.get_name()] = service_class
-
-    if parse.path in services.keys():
-        entry.service = services[parse.path](
+    # choose from the services permitted to this server
+    routes = entry.application_context["routes"]
+    service_class = routes.lookup(parse.path, method)
+    if service_class is not None:
+        entry.service = service_class(
             entry,
             entry.pollables,
             entry.request_context["args"]
@@ -315,4 +310,4 @@ def handle_request(entry, request):
         )
         # if file_name[:len(base)+1] != base + '\\':
         #    raise RuntimeError("Malicious URI %s" % self._request[1])
-        entry.service = services["/get_file"](entry, file_name)
+        entry.service = routes.lookup("/get_file")(entry, file_name)
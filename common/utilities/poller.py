@@ -1,8 +1,9 @@
 #!/usr/bin/python
 ## @package RAID5.common.utilities.poller
-# Module that defines two polling objects: Poller and Select
+# Module that defines three polling objects: Poller, Select and Epoll
 #
 
+import errno
 import select
 import time
 
@@ -15,6 +16,9 @@ from common.utilities import constants
 ## get.
 class Poller():
 
+    ## Poller is created again on every poll
+    PERSISTENT = False
+
     ## Constructor for Poller. No params, creates a poll object on it's own
     def __init__(self):
         ## Polling object
@@ -40,6 +44,9 @@ class Poller():
 ## get.
 class Select():
 
+    ## Select is created again on every poll
+    PERSISTENT = False
+
     ## Constructor for Poller, No params.
     def __init__(self):
         ## events that are associated with each fd
@@ -91,3 +98,59 @@ class Select():
             event_lst.append((ready_fd, event))
         # returns a list of tuples (fd, events)
         return event_lst
+
+## Epoll class for Asynchronous IO.
+## Poller that keeps its registrations between polls, so only the changes in
+## the events of the file descriptors need to be updated. Epoll is for Linux.
+class Epoll():
+
+    ## Epoll is kept between polls
+    PERSISTENT = True
+
+    ## Constructor for Epoll. No params, creates an epoll object on it's own
+    def __init__(self):
+        ## Polling object
+        self._poller = select.epoll()
+
+    ## Register an event to the poller
+    ## @param file descriptor (int) fd that wants to listen to the event
+    ## @param event (event_mask) event(s) that need to be registered
+    def register(self, fd, event):
+        try:
+            self._poller.register(fd, event)
+        except IOError as e:
+            if e.errno != errno.EEXIST:
+                raise
+            self._poller.modify(fd, event)
+
+    ## Modify the events of a registered file descriptor
+    ## @param file descriptor (int) fd that is registered
+    ## @param event (event_mask) event(s) that need to be registered
+    def modify(self, fd, event):
+        try:
+            self._poller.modify(fd, event)
+        except IOError as e:
+            # fd was closed and opened again, so epoll forgot about it
+            if e.errno != errno.ENOENT:
+                raise
+            self._poller.register(fd, event)
+
+    ## Unregister a file descriptor. The file descriptor may already be
+    ## closed, in which case epoll has already forgotten about it.
+    ## @param file descriptor (int) fd to unregister
+    def unregister(self, fd):
+        try:
+            self._poller.unregister(fd)
+        except (IOError, ValueError) as e:
+            if getattr(e, "errno", errno.EBADF) not in (
+                errno.EBADF,
+                errno.ENOENT
+            ):
+                raise
+
+    ## Poll the polling object - check for IO
+    ## @param timeout (int) time (in miliseconds) until poller times out
+    ## @returns events (dict) dict of events that have been recognized
+    def poll(self, timeout):
+        # As opposed to poll timeout, epoll timeout needs to be in seconds
+        return self._poller.poll(float(timeout) / 1000)
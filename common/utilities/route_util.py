@@ -0,0 +1,78 @@
+#!/usr/bin/python
+## @package RAID5.common.utilities.route_util
+# Module that defines the RouteTable class, that maps request paths to the
+# services of a server
+#
+
+import importlib
+
+from common.services import base_service
+from common.utilities import constants
+
+## Table of the services a server offers. The table is built once, when the
+## server starts, from the services defined in the modules of
+## constants.MODULE_DICT, and doesn't change afterwards.
+## A service may optionally define:
+## METHODS (tuple) - the HTTP methods it accepts, any method if not defined
+## PREFIX (bool) - if get_name() is a prefix of the paths it serves
+class RouteTable(object):
+
+    ## Constructor for RouteTable
+    ## @param server_type (int) type of the server, key of
+    ## constants.MODULE_DICT
+    def __init__(self, server_type):
+        ## Services by exact path, path : (methods, service_class)
+        self._routes = {}
+
+        ## Services by prefix, longest prefix first,
+        ## list of (prefix, methods, service_class)
+        self._prefixes = []
+
+        # import only the services permitted to this server
+        for module_name in constants.MODULE_DICT[server_type]:
+            module = importlib.import_module(module_name)
+            for service_class in vars(module).values():
+                if (
+                    isinstance(service_class, type) and
+                    issubclass(service_class, base_service.BaseService) and
+                    service_class.__module__ == module.__name__
+                ):
+                    self.add_route(service_class)
+
+        self._prefixes.sort(key=lambda route: len(route[0]), reverse=True)
+
+    ## Adds the route of a service to the table
+    ## @param service_class (class) the service
+    def add_route(self, service_class):
+        methods = getattr(service_class, "METHODS", None)
+        if getattr(service_class, "PREFIX", False):
+            self._prefixes.append(
+                (service_class.get_name(), methods, service_class)
+            )
+        else:
+            self._routes[service_class.get_name()] = (methods, service_class)
+
+    ## Returns the service that serves a path
+    ## @param path (string) path of the request
+    ## @param method (optional) (string) method of the request, if None any
+    ## method matches
+    ## @returns service_class (class) the service, None if no service
+    ## serves the path
+    def lookup(self, path, method=None):
+        route = self._routes.get(path)
+        if route is not None and self.check_method(route[0], method):
+            return route[1]
+
+        for prefix, methods, service_class in self._prefixes:
+            if path.startswith(prefix) and self.check_method(methods, method):
+                return service_class
+        return None
+
+    ## Checks if a method is accepted
+    ## @param methods (tuple) accepted methods, None if any method is
+    ## accepted
+    ## @param method (string) method of the request, None matches any
+    ## @returns accepted (bool) if the method is accepted
+    @staticmethod
+    def check_method(methods, method):
+        return methods is None or method is None or method in methods
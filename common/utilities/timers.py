@@ -0,0 +1,115 @@
+#!/usr/bin/python
+## @package RAID5.common.utilities.timers
+# Module that defines the Timer and Timers classes, for scheduling callbacks
+# on the AsyncServer
+#
+
+import heapq
+import logging
+import time
+import traceback
+
+## A single scheduled callback. Periodic timers are scheduled again every
+## time they go off, until they are cancelled.
+class Timer(object):
+
+    ## Constructor for Timer
+    ## @param deadline (float) time when the timer goes off
+    ## @param callback (function) function to call, no params
+    ## @param interval (float) seconds between calls for periodic timers,
+    ## None for one-shot timers
+    def __init__(self, deadline, callback, interval):
+        ## Time when the timer goes off
+        self.deadline = deadline
+
+        ## Function to call when the timer goes off
+        self.callback = callback
+
+        ## Seconds between calls, None if the timer is one-shot
+        self.interval = interval
+
+        ## If the timer was cancelled
+        self.cancelled = False
+
+    ## Cancels the timer, it won't go off again
+    def cancel(self):
+        self.cancelled = True
+
+    ## Representation of the Timer
+    ## @returns representation (string)
+    def __repr__(self):
+        return "Timer Object: %s, %s" % (self.callback, self.deadline)
+
+
+## Heap of timers for the AsyncServer. The server polls until the next timer
+## should go off and then calls all the expired timers, so timers go off on
+## time regardless of the IO load.
+class Timers(object):
+
+    ## Constructor for Timers
+    def __init__(self):
+        ## Heap of (deadline, sequence, Timer)
+        self._heap = []
+
+        ## Sequence of the next timer, keeps timers with the same deadline
+        ## in the order they were added
+        self._sequence = 0
+
+    ## Adds a one-shot timer
+    ## @param delay (float) seconds until the timer goes off
+    ## @param callback (function) function to call, no params
+    ## @returns timer (Timer) the timer, can be cancelled
+    def call_later(self, delay, callback):
+        return self.add_timer(Timer(time.time() + delay, callback, None))
+
+    ## Adds a periodic timer
+    ## @param interval (float) seconds between calls
+    ## @param callback (function) function to call, no params
+    ## @returns timer (Timer) the timer, can be cancelled
+    def call_every(self, interval, callback):
+        return self.add_timer(
+            Timer(time.time() + interval, callback, interval)
+        )
+
+    ## Adds a timer to the heap
+    ## @param timer (Timer) timer to add
+    ## @returns timer (Timer) the timer
+    def add_timer(self, timer):
+        heapq.heappush(self._heap, (timer.deadline, self._sequence, timer))
+        self._sequence += 1
+        return timer
+
+    ## Returns the time until the next timer goes off
+    ## @param timeout (int) max time (in miliseconds) to return
+    ## @returns timeout (int) time (in miliseconds) until the next timer
+    def get_timeout(self, timeout):
+        while len(self._heap) and self._heap[0][2].cancelled:
+            heapq.heappop(self._heap)
+        if len(self._heap) == 0:
+            return timeout
+        return max(
+            0,
+            min(timeout, int((self._heap[0][0] - time.time()) * 1000) + 1)
+        )
+
+    ## Calls all the timers that have expired. Periodic timers are added
+    ## again, an interval after the time they should have gone off (or an
+    ## interval after now, if we're late by more than an interval).
+    def run_expired(self):
+        now = time.time()
+        while len(self._heap) and self._heap[0][0] <= now:
+            deadline, sequence, timer = heapq.heappop(self._heap)
+            if timer.cancelled:
+                continue
+
+            try:
+                timer.callback()
+            except Exception as e:
+                traceback.print_exc()
+                logging.error("%s:\tTimer raised an error: %s" % (timer, e))
+
+            if timer.interval is not None and not timer.cancelled:
+                timer.deadline = deadline + timer.interval
+                if timer.deadline <= now:
+                    timer.deadline = now + timer.interval
+                self.add_timer(timer)
@@ -4,6 +4,7 @@
 #
 
 import base64
+import ctypes
 import errno
 import os
 import random
@@ -14,6 +15,10 @@ import uuid
 
 from common.utilities import constants
 
+## Functions of the C library that were already looked up, name : function
+## (None if not available)
+LIBC_FUNCTIONS = {}
+
 ## Generates a multipurpose UUID as a string. Uses uuid4.
 ## @returns UUID (string) generated uuid
 def generate_uuid():
@@ -149,6 +154,20 @@ def write(fd, buf):
     while buf:
         buf = buf[os.write(fd, buf):]
 
+## Writes a buf to a file at a certain offset. Uses os.pwrite when
+## available (python-3), otherwise seeks and writes.
+## @param file descriptor (int) open file for writing to which we are writing.
+## @param buf (string) buf to write into file.
+## @param offset (int) offset in the file to write to
+def pwrite(fd, buf, offset):
+    if hasattr(os, "pwrite"):
+        while buf:
+            written = os.pwrite(fd, buf, offset)
+            buf, offset = buf[written:], offset + written
+        return
+    os.lseek(fd, offset, os.SEEK_SET)
+    write(fd, buf)
+
 ## Reads from a file a certain size
 ## @param file descriptor (int) open file for reading from which we are
 ## reading
@@ -163,6 +182,131 @@ def read(fd, max_buffer):
         ret += buf
     return ret
 
+## Reads from a file a certain size at a certain offset. Uses os.pread when
+## available (python-3), otherwise seeks and reads.
+## @param file descriptor (int) open file for reading from which we are
+## reading
+## @param max_buf (int) max_siz we are willing to read
+## @param offset (int) offset in the file to read from
+## @returns file_content (string) file content of size up to max_buffer
+def pread(fd, max_buffer, offset):
+    if hasattr(os, "pread"):
+        ret = ""
+        while len(ret) < max_buffer:
+            buf = os.pread(fd, max_buffer - len(ret), offset + len(ret))
+            if not buf:
+                break
+            ret += buf
+        return ret
+    os.lseek(fd, offset, os.SEEK_SET)
+    return read(fd, max_buffer)
+
+## Returns the ranges of a sparse file that have data, using SEEK_DATA and
+## SEEK_HOLE. If the file system doesn't support them, the whole file is
+## returned as one range.
+## @param fd (int) file descriptor of the file
+## @returns ranges (list) list of (start, end) offsets of the data
+def allocated_ranges(fd):
+    size = os.fstat(fd).st_size
+    ranges = []
+    offset = 0
+    while offset < size:
+        try:
+            start = os.lseek(fd, offset, constants.SEEK_DATA)
+            end = os.lseek(fd, start, constants.SEEK_HOLE)
+        except OSError as e:
+            if e.errno == errno.ENXIO:
+                # no more data till the end of the file
+                break
+            if e.errno == errno.EINVAL and offset == 0:
+                # not supported, all of the file might have data
+                return [(0, size)]
+            raise
+        ranges.append((start, min(end, size)))
+        offset = end
+    return ranges
+
+## Returns a function of the C library, for file system calls that python
+## doesn't have. The 64 bit offsets version is preferred, if there is one.
+## @param name (string) name of the function
+## @param argtypes (list) ctypes types of the params
+## @returns function (function) the function, None if not available
+def get_libc_function(name, argtypes):
+    if name not in LIBC_FUNCTIONS:
+        LIBC_FUNCTIONS[name] = None
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+        except (OSError, TypeError):
+            # no C library (windows)
+            return None
+        for function_name in (name + "64", name):
+            function = getattr(libc, function_name, None)
+            if function is not None:
+                function.argtypes = argtypes
+                function.restype = ctypes.c_int
+                LIBC_FUNCTIONS[name] = function
+                break
+    return LIBC_FUNCTIONS[name]
+
+## Allocates the blocks of a range of a file, grows the file if needed. Uses
+## os.posix_fallocate when available (python-3), otherwise posix_fallocate of
+## the C library. If there is neither, the file is only grown (sparse).
+## @param fd (int) file descriptor of the file
+## @param offset (int) offset of the range
+## @param length (int) length of the range
+def fallocate(fd, offset, length):
+    if hasattr(os, "posix_fallocate"):
+        os.posix_fallocate(fd, offset, length)
+        return
+
+    posix_fallocate = get_libc_function(
+        "posix_fallocate",
+        [ctypes.c_int, ctypes.c_int64, ctypes.c_int64]
+    )
+    if posix_fallocate is None:
+        if os.fstat(fd).st_size < offset + length:
+            os.ftruncate(fd, offset + length)
+        return
+
+    # posix_fallocate returns the error instead of setting errno
+    error = posix_fallocate(fd, offset, length)
+    if error != 0:
+        raise OSError(error, os.strerror(error))
+
+## Punches a hole in a range of a file, the blocks of the range are freed and
+## it reads as zeros. The size of the file doesn't change. If the file system
+## can't punch holes, zeros are written over the range instead.
+## @param fd (int) file descriptor of the file
+## @param offset (int) offset of the range
+## @param length (int) length of the range
+def punch_hole(fd, offset, length):
+    # nothing to free past the end of the file
+    length = min(length, os.fstat(fd).st_size - offset)
+    if length <= 0:
+        return
+
+    fallocate_function = get_libc_function(
+        "fallocate",
+        [ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64]
+    )
+    if fallocate_function is not None:
+        if fallocate_function(
+            fd,
+            constants.FALLOC_FL_PUNCH_HOLE | constants.FALLOC_FL_KEEP_SIZE,
+            offset,
+            length
+        ) == 0:
+            return
+        error = ctypes.get_errno()
+        if error not in (errno.EOPNOTSUPP, errno.ENOSYS):
+            raise OSError(error, os.strerror(error))
+
+    zeros = "\x00" * constants.MAX_READ_CHUNK
+    while length > 0:
+        pwrite(fd, zeros[:min(length, len(zeros))], offset)
+        offset += min(length, len(zeros))
+        length -= min(length, len(zeros))
+
 
 ## Parse a header from a HTTP request or response
 ## @param line (string) unparsed header line
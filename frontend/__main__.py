@@ -8,6 +8,7 @@ import ConfigParser
 import errno
 import logging
 import os
+import select
 
 # only posix has resource module
 if os.name == "posix":
@@ -20,6 +21,9 @@ from common.utilities import async_server
 from common.utilities import config_util
 from common.utilities import poller
 from common.utilities import constants
+from frontend.utilities import block_cache
+from frontend.utilities import rebuild_scheduler
+from frontend.utilities import xor_engine
 
 if not hasattr(os, 'O_BINARY'):
     os.O_BINARY = 0
@@ -34,6 +38,12 @@ POLL_TYPE = {
     "poll": poller.Poller,
     "select": poller.Select
 }
+# epoll is only available on Linux
+if hasattr(select, "epoll"):
+    POLL_TYPE["epoll"] = poller.Epoll
+
+## Default poll type, epoll if available
+DEFAULT_POLL_TYPE = "epoll" if "epoll" in POLL_TYPE else "poll"
 
 ## Parse Arguments for running the Frontend Server
 def parse_args():
@@ -64,8 +74,8 @@ def parse_args():
     parser.add_argument(
         '--poll-type',
         choices=POLL_TYPE.keys(),
-        default=sorted(POLL_TYPE.keys())[0],
-        help='poll or select, default: poll'
+        default=DEFAULT_POLL_TYPE,
+        help='epoll, poll or select, default: %(default)s'
     )
     parser.add_argument(
         '--max-buffer',
@@ -77,6 +87,92 @@ def parse_args():
         type=int,
         default=1000,
     )
+    parser.add_argument(
+        '--pool-idle-timeout',
+        type=int,
+        default=constants.DEFAULT_POOL_IDLE_TIMEOUT,
+        help='Seconds to keep an idle Block Device connection, ' +
+        'default: %(default)s',
+    )
+    parser.add_argument(
+        '--pool-max-idle',
+        type=int,
+        default=constants.DEFAULT_POOL_MAX_IDLE,
+        help='Idle connections kept per Block Device, default: %(default)s',
+    )
+    parser.add_argument(
+        '--pool-connect-timeout',
+        type=float,
+        default=constants.DEFAULT_POOL_CONNECT_TIMEOUT,
+        help='Seconds to wait for a new Block Device connection, ' +
+        'default: %(default)s',
+    )
+    parser.add_argument(
+        '--read-window',
+        type=int,
+        default=constants.DEFAULT_READ_WINDOW,
+        help='Extent reads kept in flight by a single disk read, ' +
+        'default: %(default)s',
+    )
+    parser.add_argument(
+        '--read-buffer',
+        type=int,
+        default=constants.DEFAULT_READ_BUFFER_BLOCKS,
+        help='Blocks a single disk read keeps in memory, ' +
+        'default: %(default)s',
+    )
+    parser.add_argument(
+        '--rebuild-window',
+        type=int,
+        default=constants.DEFAULT_REBUILD_WINDOW,
+        help='Extents a disk rebuild keeps in flight, default: %(default)s',
+    )
+    parser.add_argument(
+        '--rebuild-bandwidth',
+        type=int,
+        default=constants.DEFAULT_REBUILD_BANDWIDTH,
+        help='MB/s a disk rebuild can use on each disk, 0 for no limit, ' +
+        'default: %(default)s',
+    )
+    parser.add_argument(
+        '--rebuild-iops',
+        type=int,
+        default=constants.DEFAULT_REBUILD_IOPS,
+        help='Requests per second a disk rebuild can send to each disk, ' +
+        '0 for no limit, default: %(default)s',
+    )
+    parser.add_argument(
+        '--foreground-latency',
+        type=int,
+        default=constants.DEFAULT_FOREGROUND_LATENCY,
+        help='Latency (in miliseconds) of client requests above which disk ' +
+        'rebuilds back off, 0 to never back off, default: %(default)s',
+    )
+    parser.add_argument(
+        '--block-cache-size',
+        type=int,
+        default=constants.DEFAULT_BLOCK_CACHE_SIZE,
+        help='Memory (in bytes) for caching blocks, 0 disables, ' +
+        'default: %(default)s',
+    )
+    parser.add_argument(
+        '--spill-dir',
+        default=constants.DEFAULT_SPILL_DIRECTORY,
+        help='Directory for the data of offline disks that does not fit ' +
+        'in memory, empty to drop it, default: %(default)s',
+    )
+    parser.add_argument(
+        '--checkpoint-dir',
+        default=constants.DEFAULT_CHECKPOINT_DIRECTORY,
+        help='Directory for the rebuild progress of offline disks, empty ' +
+        'to rebuild them from scratch after a restart, default: %(default)s',
+    )
+    parser.add_argument(
+        '--xor-engine',
+        choices=xor_engine.ENGINES.keys(),
+        default=xor_engine.DEFAULT_ENGINE,
+        help='Engine used to compute parity, default: %(default)s',
+    )
     parser.add_argument(
         '--log-file',
         type=str,
@@ -94,6 +190,12 @@ def parse_args():
     )
     args = parser.parse_args()
     args.base = os.path.normpath(os.path.realpath(args.base))
+    if args.spill_dir:
+        args.spill_dir = os.path.normpath(os.path.realpath(args.spill_dir))
+    if args.checkpoint_dir:
+        args.checkpoint_dir = os.path.normpath(
+            os.path.realpath(args.checkpoint_dir)
+        )
     return args
 
 ## Main Function that creates the AsyncServer and lets the server run. creates
@@ -111,6 +213,9 @@ def main():
         pass
     logging.basicConfig(filename=args.log_file, level=logging.DEBUG)
 
+    # choose the engine used for parity computations
+    xor_engine.set_engine(args.xor_engine)
+
     # create volumes out of volume_UUID's in config_file, might
     # be recreated
     volumes = {}
@@ -121,6 +226,8 @@ def main():
                 "volume_state": constants.UNINITIALIZED,
                 "long_password": content["long_password"],
                 "disks": {},
+                "stripes_in_flight": {},
+                "stripe_watches": [],
             }
 
     # handle daemon state
@@ -136,6 +243,28 @@ def main():
         "poll_timeout": args.poll_timeout,
         "max_connections": args.max_connections,
         "max_buffer": args.max_buffer,
+        # frontend services (such as connect) may keep working after the
+        # response, so client connections are never kept alive
+        "keep_alive_timeout": 0,
+        "pool_idle_timeout": args.pool_idle_timeout,
+        "pool_max_idle": args.pool_max_idle,
+        "pool_connect_timeout": args.pool_connect_timeout,
+        "read_window": max(1, args.read_window),
+        "read_buffer_blocks": max(1, args.read_buffer),
+        "rebuild_window": max(1, args.rebuild_window),
+        "rebuild_scheduler": rebuild_scheduler.RebuildScheduler(
+            args.rebuild_bandwidth * 2**20,
+            args.rebuild_iops,
+            float(args.foreground_latency) / 1000,
+            constants.BLOCK_SIZE
+        ),
+        "block_cache": block_cache.BlockCache(
+            args.block_cache_size,
+            constants.BLOCK_SIZE
+        ),
+        "spill_dir": args.spill_dir,
+        "checkpoint_dir": args.checkpoint_dir,
+        "connection_pools": {},
         "server_type": constants.FRONTEND_SERVER,
         "volumes": volumes,
         "available_disks": {},
@@ -12,13 +12,21 @@ import traceback
 
 from frontend.services import client_services
 from common.pollables import pollable
+from common.utilities import buffers
 from common.utilities import constants
 from common.utilities import http_util
 from common.utilities import util
 
 ## A HTTP Socket class that requests from Block Device Servers. Often
 ## Created by Frontend services in order to get data from the different
-## Block Devices.
+## Block Devices. The connection is kept alive between requests, and is
+## pooled by @ref frontend.utilities.connection_pool.ConnectionPool so that
+## services can borrow it for their next request.
+## A new connection may still be connecting, it is connected once the socket
+## is writable. A request started meanwhile is sent once connected. If the
+## connection fails, or doesn't connect within pool_connect_timeout, the
+## request finishes as refused (see
+## @ref frontend.utilities.disk_manager.DiskManager.check_if_finished).
 class BDSClientSocket(pollable.Pollable):
 
     ## Constructor for BDSClientSocket
@@ -26,23 +34,22 @@ class BDSClientSocket(pollable.Pollable):
     ## reverse order to the ServiceSocket, since we are requesting here
     ## and not responding.
     ## @param socket (socket) async socket we work with
-    ## @param client_context (dict) the requestcontext we need to send.
-    ## @param client_update (dict) pointer to dict where responses need to
-    ## be updated.
-    ## @param parent (ServiceSocket) the parent ServiceSocket, that is
-    ## called when socket has finished (on_finish).
+    ## @param application_context (dict) the application_context of the
+    ## Frontend server
+    ## @param pool (ConnectionPool) the pool the connection belongs to
+    ## @param connecting (optional) (bool) if the socket is still connecting
     def __init__(
         self,
         socket,
-        client_context,
-        client_update,
-        parent
+        application_context,
+        pool,
+        connecting=False,
     ):
         ## Application_context
-        self._application_context = parent.application_context
+        self._application_context = application_context
 
         ## Client update
-        self._client_update = client_update
+        self._client_update = None
 
         ## Socket for the BDSClientSocket
         self._socket = socket
@@ -51,15 +58,50 @@ class BDSClientSocket(pollable.Pollable):
         self._fd = socket.fileno()
 
         ## Data socket has recvd
-        self._recvd_data = ""
+        self._recvd_data = buffers.RecvBuffer()
 
         ## Data socket has to send
-        self._data_to_send = ""
+        self._data_to_send = buffers.SendBuffer()
 
-        ## Current HTTP State the socket is in
-        self._state = constants.SEND_REQUEST_STATE
+        ## Current HTTP State the socket is in. Starts off idle
+        self._state = constants.IDLE_STATE
+
+        ## Request context of the current request
+        self._request_context = None
+
+        ## Parent socket that called the BDSClientSocket, None when idle
+        self._parent = None
+
+        ## Client Service that updates the client update
+        self._service = client_services.ClientService(self)
+
+        ## Pool the connection belongs to
+        self._pool = pool
+
+        ## Time the connection was last used, for idle timeouts
+        self._last_used = time.time()
+
+        ## If the socket is still connecting
+        self._connecting = connecting
+
+        ## Timer that gives up on connecting, None once connected
+        self._connect_timer = None
+        if connecting:
+            self._connect_timer = application_context["timers"].call_later(
+                application_context["pool_connect_timeout"],
+                self.on_connect_timeout
+            )
 
-        ## Request context extracted from the client_context
+    ## Starts a new request on the connection.
+    ## @param client_context (dict) the requestcontext we need to send.
+    ## @param client_update (dict) pointer to dict where responses need to
+    ## be updated.
+    ## @param parent (ServiceSocket) the parent ServiceSocket, that is
+    ## called when socket has finished (on_finish).
+    def start_request(self, client_context, client_update, parent):
+        self._client_update = client_update
+        self._parent = parent
+        self._data_to_send.clear()
         self._request_context = {
             "headers": {},
             "status": "uknown",
@@ -68,26 +110,78 @@ class BDSClientSocket(pollable.Pollable):
             "args": client_context["args"]
         }  # important to request
 
-        ## Parent socket that called the BDSClientSocket
-        self._parent = parent
-
-        ## Client Service that updates the client update
-        self._service = client_services.ClientService(self)
-
         # Set the services response (this is in fact the request)
+        self._service = client_services.ClientService(self)
         self._service.response_headers = {
             "Content-Length": len(client_context["content"])
         }
         self._service.response_headers.update(client_context["headers"])
         self._service.response_content = client_context["content"]
 
+        self._state = constants.SEND_REQUEST_STATE
+
+    ## Finishes the current request. The connection goes back to the pool
+    ## (unless the Block Device asked to close it) and the parent is woken up.
+    def finish_request(self):
+        self._service.before_terminate(self)
+        parent, self._parent = self._parent, None
+        self._last_used = time.time()
+
+        if (
+            self._request_context["headers"].get("Connection", "").lower()
+            == "close" or not self._pool.release(self)
+        ):
+            self._state = constants.CLOSING_STATE
+        parent.on_finish()
+
+    ## Finishes connecting once the socket is writable, checks whether the
+    ## connection succeeded
+    ## @returns connected (bool) if the socket is connected
+    def finish_connect(self):
+        error = self._socket.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if error in (errno.EINPROGRESS, errno.EALREADY):
+            return False
+        if error != 0:
+            logging.error(
+                "%s :\t Couldn't connect: %s" % (self, os.strerror(error))
+            )
+            self.connect_failed()
+            return False
+
+        self._connecting = False
+        self._connect_timer.cancel()
+        self._connect_timer = None
+        logging.debug("%s :\t Connected" % self)
+        return True
+
+    ## Called when connecting timed out
+    def on_connect_timeout(self):
+        self._connect_timer = None
+        if self._connecting:
+            logging.error("%s :\t Connecting timed out" % self)
+            self.connect_failed()
+
+    ## Called when connecting failed. The request (if any) finishes as
+    ## refused once the socket closes, and the pool evicts its idle
+    ## connections.
+    def connect_failed(self):
+        self._connecting = False
+        if self._connect_timer is not None:
+            self._connect_timer.cancel()
+            self._connect_timer = None
+        if self._parent is not None:
+            self._client_update["refused"] = True
+        self._pool.mark_failed()
+        self._data_to_send.clear()
+        self._state = constants.CLOSING_STATE
+
     ## When BDSClientSocket is terminating.
     ## required by @ref common.pollables.pollable.Pollable
     ## @returns is_terminating (bool) if is closing
     def is_terminating(self):
         return (
             self._state == constants.CLOSING_STATE
-            and self._data_to_send == ""
+            and len(self._data_to_send) == 0
         )
 
 
@@ -181,6 +275,12 @@ class BDSClientSocket(pollable.Pollable):
     def data_to_send(self, d):
         self._data_to_send = d
 
+    ## Pool property
+    ## @returns pool (ConnectionPool) the pool the connection belongs to
+    @property
+    def pool(self):
+        return self._pool
+
     ## Socket property
     @property
     def socket(self):
@@ -191,13 +291,26 @@ class BDSClientSocket(pollable.Pollable):
     def fd(self):
         return self._fd
 
-    ## What the client does before it closes. Call the parent's on_finish
-    ## method and close socket.
+    ## Keep alive property, pooled connections are always kept alive
+    # @returns keep_alive (bool)
+    @property
+    def keep_alive(self):
+        return True
+
+    ## What the client does before it closes. Leave the pool, close the
+    ## socket, and if a request was in progress call the parent's on_finish
+    ## method.
     ## required by @ref common.pollables.pollable.Pollable
     def on_close(self):
-        self._service.before_terminate(self)
-        self._parent.on_finish()
+        if self._connect_timer is not None:
+            self._connect_timer.cancel()
+            self._connect_timer = None
+        self._pool.remove(self)
         self._socket.close()
+        if self._parent is not None:
+            self._service.before_terminate(self)
+            parent, self._parent = self._parent, None
+            parent.on_finish()
 
     ## Client State Machine. Reversed to ServiceSocket StateMachine.
     STATES = {
@@ -223,7 +336,7 @@ class BDSClientSocket(pollable.Pollable):
         },
         constants.GET_CONTENT_STATE: {
             "function": http_util.get_content_state,
-            "next": constants.CLOSING_STATE
+            "next": constants.IDLE_STATE
         },
         constants.CLOSING_STATE: {
             "next": constants.CLOSING_STATE,
@@ -235,6 +348,12 @@ class BDSClientSocket(pollable.Pollable):
     ## content
     ## func required by @ref common.pollables.pollable.Pollable
     def on_read(self):
+        # an idle connection has nothing to read, Block Device has closed it
+        if self._state == constants.IDLE_STATE:
+            logging.debug("%s :\t Idle connection closed by peer" % self)
+            self._state = constants.CLOSING_STATE
+            return
+
         try:
             http_util.get_buf(self)
             while (self._state <= constants.GET_CONTENT_STATE and (
@@ -252,35 +371,66 @@ class BDSClientSocket(pollable.Pollable):
         except Exception as e:
             traceback.print_exc()
             logging.error("%s :\t Closing socket, got : %s " % (self, e))
+            self._pool.mark_failed()
             self.on_error()
-            http_util.add_status(self, 500, e)
+            return
+
+        if self._state == constants.IDLE_STATE:
+            self.finish_request()
 
     ## What BDSClientSocket does on error.
-    ## Sets state to closing state.
+    ## Sets state to closing state, a socket that was connecting failed to
+    ## connect.
     ## see @ref common.pollables.pollable.Pollable
     def on_error(self):
+        if self._connecting:
+            logging.error("%s :\t Couldn't connect" % self)
+            self.connect_failed()
+            return
+        self._data_to_send.clear()
         self._state = constants.CLOSING_STATE
 
+    ## What BDSClientSocket does when system is on idle.
+    ## Closes the connection if it has been idle for too long.
+    ## see @ref common.pollables.pollable.Pollable
+    def on_idle(self):
+        if (
+            self._state == constants.IDLE_STATE and
+            time.time() - self._last_used >
+            self._application_context["pool_idle_timeout"]
+        ):
+            logging.debug("%s :\t Idle timeout, closing" % self)
+            self._state = constants.CLOSING_STATE
 
     ## What BDSClientSocket does on write.
-    ## First let state machine and service update any content they may have,
-    ## then send it.
+    ## Finish connecting if the socket is connecting. Then let state machine
+    ## and service update any content they may have, and send it.
     ## func required by @ref common.pollables.pollable.Pollable
     def on_write(self):
-        while ((
-            self._state <= constants.SEND_CONTENT_STATE
-        ) and (
-            BDSClientSocket.STATES[self._state]["function"](self)
-        )):
-            self._state = BDSClientSocket.STATES[self._state]["next"]
-            logging.debug(
-                "%s :\t Writing, current state: %s"
-                % (
-                    self,
-                    self._state
+        if self._connecting and not self.finish_connect():
+            return
+        try:
+            while ((
+                self._state >= constants.SEND_REQUEST_STATE and
+                self._state <= constants.SEND_CONTENT_STATE
+            ) and (
+                BDSClientSocket.STATES[self._state]["function"](self)
+            )):
+                self._state = BDSClientSocket.STATES[self._state]["next"]
+                logging.debug(
+                    "%s :\t Writing, current state: %s"
+                    % (
+                        self,
+                        self._state
+                    )
                 )
-            )
-        http_util.send_buf(self)
+            http_util.send_buf(self)
+
+        except Exception as e:
+            traceback.print_exc()
+            logging.error("%s :\t Closing socket, got : %s " % (self, e))
+            self._pool.mark_failed()
+            self.on_error()
 
     ## Specifies what events the BDSClientSocket listens to.
     ## Decide based on state and data in buffer.
@@ -288,6 +438,10 @@ class BDSClientSocket(pollable.Pollable):
     # @returns event (event_mask)
     def get_events(self):
         event = constants.POLLERR
+        # the socket is writable once connected
+        if self._connecting:
+            return event | constants.POLLOUT
+
         if (
             self._state >= constants.GET_STATUS_STATE and
             self._state <= constants.GET_CONTENT_STATE and
@@ -301,6 +455,10 @@ class BDSClientSocket(pollable.Pollable):
         ):
             event |= constants.POLLOUT
 
+        # idle connections listen for the Block Device closing them
+        if self._state == constants.IDLE_STATE:
+            event |= constants.POLLIN
+
         return event
 
     ## Returns a representation of BDSClientSocket Object
@@ -0,0 +1,64 @@
+#!/usr/bin/python
+## @package RAID5.frontend.services.block_cache_service
+## Module that defines the BlockCacheService service class.
+## It displays the statistics of the block cache of the Frontend Server, so
+## the cache can be sized.
+#
+
+from common.services import base_service
+from common.utilities import constants
+from common.utilities import html_util
+from common.utilities import util
+
+## Simple Frontend HTTP service that displays the hits, misses and size of
+## the block cache with HTML.
+class BlockCacheService(base_service.BaseService):
+
+    ## Constructor for BlockCacheService
+    # @param entry (pollable) the entry (probably @ref
+    # common.pollables.service_socket) using the service
+    # @param pollables (dict) All the pollables currently in the server
+    # @param args (dict) Arguments for this service
+    def __init__(self, entry, pollables, args):
+        super(BlockCacheService, self).__init__(["Authorization"])
+
+    ## Name of the service
+    # needed for Frontend purposes, creating clients
+    # required by common.services.base_service.BaseService
+    # @returns (str) service name
+    @staticmethod
+    def get_name():
+        return "/block_cache"
+
+    ## Before pollable sends response status service function
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    ## @returns finished (bool) returns true if finished
+    def before_response_status(self, entry):
+        if not util.check_user_login(entry):
+            # login was unsucsessful, notify the user agent
+            self._response_status = 401
+
+    ## Before pollable sends response headers service function
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    ## @returns finished (bool) returns true if finished
+    def before_response_headers(self, entry):
+        if self._response_status == 200:
+            stats = entry.application_context["block_cache"].get_stats()
+            self._response_content = html_util.create_html_page(
+                "<br>".join(
+                    "%s: %s" % (name, value)
+                    for name, value in stats.items()
+                ),
+                constants.HTML_DEFAULT_HEADER,
+            )
+            self._response_headers = {
+                "Content-Length": "%s" % len(self._response_content),
+            }
+        else:
+            self._response_headers = {
+                "Content-Length": 0,
+                "WWW-Authenticate": "Basic realm='myRealm'",
+            }
+        return True
@@ -19,6 +19,9 @@ class ClientService(base_service.BaseService):
     def __init__(self, entry):
         super(ClientService, self).__init__()
 
+        ## Parts of the content recieved so far, joined once finished
+        self._content = []
+
     ## Name of the service
     # required by common.services.base_service.BaseService
     # @returns (str) service name
@@ -31,11 +34,13 @@ class ClientService(base_service.BaseService):
     ## to
     ## @param content (string) content to handle from entry
     def handle_content(self, entry, content):
-        entry.client_update["content"] += content
+        self._content.append(content)
 
     ## Before pollable terminates service function
     ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
     ## to
     ## @returns finished (bool) returns true if finished
     def before_terminate(self, entry):
+        entry.client_update["content"] += "".join(self._content)
+        self._content = []
         entry.client_update["finished"] = True
@@ -60,11 +60,32 @@ class ConnectService(base_service.BaseService):
         ## StateMachine object
         self._state_machine = None
 
-        ## Current block num (for rebuilding)
-        self._current_block_num = ""
+        ## Rebuild batches in flight. Each batch is a dict with the keys:
+        ## blocks - list of [block_num, block_data] the batch rebuilds
+        ## missing - block_nums that aren't stored in the cache
+        ## stage - GET_STAGE while reading the missing blocks from the other
+        ## disks, SET_STAGE while setting the blocks
+        ## disk_manager - Disk Manager that manages the batch's clients
+        self._batches = []
 
-        ## Current data (for rebuilding)
-        self._current_data = ""
+        ## Time the rebuild started
+        self._rebuild_start = None
+
+        ## Amount of blocks rebuilt
+        self._blocks_rebuilt = 0
+
+        ## Time of the last checkpoint of the rebuild
+        self._last_checkpoint = 0
+
+        ## If the level of the disk was updated
+        self._level_updated = False
+
+        ## Timer that resumes the rebuild once the disks have budget, None
+        ## if the rebuild isn't throttled
+        self._throttle_timer = None
+
+        ## If the rebuild was resumed by the throttle timer
+        self._resumed = False
 
         ## pollables of the Frontend server
         self._pollables = pollables
@@ -123,6 +144,9 @@ class ConnectService(base_service.BaseService):
                 raise RuntimeError("Error in levels")
 
         self._disks[self._disk_UUID]["state"] = constants.REBUILD
+        entry.application_context["block_cache"].invalidate_volume(
+            self._volume_UUID
+        )
 
     ## Before pollable sends response status service function
     ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
@@ -148,61 +172,57 @@ class ConnectService(base_service.BaseService):
 
     ## Rebuilding States
     (
-        GET_DATA_STATE,
-        SET_DATA_STATE,
+        ALLOCATION_STATE,
+        REBUILD_STATE,
         UPDATE_LEVEL_STATE,
         FINAL_STATE
     ) = range(4)
 
+    ## Stages of a rebuild batch
+    (
+        GET_STAGE,
+        SET_STAGE
+    ) = range(2)
+
     # STATE FUNCTIONS:
 
-    ## Before we get the rebulding data
+    ## Before we find which blocks of a disk that is rebuilt from scratch
+    ## need to be rebuilt. Requests the allocation maps of all the disks,
+    ## blocks that are holes in all of them are zeros and don't need to be
+    ## rebuilt. The disk itself is asked too, so blocks that only it has are
+    ## rebuilt (as zeros).
     ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
     ## to
     ## @returns epsilon_path (bool) if there is no need for input
-    def before_get_data(self, entry):
-        self._current_block_num, self._current_data = (
-            self._disks[self._disk_UUID]["cache"].next_block()
-        )
-        if self._current_data is not None:
-            # got data stored in cache, no need for hard rebuild
-            # ==> This is an epsilon_path
-            return True
-        else:
-            # need to retreive data from XOR of all the disks besides the current
-            # in order to rebuild it
-            request_info = {}
-            for disk_UUID in self._disks.keys():
-                if disk_UUID != self._disk_UUID:
-                    request_info[disk_UUID] = {
-                        "block_num" : self._current_block_num,
-                        "password" : self._volume["long_password"]
-                    }
+    def before_allocation(self, entry):
+        # from now on blocks that are written are marked, the allocation
+        # maps may not have them
+        self._disks[self._disk_UUID]["cache"].mode = cache.Cache.CACHE_MODE
 
-            self._disk_manager = disk_manager.DiskManager(
+        self._disk_manager = disk_manager.DiskManager(
+            self._disks,
+            self._pollables,
+            entry,
+            service_util.create_get_allocation_contexts(
                 self._disks,
-                self._pollables,
-                entry,
-                service_util.create_get_block_contexts(
-                    self._disks,
-                    request_info
-                )
+                {
+                    disk_UUID: {
+                        "password" : self._volume["long_password"]
+                    }
+                    for disk_UUID in self._disks.keys()
+                }
             )
-            entry.state = constants.SLEEPING_STATE
-            return False  # need input, not an epsilon path
+        )
+        entry.state = constants.SLEEPING_STATE
+        return False  # need input, not an epsilon_path
 
-    ## After we get the rebulding data
+    ## After we got the allocation maps of all the disks. Marks all the
+    ## allocated blocks to be rebuilt.
     ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
     ## to
     ## @returns next_state (int) next state of StateMachine. None if not
     ## ready to move on to next state.
-    def after_get_data(self, entry):
-        # first check if the data has come from the cache
-        if self._current_data is not None:
-            return ConnectService.SET_DATA_STATE
-
-        # now we know that the data has come from the other disks. check if
-        # they all finished and their responses
+    def after_allocation(self, entry):
         if not self._disk_manager.check_if_finished():
             return None
         if not self._disk_manager.check_common_status_code("200"):
@@ -210,71 +230,272 @@ class ConnectService(base_service.BaseService):
                 "Block Device Server sent a bad status code"
             )
 
-        # data not saved in cache, need to xor all the blocks
-        blocks = []
-        for disk_num, response in self._disk_manager.get_responses().items():
-            blocks.append(response["content"])
+        disk_cache = self._disks[self._disk_UUID]["cache"]
+        for disk_UUID, response in self._disk_manager.get_responses().items():
+            extents = [
+                int(field) for field in
+                response["content"].split(constants.MY_SEPERATOR)
+                if field != ""
+            ]
+            for index in range(0, len(extents) - 1, 2):
+                disk_cache.add_extent(extents[index], extents[index + 1])
+        self.save_checkpoint()
+        return ConnectService.REBUILD_STATE
+
+    ## Before we rebuild the next blocks
+    ## Keeps up to rebuild_window batches in flight. Each batch is an extent
+    ## of up to MAX_EXTENT_BLOCKS blocks that need to be rebuilt. Blocks that
+    ## are not stored in the cache are requested from all the other disks,
+    ## as a single extent from each disk, and then the whole extent is set
+    ## in a single request. So the reads of some batches overlap the writes
+    ## of others. Batches are only sent while the rebuild scheduler gives
+    ## the disks budget, otherwise the rebuild sleeps until they have.
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    ## @returns epsilon_path (bool) if there is no need for input
+    def before_rebuild(self, entry):
+        disk_cache = self._disks[self._disk_UUID]["cache"]
+        window = entry.application_context["rebuild_window"]
+        scheduler = entry.application_context["rebuild_scheduler"]
+        self._disks[self._disk_UUID]["rebuild_limit"] = (
+            scheduler.get_bandwidth()
+        )
+        while len(self._batches) < window:
+            delay = scheduler.get_delay(self._disks.keys())
+            if delay > 0:
+                self.throttle(entry, delay)
+                break
+            blocks = disk_cache.next_blocks(constants.MAX_EXTENT_BLOCKS)
+            if len(blocks) == 0:
+                break
+            if self.check_if_in_flight(blocks):
+                # a block was written again while being rebuilt, rebuild it
+                # again once the batch in flight is done so the old data
+                # isn't set after the new data
+                for block_num, block_data in blocks:
+                    disk_cache.add_block(block_num, block_data)
+                break
+            self._batches.append(self.create_batch(entry, blocks))
 
-        # check if finished scratch mode for cache
-        if (
-            (
-                self._disks[self._disk_UUID]["cache"].mode ==
-                cache.Cache.SCRATCH_MODE
-            ) and disk_util.all_empty(blocks)
-        ):
-            # all the blocks we got are empty, change to cache mode
-            self._disks[self._disk_UUID]["cache"].mode = (
-                cache.Cache.CACHE_MODE
-            )
-            # nothing to set now, we stay in GET_DATA_STATE and start working
-            # from cache
-            return ConnectService.GET_DATA_STATE
-        else:
-            self._current_data = disk_util.compute_missing_block(
-                blocks
+        entry.state = constants.SLEEPING_STATE
+        return False  # need input, not an epsilon path
+
+    ## Resumes the rebuild after a delay, unless it is already going to
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    ## @param delay (float) seconds until the rebuild resumes
+    def throttle(self, entry, delay):
+        if self._throttle_timer is not None:
+            return
+        self._throttle_timer = entry.application_context[
+            "timers"
+        ].call_later(delay, lambda: self.on_resume(entry))
+
+    ## Called when the throttle timer goes off, the disks have budget again.
+    ## Let StateMachine send the next batches.
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    def on_resume(self, entry):
+        self._throttle_timer = None
+        self._resumed = True
+        self._state_machine.run_machine((self, entry))
+
+    ## Checks if any of the blocks are in a batch in flight
+    ## @param blocks (list) list of [block_num, block_data]
+    ## @returns in_flight (bool)
+    def check_if_in_flight(self, blocks):
+        for batch in self._batches:
+            if (
+                len(batch["blocks"]) and
+                blocks[0][0] <= batch["blocks"][-1][0] and
+                batch["blocks"][0][0] <= blocks[-1][0]
+            ):
+                return True
+        return False
+
+    ## Creates a batch that rebuilds blocks, and sends its requests. If all
+    ## the data is stored in the cache the blocks are set right away. The
+    ## requests are taken from the budgets of the disks.
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    ## @param blocks (list) list of [block_num, block_data], block_data is
+    ## None if it needs to be rebuilt from the other disks
+    ## @returns batch (dict) the new batch
+    def create_batch(self, entry, blocks):
+        batch = {
+            "blocks": blocks,
+            "missing": [
+                block_num for block_num, block_data in blocks
+                if block_data is None
+            ],
+        }
+        scheduler = entry.application_context["rebuild_scheduler"]
+        scheduler.consume(self._disk_UUID, len(blocks))
+        if len(batch["missing"]) == 0:
+            # got all the data stored in cache, no need for hard rebuild
+            self.set_batch(entry, batch)
+            return batch
+
+        # need to retreive data from XOR of all the disks besides the current
+        # in order to rebuild it
+        request_info = {}
+        for disk_UUID in self._disks.keys():
+            if disk_UUID != self._disk_UUID:
+                request_info[disk_UUID] = {
+                    "first" : batch["missing"][0],
+                    "count" : batch["missing"][-1] - batch["missing"][0] + 1,
+                    "password" : self._volume["long_password"]
+                }
+                scheduler.consume(disk_UUID, request_info[disk_UUID]["count"])
+
+        batch["stage"] = ConnectService.GET_STAGE
+        batch["disk_manager"] = disk_manager.DiskManager(
+            self._disks,
+            self._pollables,
+            entry,
+            service_util.create_get_blocks_contexts(
+                self._disks,
+                request_info
             )
-            return ConnectService.SET_DATA_STATE
+        )
+        return batch
 
-    ## Before we set the rebulding data
+    ## Sets all the blocks of a batch in a single request
     ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
     ## to
-    ## @returns epsilon_path (bool) if there is no need for input
-    def before_set_data(self, entry):
-        self._disk_manager = disk_manager.DiskManager(
+    ## @param batch (dict) the batch
+    def set_batch(self, entry, batch):
+        batch["stage"] = ConnectService.SET_STAGE
+        batch["disk_manager"] = None
+        if len(batch["blocks"]) == 0:
+            return
+        batch["disk_manager"] = disk_manager.DiskManager(
             self._disks,
             self._pollables,
             entry,
-            service_util.create_set_block_contexts(
+            service_util.create_set_blocks_contexts(
                 self._disks,
                 {
                     self._disk_UUID: {
-                        "block_num": self._current_block_num,
-                        "content": self._current_data,
+                        "blocks": batch["blocks"],
                         "password" : self._volume["long_password"]
                     }
                 }
             )
         )
-        entry.state = constants.SLEEPING_STATE
-        return False  # need input, not an epsilon path
 
-
-    ## After we set the rebulding data
+    ## After some of the batches have been read or set. Batches that were
+    ## read are computed and set, batches that were set are done.
     ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
     ## to
     ## @returns next_state (int) next state of StateMachine. None if not
     ## ready to move on to next state.
-    def after_set_data(self, entry):
-        if not self._disk_manager.check_if_finished():
+    def after_rebuild(self, entry):
+        computed = 0
+        done = []
+        for batch in self._batches:
+            if (
+                batch["disk_manager"] is not None and
+                not batch["disk_manager"].check_if_finished()
+            ):
+                continue
+            if (
+                batch["disk_manager"] is not None and
+                not batch["disk_manager"].check_common_status_code("200")
+            ):
+                raise RuntimeError(
+                    "Block Device Server sent a bad status code"
+                )
+
+            if batch["stage"] == ConnectService.GET_STAGE:
+                self.compute_batch(batch)
+                self.set_batch(entry, batch)
+                computed += 1
+            else:
+                done.append(batch)
+
+        for batch in done:
+            self._batches.remove(batch)
+            self.update_rate(len(batch["blocks"]))
+        if (
+            len(done) and
+            (
+                time.time() - self._last_checkpoint >
+                constants.REBUILD_CHECKPOINT_INTERVAL
+            )
+        ):
+            self.save_checkpoint()
+
+        if len(self._batches) == 0 and self.check_if_built():
+            logging.info(
+                "%s:\t Rebuilt %s blocks of %s, %.2f MB/s" % (
+                    entry,
+                    self._blocks_rebuilt,
+                    self._disk_UUID,
+                    self._disks[self._disk_UUID].get("rebuild_rate", 0),
+                )
+            )
+            if self._level_updated:
+                self.set_online(entry)
+                return ConnectService.FINAL_STATE
+            return ConnectService.UPDATE_LEVEL_STATE
+        # nothing finished and the scheduler didn't resume us, keep waiting
+        resumed, self._resumed = self._resumed, False
+        if computed == 0 and len(done) == 0 and not resumed:
             return None
-        if not self._disk_manager.check_common_status_code("200"):
-            raise RuntimeError(
-                "Block Device Server sent a bad status code"
+        return ConnectService.REBUILD_STATE
+
+    ## Computes the blocks of a batch that are not stored in the cache, from
+    ## the XOR of all the other disks
+    ## @param batch (dict) the batch that was read
+    def compute_batch(self, batch):
+        responses = batch["disk_manager"].get_responses()
+        first = batch["missing"][0]
+        for index in range(len(batch["blocks"])):
+            block_num, block_data = batch["blocks"][index]
+            if block_data is not None:
+                continue
+
+            # data not saved in cache, need to xor all the blocks
+            blocks = []
+            for disk_UUID, response in responses.items():
+                blocks.append(
+                    disk_util.get_block_from_extent(
+                        response["content"],
+                        first,
+                        block_num
+                    )
+                )
+
+            batch["blocks"][index][1] = disk_util.compute_missing_block(
+                blocks
             )
 
-        if self.check_if_built():
-            return ConnectService.UPDATE_LEVEL_STATE
-        return ConnectService.GET_DATA_STATE
+    ## Saves the progress of the rebuild, so it can continue from here if the
+    ## frontend restarts. Blocks of batches in flight are saved as dirty.
+    def save_checkpoint(self):
+        in_flight = []
+        for batch in self._batches:
+            in_flight.extend(block_num for block_num, data in batch["blocks"])
+        self._disks[self._disk_UUID]["cache"].save_checkpoint(
+            self._volume_UUID,
+            max(
+                disk["level"] for disk_UUID, disk in self._disks.items()
+                if disk_UUID != self._disk_UUID
+            ),
+            in_flight
+        )
+        self._last_checkpoint = time.time()
+
+    ## Updates the rebuild throughput of the disk, shown while rebuilding
+    ## @param blocks (int) amount of blocks that were rebuilt
+    def update_rate(self, blocks):
+        self._blocks_rebuilt += blocks
+        elapsed = max(time.time() - self._rebuild_start, 0.001)
+        self._disks[self._disk_UUID]["rebuild_rate"] = (
+            float(self._blocks_rebuilt) * constants.BLOCK_SIZE /
+            elapsed / 2**20
+        )
 
     ## Before we update the level of the updated disk
     ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
@@ -312,27 +533,43 @@ class ConnectService(base_service.BaseService):
             )
 
         self._disks[self._disk_UUID]["level"] += 1
+        self._level_updated = True
+
+        # blocks may have been written to the cache while updating the level
+        if not self.check_if_built():
+            return ConnectService.REBUILD_STATE
+        self.set_online(entry)
+        return ConnectService.FINAL_STATE
+
+    ## Brings the disk online, once it is rebuilt and its level is updated
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    def set_online(self, entry):
         self._disks[self._disk_UUID]["state"] = constants.ONLINE
+        # the disk is up to date, no need for the checkpoint anymore
+        self._disks[self._disk_UUID]["cache"].close()
+        entry.application_context["block_cache"].invalidate_volume(
+            self._volume_UUID
+        )
         entry.state = constants.CLOSING_STATE
-        return ConnectService.FINAL_STATE
 
     ## Rebuilding states for StateMachine
     STATES = [
         state.State(
-            GET_DATA_STATE,
-            [SET_DATA_STATE],
-            before_get_data,
-            after_get_data,
+            ALLOCATION_STATE,
+            [REBUILD_STATE],
+            before_allocation,
+            after_allocation,
         ),
         state.State(
-            SET_DATA_STATE,
-            [GET_DATA_STATE, UPDATE_LEVEL_STATE],
-            before_set_data,
-            after_set_data,
+            REBUILD_STATE,
+            [REBUILD_STATE, UPDATE_LEVEL_STATE, FINAL_STATE],
+            before_rebuild,
+            after_rebuild,
         ),
         state.State(
             UPDATE_LEVEL_STATE,
-            [FINAL_STATE],
+            [FINAL_STATE, REBUILD_STATE],
             before_update_level,
             after_update_level,
         ),
@@ -348,9 +585,15 @@ class ConnectService(base_service.BaseService):
     ## @returns finished (bool) returns true if finished
     def before_terminate(self, entry):
         # create the state machine for rebuilding disk
-        first_state_index = ConnectService.GET_DATA_STATE
+        first_state_index = ConnectService.REBUILD_STATE
+        self._rebuild_start = time.time()
         if self._new_disk_mode:
             first_state_index = ConnectService.NEW_DISK_SETUP_STATE
+        elif (
+            self._disks[self._disk_UUID]["cache"].mode ==
+            cache.Cache.SCRATCH_MODE
+        ):
+            first_state_index = ConnectService.ALLOCATION_STATE
         elif self.check_if_built():
             first_state_index = ConnectService.UPDATE_LEVEL_STATE
 
@@ -0,0 +1,308 @@
+#!/usr/bin/python
+## @package RAID5.frontend.services.discard_service
+## Module that defines the DiscardService class. The service discards a range
+## of stripes of a volume, on all of its disks.
+#
+
+import errno
+import logging
+import os
+import socket
+import time
+import traceback
+
+from common.services import base_service
+from common.utilities import constants
+from common.utilities import html_util
+from common.utilities import util
+from frontend.utilities import disk_manager
+from frontend.utilities import service_util
+from common.utilities.state_util import state
+from common.utilities.state_util import state_machine
+
+## Frontend DiscardService. This service discards the stripes
+## first..first+count-1 of a volume, the blocks of the data disks and of the
+## parity disks. Every disk punches a hole for the range (see
+## @ref block_device.services.trim_service.TrimService), so the blocks are
+## freed and read as zeros, and the parity of the discarded stripes (zeros)
+## stays correct. Only whole stripes can be discarded.
+##
+## The stripes are discarded MAX_DISCARD_BLOCKS at a time. Like a write, a
+## batch holds its stripes in the stripes_in_flight of the volume, so a scrub
+## doesn't take a half discarded stripe for a mismatch. All the disks of the
+## volume must be online.
+class DiscardService(base_service.BaseService):
+    ## Discard States
+    (
+        DISCARD_STATE,
+        FINAL_STATE,
+    ) = range(2)
+
+    ## Constructor for DiscardService
+    # @param entry (pollable) the entry (probably @ref
+    # common.pollables.service_socket) using the service
+    # @param pollables (dict) All the pollables currently in the server
+    # @param args (dict) Arguments for this service
+    def __init__(self, entry, pollables, args):
+        super(DiscardService, self).__init__(
+            ["Authorization"],
+            ["volume_UUID", "first", "count"],
+            args
+        )
+        ## Volume we're dealing with
+        self._volume = None
+
+        ## Disks we're dealing with
+        self._disks = None
+
+        ## Volume UUID of relevant volume
+        self._volume_UUID = None
+
+        ## block_num of the next stripe to discard
+        self._block_num = None
+
+        ## block_num after the last stripe to discard
+        self._last = None
+
+        ## Stripes of the batch we're discarding, counted in the
+        ## stripes_in_flight of the volume until the batch has finished
+        self._stripes_in_flight = []
+
+        ## StateMachine object
+        self._state_machine = None
+
+        ## pollables of the Frontend server
+        self._pollables = pollables
+
+        ## Disk Manager that manages all the clients
+        self._disk_manager = None
+
+    ## Name of the service
+    # needed for Frontend purposes, creating clients
+    # required by common.services.base_service.BaseService
+    # @returns (str) service name
+    @staticmethod
+    def get_name():
+        return "/discard"
+
+    ## Checks the args, the volume and the range of stripes
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    def initial_setup(self, entry):
+        if not self.check_args():
+            raise RuntimeError("%s:\t Invalid args" % entry)
+
+        self._volume_UUID = self._args["volume_UUID"][0]
+        if (
+            self._volume_UUID not in entry.application_context[
+                "volumes"
+            ].keys() or
+            (
+                entry.application_context["volumes"][self._volume_UUID][
+                    "volume_state"
+                ] != constants.INITIALIZED
+            )
+        ):
+            raise RuntimeError("%s:\t Need to initialize volume" % (
+                entry,
+            ))
+        self._volume = entry.application_context["volumes"][
+            self._volume_UUID
+        ]
+        self._disks = self._volume["disks"]
+
+        self._block_num = int(self._args["first"][0])
+        self._last = self._block_num + int(self._args["count"][0])
+        if self._block_num < 0 or self._last < self._block_num:
+            raise RuntimeError("%s:\t Invalid range of stripes" % entry)
+        self.check_disks(entry)
+
+    ## Checks that all the disks of the volume are online, the blocks of an
+    ## offline disk would come back with its rebuild
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    def check_disks(self, entry):
+        for disk_UUID, disk in self._disks.items():
+            if disk["state"] != constants.ONLINE:
+                raise RuntimeError(
+                    "%s:\t Can't discard, disk %s is not online" % (
+                        entry,
+                        disk_UUID
+                    )
+                )
+
+    ## Before discarding the next batch of stripes. Sends the range to all
+    ## the disks.
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    ## @returns epsilon_path (bool) if there is no need for input
+    def before_discard(self, entry):
+        if self._block_num >= self._last:
+            return True
+
+        self.check_disks(entry)
+        count = min(
+            self._last - self._block_num,
+            constants.MAX_DISCARD_BLOCKS
+        )
+        self.hold_stripes(self._block_num, count)
+        entry.application_context["block_cache"].invalidate_stripes(
+            self._volume_UUID,
+            self._block_num,
+            self._block_num + count
+        )
+
+        self._disk_manager = disk_manager.DiskManager(
+            self._disks,
+            self._pollables,
+            entry,
+            service_util.create_trim_contexts(
+                self._disks,
+                {
+                    disk_UUID: {
+                        "first" : self._block_num,
+                        "count" : count,
+                        "password" : self._volume["long_password"]
+                    }
+                    for disk_UUID in self._disks.keys()
+                }
+            ),
+        )
+        return False  # need input, not an epsilon_path
+
+    ## After the batch of stripes was discarded on all the disks
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    ## @returns next_state (int) next state of StateMachine. None if not
+    ## ready to move on to next state.
+    def after_discard(self, entry):
+        if not self._disk_manager.check_if_finished():
+            return None
+        if not self._disk_manager.check_common_status_code("200"):
+            raise RuntimeError(
+                "Got bad status code from BDS"
+            )
+        self.release_stripes()
+
+        # blocks that were read while we discarded might be out of date
+        entry.application_context["block_cache"].invalidate_stripes(
+            self._volume_UUID,
+            self._block_num,
+            self._block_num + constants.MAX_DISCARD_BLOCKS
+        )
+        self._block_num = min(
+            self._last,
+            self._block_num + constants.MAX_DISCARD_BLOCKS
+        )
+        if self._block_num < self._last:
+            return DiscardService.DISCARD_STATE
+
+        entry.state = constants.SEND_HEADERS_STATE
+        return DiscardService.FINAL_STATE
+
+    ## State Machine states
+    STATES = [
+        state.State(
+            DISCARD_STATE,
+            [FINAL_STATE, DISCARD_STATE],
+            before_discard,
+            after_discard,
+        ),
+        state.State(
+            FINAL_STATE,
+            [FINAL_STATE]
+        )
+    ]
+
+    ## Counts the stripes of a batch in the stripes_in_flight of the volume,
+    ## and marks the stripe_watches of the volume that watch them as written
+    ## @param first (int) block_num of the first stripe
+    ## @param count (int) amount of stripes
+    def hold_stripes(self, first, count):
+        stripes_in_flight = self._volume["stripes_in_flight"]
+        for block_num in range(first, first + count):
+            stripes_in_flight[block_num] = (
+                stripes_in_flight.get(block_num, 0) + 1
+            )
+            self._stripes_in_flight.append(block_num)
+        for watch in self._volume["stripe_watches"]:
+            if watch["first"] < first + count and first < watch["last"]:
+                watch["written"] = True
+
+    ## Stops counting the stripes of the batch in the stripes_in_flight of
+    ## the volume
+    def release_stripes(self):
+        stripes_in_flight = self._volume["stripes_in_flight"]
+        for block_num in self._stripes_in_flight:
+            stripes_in_flight[block_num] -= 1
+            if stripes_in_flight[block_num] == 0:
+                del stripes_in_flight[block_num]
+        self._stripes_in_flight = []
+
+    ## Before pollable sends response status service function
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    ## @returns finished (bool) returns true if finished
+    def before_response_status(self, entry):
+        if not util.check_user_login(entry):
+            # login was unsucsessful, notify the user agent
+            self._response_status = 401
+            return
+
+        try:
+            self.initial_setup(entry)
+        except Exception as e:
+            logging.error("%s :\t %s " % (entry, e))
+            self._response_status = 500
+            return
+
+        self._state_machine = state_machine.StateMachine(
+            DiscardService.STATES,
+            DiscardService.STATES[DiscardService.DISCARD_STATE],
+            DiscardService.STATES[DiscardService.FINAL_STATE]
+        )
+        # pass args to the machine, will use *args to pass them on
+        self._state_machine.run_machine((self, entry))
+
+    ## Called when BDSClientSocket invoke the on_finsh method to wake up
+    ## the ServiceSocket. Let StateMachine handle the wake up call.
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    def on_finish(self, entry):
+        # pass args to the machine, will use *args to pass them on
+        self._state_machine.run_machine((self, entry))
+
+    ## Before pollable terminates service function. A discard that didn't
+    ## finish doesn't hold its stripes anymore.
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    def before_terminate(self, entry):
+        if self._volume is not None:
+            self.release_stripes()
+
+    ## Before pollable sends response headers service function
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    ## @returns finished (bool) returns true if finished
+    def before_response_headers(self, entry):
+        if self._response_status == 200:
+            self._response_content = html_util.create_html_page(
+                "Discarded stripes %s - %s" % (
+                    self._args["first"][0],
+                    self._last - 1,
+                ),
+                constants.HTML_DEFAULT_HEADER,
+            )
+            self._response_headers = {
+                "Content-Length": "%s" % len(self._response_content),
+            }
+        elif self._response_status == 401:
+            self._response_headers = {
+                "Content-Length": 0,
+                "WWW-Authenticate": "Basic realm='myRealm'",
+            }
+        else:
+            self._response_headers = {
+                "Content-Length": 0,
+            }
+        return True
@@ -100,8 +100,14 @@ class DisconnectService(base_service.BaseService):
         # already set to offline so that another attempt to disconnect shall be
         # denied
         self._disks[self._disk_UUID]["state"] = constants.OFFLINE
-        self._disks[self._disk_UUID]["cache"] = cache.Cache(
-            mode=cache.Cache.CACHE_MODE
+        self._disks[self._disk_UUID]["cache"].close()
+        self._disks[self._disk_UUID]["cache"] = cache.create_offline_cache(
+            entry.application_context,
+            self._disk_UUID,
+            cache.Cache.CACHE_MODE
+        )
+        entry.application_context["block_cache"].invalidate_volume(
+            self._volume_UUID
         )
 
         # now need to increment other disks level
@@ -146,6 +152,15 @@ class DisconnectService(base_service.BaseService):
         # also mark this disk as offline
         self._disks[self._disk_UUID]["state"] = constants.OFFLINE
 
+        # keep the blocks it misses in case we restart, for the new level
+        self._disks[self._disk_UUID]["cache"].save_checkpoint(
+            self._volume_UUID,
+            max(
+                disk["level"] for disk_UUID, disk in self._disks.items()
+                if disk_UUID != self._disk_UUID
+            )
+        )
+
         entry.state = constants.SEND_HEADERS_STATE
         return DisconnectService.FINAL_STATE
 
@@ -131,6 +131,8 @@ class InitService(base_service.BaseService):
                 "volume_state": constants.INITIALIZED,
                 "long_password": long_password,
                 "disks": {},
+                "stripes_in_flight": {},
+                "stripe_watches": [],
             }
 
             # update the config_file with the new volume
@@ -196,6 +198,9 @@ class InitService(base_service.BaseService):
 
         # finally we have our disks. Update as an attribute
         self._volume = entry.application_context["volumes"][volume_UUID]
+        entry.application_context["block_cache"].invalidate_volume(
+            volume_UUID
+        )
 
         # this is an epsilon path, just setting up
         return True
@@ -285,7 +290,16 @@ class InitService(base_service.BaseService):
             )
 
         # check if a disk need to be rebuilt
-        rebuild_disk = None
+        # By RAID5, we can only rebuild one disk at a time, all the others
+        # must have the same generation level
+        levels = [int(disk_data[0]) for disk_data in disks_data]
+        level = max(levels)
+        if len(levels) - levels.count(level) > 1:
+            raise RuntimeError(
+                "Initialize only a consistent set (level mixup): %s"
+                % levels
+            )
+
         for disk_num in range(len(self._volume["disks"])):
             # first lets check the volume_UUID:
             if disks_data[disk_num][1] != disks_data[0][1]:
@@ -296,17 +310,6 @@ class InitService(base_service.BaseService):
                     )
                 )
 
-            # next lets check the generation level
-            # By RAID5, we can only rebuild one disk at a time
-            if disks_data[disk_num][0] != disks_data[0][0]:
-                raise RuntimeError(
-                    "Initialize only a consistent set (level mixup): %s != %s"
-                    % (
-                        disks_data[disk_num][0],
-                        disks_data[0][0]
-                    )
-                )
-
             # Lets now check the disk UUID:
             if disks_data[disk_num][3:].count(disks_data[disk_num][2]) != 1:
                 raise RuntimeError(
@@ -321,17 +324,45 @@ class InitService(base_service.BaseService):
                 raise RuntimeError("Unsynced peers")
 
         # All the checks came back positive, ready to update disks
-        for disk_UUID, disk in self._volume["disks"].items():
-            self._volume["disks"][disk_UUID]["level"] = int(
-                disks_data[disk_num][0])
-            self._volume["disks"][disk_UUID]["peers"] = disks_data[disk_num][3:]
-            self._volume["disks"][disk_UUID]["state"] = constants.ONLINE
-
+        for disk_num, disk_UUID in enumerate(self._volume["disks"].keys()):
+            disk = self._volume["disks"][disk_UUID]
+            disk["level"] = levels[disk_num]
+            disk["peers"] = disks_data[disk_num][3:]
+            disk["state"] = constants.ONLINE
+            if disk["level"] != level:
+                self.setup_rebuild(entry, disk, level)
 
         entry.state = constants.SEND_CONTENT_STATE
         return InitService.FINAL_STATE
 
 
+    ## Sets up a disk that is behind the rest of the volume as offline, so
+    ## it can be rebuilt when connected. If the frontend restarted while the
+    ## disk was offline or being rebuilt, the rebuild continues from its
+    ## checkpoint, otherwise the whole disk is rebuilt.
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    ## @param disk (dict) the disk
+    ## @param level (int) generation level of the rest of the volume
+    def setup_rebuild(self, entry, disk, level):
+        disk["state"] = constants.OFFLINE
+        disk["cache"] = cache.create_offline_cache(
+            entry.application_context,
+            disk["disk_UUID"],
+            cache.Cache.CACHE_MODE
+        )
+        if disk["cache"].load_checkpoint(self._volume["volume_UUID"], level):
+            logging.info(
+                "%s:	 Continuing rebuild of %s from checkpoint" % (
+                    entry,
+                    disk["disk_UUID"],
+                )
+            )
+            return
+
+        disk["cache"].mode = cache.Cache.SCRATCH_MODE
+        disk["cache"].save_checkpoint(self._volume["volume_UUID"], level)
+
     ## Before we mount a new volume from scratch
     ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
     ## to
@@ -26,6 +26,8 @@ from common.utilities.state_util import state_machine
 ## logical disk and return the content from the actual physical disk. This
 ## service also know how handle when the wanted disk is disconnected, and
 ## can still access it's content based on the RAID5 protocol.
+## Blocks that are in the block cache aren't read from the Block Devices,
+## and the blocks we read (or reconstruct) are added to the block cache.
 class ReadFromDiskService(base_service.BaseService):
     ## Reading States
     (
@@ -36,8 +38,9 @@ class ReadFromDiskService(base_service.BaseService):
     ## Reading Modes
     (
         REGULAR,
-        RECONSTRUCT
-    ) = range(2)
+        RECONSTRUCT,
+        CACHED
+    ) = range(3)
 
     ## Constructor for ReadFromDiskService
     # @param entry (pollable) the entry (probably @ref
@@ -50,14 +53,26 @@ class ReadFromDiskService(base_service.BaseService):
             ["volume_UUID", "disk_num", "firstblock", "blocks"],
             args
         )
-        ## Reading mode
-        self._block_mode = ReadFromDiskService.REGULAR
-
-        ## Current block_num we're reading
+        ## Extent reads in flight, in the order of their blocks. Each batch
+        ## is a dict with the keys:
+        ## first, last - range of blocks [first, last) the batch reads
+        ## block_modes - block_num : (block_mode, phy_UUID)
+        ## extents - first block_num requested from each disk, disk_UUID :
+        ## block_num
+        ## cached - blocks taken from the block cache, block_num : block
+        ## epoch - epoch of the volume in the block cache when requested
+        ## disk_manager - Disk Manager that manages the batch's clients, None
+        ## if all the blocks were cached
+        self._batches = []
+
+        ## First block_num we haven't requested yet
         self._current_block = None
 
-        ## physical UUID of the disk we're reading from
-        self._current_phy_UUID = None
+        ## Block_num after the last block we're reading
+        self._last_block = None
+
+        ## disk_UUIDs of disks we can't read from
+        self._refused = []
 
         ## Logical disk num of disk we're reading from
         self._disk_num = None
@@ -77,9 +92,6 @@ class ReadFromDiskService(base_service.BaseService):
         ## pollables of the Frontend server
         self._pollables = pollables
 
-        ## Disk Manager that manages all the clients
-        self._disk_manager = None
-
     ## Name of the service
     # needed for Frontend purposes, creating clients
     # required by common.services.base_service.BaseService
@@ -88,137 +100,345 @@ class ReadFromDiskService(base_service.BaseService):
     def get_name():
         return "/disk_read"
 
-    ## Before reading a block from the Block Devices.
-    ## First try reading the block regularly. If got DiskRefused, Then read
-    ## that block from all the other disks and compute the missing block.
+    ## Before reading the next blocks from the Block Devices.
+    ## Keeps up to read_window batches in flight. Each batch reads up to
+    ## MAX_EXTENT_BLOCKS blocks, with a single request for a whole extent
+    ## from each Block Device. Blocks on a disk that is offline (or refuses
+    ## to connect) are computed from the same blocks on all the other disks.
+    ## No more than read_buffer_blocks blocks are kept in memory, so we stop
+    ## reading while the client doesn't keep up.
     ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
     ## to
     ## @returns epsilon_path (bool) if there is no need for input
     def before_read(self, entry):
-        self._current_phy_UUID = disk_util.get_physical_disk_UUID(
-            self._disks,
-            self._disk_num,
-            self._current_block
-        )
-        try:
-            # First check availablity
-            available_disks = entry.application_context["available_disks"]
-            online, offline = util.sort_disks(available_disks)
-            if self._current_phy_UUID not in online.keys():
-                raise util.DiskRefused(self._current_phy_UUID)
-
-            self._block_mode = ReadFromDiskService.REGULAR
-            self._disk_manager = disk_manager.DiskManager(
-                self._disks,
-                self._pollables,
-                entry,
-                service_util.create_get_block_contexts(
-                    self._disks,
-                    {
-                        self._current_phy_UUID: {
-                            "block_num" : self._current_block,
-                            "password" : self._volume["long_password"]
-                        }
-                    }
-                ),
-            )
-        except util.DiskRefused as e:
-            # probably got an error when trying to reach a certain BDS
-            # ServiceSocket. We shall try to get the data from the rest of
-            # the disks. Otherwise, two disks are down and theres nothing
-            # we can do
-            logging.debug(
-                "%s:\t Couldn't connect to one of the BDSServers, %s: %s" % (
+        # First check availablity
+        available_disks = entry.application_context["available_disks"]
+        online, offline = util.sort_disks(available_disks)
+        for disk_UUID in self._disks.keys():
+            # a disk that is being rebuilt isn't up to date yet
+            if (
+                (
+                    disk_UUID not in online.keys() or
+                    self._disks[disk_UUID]["state"] != constants.ONLINE
+                ) and
+                disk_UUID not in self._refused
+            ):
+                self._refused.append(disk_UUID)
+
+        while self.can_read(entry):
+            self._batches.append(
+                self.create_batch(
                     entry,
-                    self._current_phy_UUID,
-                    e
+                    self._current_block,
+                    self._current_block + min(
+                        constants.MAX_EXTENT_BLOCKS,
+                        (
+                            entry.application_context["read_buffer_blocks"] -
+                            self.get_buffered_blocks(entry)
+                        ),
+                        self._last_block - self._current_block
+                    )
                 )
             )
-            try:
-                self._block_mode = ReadFromDiskService.RECONSTRUCT
+            self._current_block = self._batches[-1]["last"]
 
-                # create request info for all the other disks
-                request_info = {}
-                for disk_UUID in self._disks.keys():
-                    if disk_UUID != self._current_phy_UUID:
-                        request_info[disk_UUID] = {
-                            "block_num" : self._current_block,
-                            "password" : self._volume["long_password"]
-                        }
+        # the Disk Managers put us to sleep, but we may still have content
+        # to send while the batches are read
+        self.update_state(entry)
+        return False  # always need input, not an epsilon path
+
+    ## Checks if we can send another batch. We can't if the window is full,
+    ## if we requested all the blocks, or if the client isn't reading fast
+    ## enough and too many blocks are kept in memory.
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    ## @returns can_read (bool) if another batch can be sent
+    def can_read(self, entry):
+        return (
+            len(self._batches) < entry.application_context["read_window"] and
+            self._current_block < self._last_block and
+            (
+                self.get_buffered_blocks(entry) <
+                entry.application_context["read_buffer_blocks"]
+            )
+        )
 
-                self._disk_manager = disk_manager.DiskManager(
+    ## Returns the amount of blocks we keep in memory, both blocks in flight
+    ## and blocks that the client hasn't recieved yet
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    ## @returns buffered (int) amount of blocks
+    def get_buffered_blocks(self, entry):
+        buffered = -(-len(entry.data_to_send) // constants.BLOCK_SIZE)
+        for batch in self._batches:
+            buffered += batch["last"] - batch["first"]
+        return buffered
+
+    ## Creates a batch that reads a range of blocks, and sends its requests
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    ## @param first (int) block_num of the first block of the batch
+    ## @param last (int) block_num after the last block of the batch
+    ## @returns batch (dict) the new batch
+    def create_batch(self, entry, first, last):
+        batch = {
+            "first": first,
+            "last": last,
+            "epoch": entry.application_context["block_cache"].get_epoch(
+                self._volume_UUID
+            ),
+        }
+        while True:
+            try:
+                request_info = self.create_extent_requests(entry, batch)
+                if len(request_info) == 0:
+                    # all the blocks are cached, nothing to read
+                    batch["disk_manager"] = None
+                    return batch
+                batch["disk_manager"] = disk_manager.DiskManager(
                     self._disks,
                     self._pollables,
                     entry,
-                    service_util.create_get_block_contexts(
+                    service_util.create_get_blocks_contexts(
                         self._disks,
                         request_info
                     ),
                 )
-            except socket.error as e:
-                # Got another bad connection (Connection refused most likely)
-                raise RuntimeError(
-                    (
-                        "%s:\t Couldn't connect to two of the" +
-                        "BDSServers, giving up: %s"
-                    ) % (
-                        entry,
-                        e
-                    )
+                return batch
+            except util.DiskRefused as e:
+                self.add_refused(entry, e)
+
+    ## Adds a disk that refused to connect to the disks we can't read from.
+    ## We shall try to get the data from the rest of the disks. Otherwise,
+    ## two disks are down and theres nothing we can do.
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    ## @param e (@ref common.utilities.util.DiskRefused) the error
+    def add_refused(self, entry, e):
+        # probably got an error when trying to reach a certain BDS
+        # ServiceSocket
+        logging.debug(
+            "%s:\t Couldn't connect to one of the BDSServers, %s: %s"
+            % (
+                entry,
+                e.disk_UUID,
+                e
+            )
+        )
+        if e.disk_UUID in self._refused:
+            raise RuntimeError(
+                "%s:\t Couldn't connect to %s, giving up" % (
+                    entry,
+                    e.disk_UUID
                 )
-        entry.state = constants.SLEEPING_STATE
-        return False  # always need input, not an epsilon path
+            )
+        self._refused.append(e.disk_UUID)
+
+    ## Creates the extents we need from each disk in order to read the
+    ## blocks of a batch. Also updates the reading mode of each block.
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    ## @param batch (dict) the batch we're reading
+    ## @returns request_info (dict) request info for the get_blocks service
+    def create_extent_requests(self, entry, batch):
+        block_cache = entry.application_context["block_cache"]
+        batch["block_modes"] = {}
+        batch["cached"] = {}
+        disk_blocks = {}
+        for block_num in range(batch["first"], batch["last"]):
+            phy_UUID = disk_util.get_physical_disk_UUID(
+                self._disks,
+                self._disk_num,
+                block_num
+            )
+            block = block_cache.get_block(
+                self._volume_UUID,
+                block_num,
+                phy_UUID
+            )
+            if block is not None:
+                batch["block_modes"][block_num] = (
+                    ReadFromDiskService.CACHED,
+                    phy_UUID
+                )
+                batch["cached"][block_num] = block
+                continue
+
+            if phy_UUID not in self._refused:
+                batch["block_modes"][block_num] = (
+                    ReadFromDiskService.REGULAR,
+                    phy_UUID
+                )
+                disk_blocks.setdefault(phy_UUID, []).append(block_num)
+                continue
 
-    ## After reading from relevant block devices.
+            # need this block from all the other disks
+            batch["block_modes"][block_num] = (
+                ReadFromDiskService.RECONSTRUCT,
+                phy_UUID
+            )
+            for disk_UUID in self._disks.keys():
+                if disk_UUID == phy_UUID:
+                    continue
+                if disk_UUID in self._refused:
+                    raise RuntimeError(
+                        "Couldn't connect to two of the BDSServers, giving up"
+                    )
+                disk_blocks.setdefault(disk_UUID, []).append(block_num)
+
+        # blocks were added in order, so each extent is first to last
+        batch["extents"] = {}
+        request_info = {}
+        for disk_UUID, blocks in disk_blocks.items():
+            batch["extents"][disk_UUID] = blocks[0]
+            request_info[disk_UUID] = {
+                "first" : blocks[0],
+                "count" : blocks[-1] - blocks[0] + 1,
+                "password" : self._volume["long_password"]
+            }
+        return request_info
+
+    ## After reading from relevant block devices. Sends the blocks of the
+    ## batches that finished, in order.
     ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
     ## to
     ## @returns next_state (int) next state of StateMachine. None if not
     ## ready to move on to next state.
     def after_read(self, entry):
-        if not self._disk_manager.check_if_finished():
+        finished = 0
+        while (
+            finished < len(self._batches) and
+            self.check_if_finished(entry, self._batches[finished])
+        ):
+            batch = self._batches[finished]
+            if (
+                batch["disk_manager"] is not None and
+                not batch["disk_manager"].check_common_status_code("200")
+            ):
+                raise RuntimeError(
+                    "Got bad status code from BDS"
+                )
+            if batch["disk_manager"] is not None:
+                # let rebuilds back off if they slow us down
+                entry.application_context["rebuild_scheduler"].add_latency(
+                    batch["disk_manager"].get_latency()
+                )
+            self.update_blocks(entry, batch)
+            finished += 1
+        self._batches = self._batches[finished:]
+
+        self.update_state(entry)
+        if len(self._batches) == 0 and self._current_block == self._last_block:
+            return ReadFromDiskService.FINAL_STATE
+        # Get ready for next blocks (if there are), either a batch finished
+        # or the client recieved some of the content
+        if finished == 0 and not self.can_read(entry):
             return None
-        if not self._disk_manager.check_common_status_code("200"):
-            raise RuntimeError(
-                "Got bad status code from BDS"
-            )
+        return ReadFromDiskService.READ_STATE
 
-        # if we have a pending block, send it back to client
-        # Get ready for next block (if there is)
+    ## Checks if a batch has finished reading. If one of the disks failed to
+    ## connect, the batch is read again without it.
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    ## @param batch (dict) the batch
+    ## @returns finished (bool) if the batch finished
+    def check_if_finished(self, entry, batch):
+        if batch["disk_manager"] is None:
+            return True
+        try:
+            return batch["disk_manager"].check_if_finished()
+        except util.DiskRefused as e:
+            self.add_refused(entry, e)
+            batch.update(
+                self.create_batch(entry, batch["first"], batch["last"])
+            )
+            return batch["disk_manager"] is None
 
-        # TODO: Too much in response_content
-        self.update_block()
-        self._current_block += 1
-        entry.state = constants.SEND_CONTENT_STATE
+    ## Updates the state of the entry. Entry sleeps until one of the batches
+    ## finishes, unless it has content to send.
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    def update_state(self, entry):
         if (
-            self._current_block ==
-            (
-                int(self._args["firstblock"][0]) +
-                int(self._args["blocks"][0])
-            )
+            len(self._batches) == 0 or
+            self.check_if_finished(entry, self._batches[0]) or
+            len(entry.data_to_send)
         ):
-            return ReadFromDiskService.FINAL_STATE
-        return ReadFromDiskService.READ_STATE
+            entry.state = constants.SEND_CONTENT_STATE
+        else:
+            entry.state = constants.SLEEPING_STATE
 
-    ## Function that updates the response content with the computed block.
-    def update_block(self):
-        client_responses = self._disk_manager.get_responses()
-        # regular block update
-        if self._block_mode == ReadFromDiskService.REGULAR:
-            self._response_content += (
-                client_responses[self._current_phy_UUID]["content"].ljust(
-                    constants.BLOCK_SIZE,
-                    chr(0)
+    ## Function that sends the computed blocks of a batch, each block is
+    ## added to the send buffer of the entry as is (blocks aren't joined).
+    ## The blocks we read or reconstruct are added to the block cache.
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    ## @param batch (dict) the batch that finished
+    def update_blocks(self, entry, batch):
+        block_cache = entry.application_context["block_cache"]
+        client_responses = {}
+        if batch["disk_manager"] is not None:
+            client_responses = batch["disk_manager"].get_responses()
+        for block_num in range(batch["first"], batch["last"]):
+            block_mode, phy_UUID = batch["block_modes"][block_num]
+
+            # cached block update
+            if block_mode == ReadFromDiskService.CACHED:
+                block = batch["cached"][block_num]
+
+            # regular block update
+            elif block_mode == ReadFromDiskService.REGULAR:
+                block = self.get_block(
+                    batch,
+                    client_responses,
+                    phy_UUID,
+                    block_num
+                )
+                block_cache.add_read_blocks(
+                    self._volume_UUID,
+                    block_num,
+                    {phy_UUID: block},
+                    batch["epoch"]
+                )
+
+            # reconstruct block update
+            elif block_mode == ReadFromDiskService.RECONSTRUCT:
+                blocks = []
+                for disk_UUID in self._disks.keys():
+                    if disk_UUID != phy_UUID:
+                        blocks.append(
+                            self.get_block(
+                                batch,
+                                client_responses,
+                                disk_UUID,
+                                block_num
+                            )
+                        )
+                block = disk_util.compute_missing_block(blocks)
+                # no need to reconstruct it again while the disk is offline
+                block_cache.add_read_blocks(
+                    self._volume_UUID,
+                    block_num,
+                    {phy_UUID: block},
+                    batch["epoch"]
                 )
-            )
 
-        # reconstruct block update
-        elif self._block_mode == ReadFromDiskService.RECONSTRUCT:
-            blocks = []
-            for disk_num, response in client_responses.items():
-                blocks.append(response["content"])
+            entry.data_to_send.append(
+                block.ljust(constants.BLOCK_SIZE, chr(0))
+            )
 
-            self._response_content += disk_util.compute_missing_block(
-                blocks).ljust(constants.BLOCK_SIZE, chr(0))
+    ## Returns a block from the extent a disk sent
+    ## @param batch (dict) the batch the block belongs to
+    ## @param client_responses (dict) responses from the Block Devices
+    ## @param disk_UUID (string) disk that sent the block
+    ## @param block_num (int) block_num of the block
+    ## @returns block (string) the block
+    def get_block(self, batch, client_responses, disk_UUID, block_num):
+        return disk_util.get_block_from_extent(
+            client_responses[disk_UUID]["content"],
+            batch["extents"][disk_UUID],
+            block_num
+        )
 
     ## Reading states for StateMachine
     STATES = [
@@ -305,6 +525,10 @@ class ReadFromDiskService(base_service.BaseService):
             ),
         }
         self._current_block = int(self._args["firstblock"][0])
+        self._last_block = (
+            int(self._args["firstblock"][0]) +
+            int(self._args["blocks"][0])
+        )
 
         # initialize state machine for reading
         first_state = ReadFromDiskService.READ_STATE
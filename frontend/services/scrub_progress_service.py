@@ -0,0 +1,86 @@
+#!/usr/bin/python
+## @package RAID5.frontend.services.scrub_progress_service
+## Module that defines the ScrubProgressService service class.
+## It displays the progress of the parity scrubs of the volumes.
+#
+
+from common.services import base_service
+from common.utilities import constants
+from common.utilities import html_util
+from common.utilities import util
+
+## Simple Frontend HTTP service that displays the progress and the
+## mismatches found by the parity scrub of each volume with HTML.
+class ScrubProgressService(base_service.BaseService):
+
+    ## Constructor for ScrubProgressService
+    # @param entry (pollable) the entry (probably @ref
+    # common.pollables.service_socket) using the service
+    # @param pollables (dict) All the pollables currently in the server
+    # @param args (dict) Arguments for this service
+    def __init__(self, entry, pollables, args):
+        super(ScrubProgressService, self).__init__(["Authorization"])
+
+    ## Name of the service
+    # needed for Frontend purposes, creating clients
+    # required by common.services.base_service.BaseService
+    # @returns (str) service name
+    @staticmethod
+    def get_name():
+        return "/scrub_progress"
+
+    ## Before pollable sends response status service function
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    ## @returns finished (bool) returns true if finished
+    def before_response_status(self, entry):
+        if not util.check_user_login(entry):
+            # login was unsucsessful, notify the user agent
+            self._response_status = 401
+
+    ## Before pollable sends response headers service function
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    ## @returns finished (bool) returns true if finished
+    def before_response_headers(self, entry):
+        if self._response_status == 200:
+            volumes = []
+            for volume_UUID, volume in sorted(
+                entry.application_context["volumes"].items()
+            ):
+                progress = volume.get("scrub")
+                if progress is None:
+                    continue
+                volumes.append(
+                    "<br>".join([
+                        "volume: %s" % volume_UUID,
+                        "state: %s" % constants.SCRUB_STATES[progress["state"]],
+                        "checked: %s / %s stripes (%.1f%%)" % (
+                            progress["checked"],
+                            progress["total"],
+                            100.0 * progress["checked"] /
+                            max(progress["total"], 1),
+                        ),
+                        "rate: %.2f MB/s" % progress["rate"],
+                        "mismatches: %s" % progress["mismatches"],
+                        "repaired: %s" % progress["repaired"],
+                        "unverified: %s" % progress["unverified"],
+                        "mismatched stripes: %s" % " ".join(
+                            str(block_num)
+                            for block_num in progress["mismatch_blocks"]
+                        ),
+                    ])
+                )
+            self._response_content = html_util.create_html_page(
+                "<br><br>".join(volumes) or "No volume was scrubbed",
+                constants.HTML_DEFAULT_HEADER,
+            )
+            self._response_headers = {
+                "Content-Length": "%s" % len(self._response_content),
+            }
+        else:
+            self._response_headers = {
+                "Content-Length": 0,
+                "WWW-Authenticate": "Basic realm='myRealm'",
+            }
+        return True
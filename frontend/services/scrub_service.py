@@ -0,0 +1,712 @@
+#!/usr/bin/python
+## @package RAID5.frontend.services.scrub_service
+## Module that implements the ScrubService class. Service verifies the parity
+## of all the stripes of a volume in the background.
+#
+
+import errno
+import logging
+import os
+import time
+
+from common.services import base_service
+from common.utilities import constants
+from common.utilities import html_util
+from frontend.utilities import disk_manager
+from frontend.utilities import disk_util
+from frontend.utilities import service_util
+from frontend.utilities import xor_engine
+from common.utilities.state_util import state
+from common.utilities.state_util import state_machine
+from frontend.services import scrub_progress_service
+
+## Frontend ScrubService. This service walks all the stripes of a volume,
+## reads the blocks of all the disks and checks that their XOR is zero.
+## Stripes that don't match are recorded, and if asked to, their parity
+## block is computed again from the data blocks. Like the rebuild of
+## @ref frontend.services.connect_service.ConnectService, scrubbing is done
+## after terminate, in the background, and uses the budget of the rebuild
+## scheduler.
+##
+## Only the extents that are allocated on any of the disks are read, holes
+## are zeros on all of them. The progress is kept in the volume (and in a
+## file in the checkpoint directory), so a scrub that was paused (or
+## stopped by a restart) continues where it stopped.
+##
+## A stripe that is written while we read it may look like a mismatch, so
+## every batch watches the stripes it reads in the stripe_watches of the
+## volume, and is read again if any of them was written. The same goes for
+## repairs, a repair that might have raced a write is verified again.
+class ScrubService(base_service.BaseService):
+
+    ## Times a batch is read again because it was written meanwhile, before
+    ## its mismatches are counted as unverified
+    MAX_RETRIES = 3
+
+    ## Max amount of mismatched block_nums kept in the progress
+    MAX_MISMATCH_BLOCKS = 100
+
+    ## Fields of the progress that are saved, in the order of the file
+    PROGRESS_FIELDS = (
+        "block",
+        "total",
+        "checked",
+        "mismatches",
+        "repaired",
+        "unverified",
+    )
+
+    ## Constructor for ScrubService
+    # @param entry (pollable) the entry (probably @ref
+    # common.pollables.service_socket) using the service
+    # @param pollables (dict) All the pollables currently in the server
+    # @param args (dict) Arguments for this service
+    def __init__(self, entry, pollables, args):
+        super(ScrubService, self).__init__(
+            [],
+            ["volume_UUID"],
+            args
+        )
+
+        ## Volume we're dealing with
+        self._volume = None
+
+        ## Disks we're dealing with
+        self._disks = None
+
+        ## If mismatched stripes are repaired
+        self._repair = False
+
+        ## Progress of the scrub, kept in the volume
+        self._progress = None
+
+        ## Allocated extents of the volume, sorted list of [first, count]
+        self._extents = []
+
+        ## Batch in flight, None if there is none. A dict with the keys:
+        ## first - block_num of the first stripe
+        ## count - amount of stripes
+        ## stage - GET_STAGE while reading, SET_STAGE while repairing
+        ## watch - watch of the stripes in the stripe_watches of the volume
+        ## disk_manager - Disk Manager that manages the batch's clients
+        self._batch = None
+
+        ## Times the current stripes were read again
+        self._retries = 0
+
+        ## If a repair of the current stripes has been sent
+        self._repaired = False
+
+        ## Timer that resumes the scrub once the disks have budget, None if
+        ## the scrub isn't throttled
+        self._throttle_timer = None
+
+        ## If the scrub was resumed by the throttle timer
+        self._resumed = False
+
+        ## Time the scrub started
+        self._scrub_start = None
+
+        ## Amount of stripes checked since the scrub started
+        self._stripes_checked = 0
+
+        ## Time of the last checkpoint of the progress
+        self._last_checkpoint = 0
+
+        ## StateMachine object
+        self._state_machine = None
+
+        ## pollables of the Frontend server
+        self._pollables = pollables
+
+        ## Disk Manager that manages all the clients
+        self._disk_manager = None
+
+    ## Name of the service
+    # needed for Frontend purposes, creating clients
+    # required by common.services.base_service.BaseService
+    # @returns (str) service name
+    @staticmethod
+    def get_name():
+        return "/scrub"
+
+    ## Checks the volume and sets up the progress of the scrub, continues
+    ## the last scrub if it didn't finish
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    def initial_setup(self, entry):
+        volume_UUID = self._args["volume_UUID"][0]
+        if (
+            volume_UUID not in entry.application_context["volumes"].keys() or
+            (
+                entry.application_context["volumes"][volume_UUID][
+                    "volume_state"
+                ] != constants.INITIALIZED
+            )
+        ):
+            raise RuntimeError("%s:\t Need to initialize volume" % (
+                entry,
+            ))
+        self._volume = entry.application_context["volumes"][volume_UUID]
+        self._disks = self._volume["disks"]
+        self._repair = self._args.get("repair", ["0"])[0] == "1"
+
+        for disk_UUID, disk in self._disks.items():
+            if disk["state"] != constants.ONLINE:
+                raise RuntimeError(
+                    "%s:\t Can't scrub, disk %s is not online" % (
+                        entry,
+                        disk_UUID
+                    )
+                )
+
+        progress = self._volume.get("scrub")
+        if progress is None:
+            progress = self.load_progress(entry)
+        if progress is not None:
+            if progress["state"] == constants.SCRUB_RUNNING:
+                raise RuntimeError("%s:\t Volume is already being scrubbed" % (
+                    entry,
+                ))
+            if progress["state"] == constants.SCRUB_DONE:
+                progress = None
+        if progress is None:
+            progress = {
+                "block": 0,
+                "total": 0,
+                "checked": 0,
+                "mismatches": 0,
+                "mismatch_blocks": [],
+                "repaired": 0,
+                "unverified": 0,
+                "rate": 0,
+            }
+        progress["state"] = constants.SCRUB_RUNNING
+        self._progress = self._volume["scrub"] = progress
+
+    ## Before pollable sends response status service function
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    ## @returns finished (bool) returns true if finished
+    def before_response_status(self, entry):
+        self.initial_setup(entry)
+
+        # show the progress
+        self._response_content = html_util.create_html_page(
+            "",
+            constants.HTML_DISPLAY_HEADER,
+            0,
+            scrub_progress_service.ScrubProgressService.get_name(),
+        )
+        self._response_headers = {
+            "Content-Length": "%s" % len(self._response_content),
+        }
+        return True
+
+    # SCRUB PART, DONE BEFORE TERMINATE (AFTER CLOSE)
+
+    ## Scrubbing States
+    (
+        ALLOCATION_STATE,
+        SCRUB_STATE,
+        FINAL_STATE
+    ) = range(3)
+
+    ## Stages of a scrub batch
+    (
+        GET_STAGE,
+        SET_STAGE
+    ) = range(2)
+
+    # STATE FUNCTIONS:
+
+    ## Before we find the allocated extents of the volume. Requests the
+    ## allocation maps of all the disks.
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    ## @returns epsilon_path (bool) if there is no need for input
+    def before_allocation(self, entry):
+        self._disk_manager = disk_manager.DiskManager(
+            self._disks,
+            self._pollables,
+            entry,
+            service_util.create_get_allocation_contexts(
+                self._disks,
+                {
+                    disk_UUID: {
+                        "password" : self._volume["long_password"]
+                    }
+                    for disk_UUID in self._disks.keys()
+                }
+            )
+        )
+        entry.state = constants.SLEEPING_STATE
+        return False  # need input, not an epsilon_path
+
+    ## After we got the allocation maps of all the disks. Merges them to the
+    ## extents that we scrub.
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    ## @returns next_state (int) next state of StateMachine. None if not
+    ## ready to move on to next state.
+    def after_allocation(self, entry):
+        if not self._disk_manager.check_if_finished():
+            return None
+        if not self._disk_manager.check_common_status_code("200"):
+            raise RuntimeError(
+                "Block Device Server sent a bad status code"
+            )
+
+        extents = []
+        for disk_UUID, response in self._disk_manager.get_responses().items():
+            fields = [
+                int(field) for field in
+                response["content"].split(constants.MY_SEPERATOR)
+                if field != ""
+            ]
+            for index in range(0, len(fields) - 1, 2):
+                extents.append([fields[index], fields[index + 1]])
+        extents.sort()
+
+        self._extents = []
+        for first, count in extents:
+            if (
+                len(self._extents) and
+                self._extents[-1][0] + self._extents[-1][1] >= first
+            ):
+                self._extents[-1][1] = max(
+                    self._extents[-1][1],
+                    first + count - self._extents[-1][0]
+                )
+            else:
+                self._extents.append([first, count])
+
+        self._progress["total"] = sum(
+            count for first, count in self._extents
+        )
+        return self.next_state(entry)
+
+    ## Before we scrub the next stripes. Sends a batch of up to
+    ## MAX_EXTENT_BLOCKS stripes, if the disks have budget.
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    ## @returns epsilon_path (bool) if there is no need for input
+    def before_scrub(self, entry):
+        scheduler = entry.application_context["rebuild_scheduler"]
+        delay = scheduler.get_delay(self._disks.keys())
+        if delay > 0:
+            self.throttle(entry, delay)
+        else:
+            self.create_batch(entry)
+        entry.state = constants.SLEEPING_STATE
+        return False  # need input, not an epsilon_path
+
+    ## Creates a batch that reads the next stripes from all the disks
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    def create_batch(self, entry):
+        first, count = self.get_next_stripes()
+        scheduler = entry.application_context["rebuild_scheduler"]
+        for disk_UUID in self._disks.keys():
+            scheduler.consume(disk_UUID, count)
+
+        # writes of the stripes while we have them mark the watch
+        watch = {
+            "first": first,
+            "last": first + count,
+            "written": False,
+        }
+        for block_num in self._volume["stripes_in_flight"].keys():
+            if first <= block_num < first + count:
+                watch["written"] = True
+        self._volume["stripe_watches"].append(watch)
+
+        self._batch = {
+            "first": first,
+            "count": count,
+            "stage": ScrubService.GET_STAGE,
+            "watch": watch,
+        }
+        self._batch["disk_manager"] = disk_manager.DiskManager(
+            self._disks,
+            self._pollables,
+            entry,
+            service_util.create_get_blocks_contexts(
+                self._disks,
+                {
+                    disk_UUID: {
+                        "first": first,
+                        "count": count,
+                        "password": self._volume["long_password"],
+                    }
+                    for disk_UUID in self._disks.keys()
+                }
+            )
+        )
+
+    ## After the batch was read or repaired
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    ## @returns next_state (int) next state of StateMachine. None if not
+    ## ready to move on to next state.
+    def after_scrub(self, entry):
+        resumed, self._resumed = self._resumed, False
+        if self._batch is None:
+            # throttled, wait for the timer
+            if not resumed:
+                return None
+            return self.next_state(entry)
+
+        if not self._batch["disk_manager"].check_if_finished():
+            return None
+        if not self._batch["disk_manager"].check_common_status_code("200"):
+            raise RuntimeError(
+                "Block Device Server sent a bad status code"
+            )
+
+        if self._batch["stage"] == ScrubService.GET_STAGE:
+            self.verify_batch(entry)
+            if self._batch is not None:
+                # repairing
+                return None
+        else:
+            # repaired, unless it was written meanwhile
+            self.end_batch(not self._batch["watch"]["written"])
+        return self.next_state(entry)
+
+    ## Verifies the stripes of a batch. Stripes that don't match are
+    ## recorded and repaired. The batch is read again if any of its stripes
+    ## was written while we read it.
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    def verify_batch(self, entry):
+        first = self._batch["first"]
+        count = self._batch["count"]
+        responses = self._batch["disk_manager"].get_responses()
+        result = xor_engine.xor(
+            [response["content"] for response in responses.values()],
+            count * constants.BLOCK_SIZE
+        )
+        mismatches = []
+        if result.count(chr(0)) != len(result):
+            for block_num in range(first, first + count):
+                block = disk_util.get_block_from_extent(
+                    result,
+                    first,
+                    block_num
+                )
+                if block.count(chr(0)) != len(block):
+                    mismatches.append(block_num)
+
+        if len(mismatches) == 0:
+            self.end_batch(True)
+            return
+
+        if self._batch["watch"]["written"]:
+            # might be a write we read half of, read again
+            self._retries += 1
+            if self._retries <= ScrubService.MAX_RETRIES or self._repaired:
+                self.end_batch(False)
+                return
+            self._progress["unverified"] += len(mismatches)
+            self.end_batch(True)
+            return
+
+        if not self._repaired:
+            self._progress["mismatches"] += len(mismatches)
+            self._progress["mismatch_blocks"] = (
+                self._progress["mismatch_blocks"] + mismatches
+            )[:ScrubService.MAX_MISMATCH_BLOCKS]
+            logging.error(
+                "%s:\t Parity mismatch in volume %s, stripes: %s" % (
+                    entry,
+                    self._volume["volume_UUID"],
+                    mismatches,
+                )
+            )
+        if not self._repair:
+            self.end_batch(True)
+            return
+
+        # the parity block that makes the XOR of the stripe zero
+        request_info = {}
+        for block_num in mismatches:
+            parity_disk_UUID = disk_util.get_parity_disk_UUID(
+                self._disks,
+                block_num
+            )
+            request_info.setdefault(
+                parity_disk_UUID,
+                {
+                    "blocks": [],
+                    "password": self._volume["long_password"],
+                }
+            )["blocks"].append([
+                block_num,
+                xor_engine.xor(
+                    [
+                        disk_util.get_block_from_extent(
+                            responses[parity_disk_UUID]["content"],
+                            first,
+                            block_num
+                        ),
+                        disk_util.get_block_from_extent(
+                            result,
+                            first,
+                            block_num
+                        ),
+                    ],
+                    constants.BLOCK_SIZE
+                )
+            ])
+            entry.application_context["block_cache"].invalidate_stripe(
+                self._volume["volume_UUID"],
+                block_num
+            )
+        for disk_UUID, info in request_info.items():
+            entry.application_context["rebuild_scheduler"].consume(
+                disk_UUID,
+                len(info["blocks"])
+            )
+
+        if not self._repaired:
+            self._progress["repaired"] += len(mismatches)
+        self._repaired = True
+        self._batch["stage"] = ScrubService.SET_STAGE
+        self._batch["disk_manager"] = disk_manager.DiskManager(
+            self._disks,
+            self._pollables,
+            entry,
+            service_util.create_set_blocks_contexts(
+                self._disks,
+                request_info
+            )
+        )
+
+    ## Ends the batch in flight
+    ## @param done (bool) if the stripes of the batch are done, otherwise
+    ## they are read again
+    def end_batch(self, done):
+        self._volume["stripe_watches"].remove(self._batch["watch"])
+        if done:
+            self._progress["block"] = (
+                self._batch["first"] + self._batch["count"]
+            )
+            self._progress["checked"] += self._batch["count"]
+            self._stripes_checked += self._batch["count"]
+            self._progress["rate"] = (
+                float(self._stripes_checked) * len(self._disks) *
+                constants.BLOCK_SIZE /
+                max(time.time() - self._scrub_start, 0.001) / 2**20
+            )
+            self._retries = 0
+            self._repaired = False
+        self._batch = None
+
+    ## Returns the next stripes to scrub, in the allocated extents
+    ## @returns stripes (tuple) (first, count), None if there are no more
+    def get_next_stripes(self):
+        for first, count in self._extents:
+            last = first + count
+            if last > self._progress["block"]:
+                first = max(first, self._progress["block"])
+                return first, min(constants.MAX_EXTENT_BLOCKS, last - first)
+        return None
+
+    ## Returns the next state once a batch ended or was throttled. Pauses
+    ## the scrub if a disk went offline, and ends it if all the stripes were
+    ## scrubbed.
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    ## @returns next_state (int) next state of StateMachine
+    def next_state(self, entry):
+        if time.time() - self._last_checkpoint > (
+            constants.SCRUB_CHECKPOINT_INTERVAL
+        ):
+            self.save_progress(entry)
+
+        for disk_UUID, disk in self._disks.items():
+            if disk["state"] != constants.ONLINE:
+                logging.info(
+                    "%s:\t Paused scrub of volume %s, disk %s is not online" % (
+                        entry,
+                        self._volume["volume_UUID"],
+                        disk_UUID,
+                    )
+                )
+                self.finish(entry, constants.SCRUB_PAUSED)
+                return ScrubService.FINAL_STATE
+
+        if self.get_next_stripes() is None:
+            logging.info(
+                "%s:\t Scrubbed volume %s, %s stripes, %s mismatches" % (
+                    entry,
+                    self._volume["volume_UUID"],
+                    self._progress["checked"],
+                    self._progress["mismatches"],
+                )
+            )
+            self.finish(entry, constants.SCRUB_DONE)
+            return ScrubService.FINAL_STATE
+        return ScrubService.SCRUB_STATE
+
+    ## Ends the scrub, a paused scrub continues from its progress the next
+    ## time, a finished one removes its progress file
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    ## @param scrub_state (int) SCRUB_PAUSED or SCRUB_DONE
+    def finish(self, entry, scrub_state):
+        if self._throttle_timer is not None:
+            self._throttle_timer.cancel()
+            self._throttle_timer = None
+        if self._batch is not None:
+            self._volume["stripe_watches"].remove(self._batch["watch"])
+            self._batch = None
+        self._progress["state"] = scrub_state
+        file_name = self.get_progress_file(entry)
+        if scrub_state != constants.SCRUB_DONE:
+            self.save_progress(entry)
+        elif file_name is not None:
+            try:
+                os.remove(file_name)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+        entry.state = constants.CLOSING_STATE
+
+    ## Returns the name of the file that keeps the progress of the scrub
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    ## @returns file_name (string) None if checkpoints are disabled
+    def get_progress_file(self, entry):
+        if not entry.application_context["checkpoint_dir"]:
+            return None
+        return os.path.join(
+            entry.application_context["checkpoint_dir"],
+            "%s.scrub" % self._volume["volume_UUID"]
+        )
+
+    ## Saves the progress of the scrub to its file, so it continues from
+    ## there if the frontend restarts
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    def save_progress(self, entry):
+        self._last_checkpoint = time.time()
+        file_name = self.get_progress_file(entry)
+        if file_name is None:
+            return
+        if not os.path.isdir(os.path.dirname(file_name)):
+            os.makedirs(os.path.dirname(file_name))
+        fields = [
+            str(self._progress[name]) for name in ScrubService.PROGRESS_FIELDS
+        ] + [str(block_num) for block_num in self._progress["mismatch_blocks"]]
+        with open(file_name + ".tmp", "w") as f:
+            f.write(constants.MY_SEPERATOR.join(fields))
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(file_name + ".tmp", file_name)
+
+    ## Loads the progress of a scrub that didn't finish from its file
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    ## @returns progress (dict) the progress, paused, None if there is none
+    def load_progress(self, entry):
+        file_name = self.get_progress_file(entry)
+        if file_name is None:
+            return None
+        try:
+            with open(file_name, "r") as f:
+                fields = f.read().split(constants.MY_SEPERATOR)
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return None
+        try:
+            fields = [int(field) for field in fields]
+        except ValueError:
+            return None
+        if len(fields) < len(ScrubService.PROGRESS_FIELDS):
+            return None
+        progress = dict(zip(ScrubService.PROGRESS_FIELDS, fields))
+        progress["mismatch_blocks"] = fields[
+            len(ScrubService.PROGRESS_FIELDS):
+        ]
+        progress["state"] = constants.SCRUB_PAUSED
+        progress["rate"] = 0
+        return progress
+
+    ## Resumes the scrub after a delay, unless it is already going to
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    ## @param delay (float) seconds until the scrub resumes
+    def throttle(self, entry, delay):
+        if self._throttle_timer is not None:
+            return
+        self._throttle_timer = entry.application_context[
+            "timers"
+        ].call_later(delay, lambda: self.on_resume(entry))
+
+    ## Called when the throttle timer goes off, the disks have budget again.
+    ## Let StateMachine send the next batch.
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    def on_resume(self, entry):
+        self._throttle_timer = None
+        self._resumed = True
+        self.run_machine(entry)
+
+    ## Runs the state machine, pauses the scrub if it fails (a disk went
+    ## away in the middle of a batch), so it can be started again later
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    def run_machine(self, entry):
+        try:
+            # pass args to the machine, will use *args to pass them on
+            self._state_machine.run_machine((self, entry))
+        except Exception:
+            if self._progress["state"] == constants.SCRUB_RUNNING:
+                self.finish(entry, constants.SCRUB_PAUSED)
+            raise
+
+    ## Scrubbing states for StateMachine
+    STATES = [
+        state.State(
+            ALLOCATION_STATE,
+            [SCRUB_STATE, FINAL_STATE],
+            before_allocation,
+            after_allocation,
+        ),
+        state.State(
+            SCRUB_STATE,
+            [SCRUB_STATE, FINAL_STATE],
+            before_scrub,
+            after_scrub,
+        ),
+        state.State(
+            FINAL_STATE,
+            [FINAL_STATE],
+        ),
+    ]
+
+    ## Before pollable terminates service function
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    ## @returns finished (bool) returns true if finished
+    def before_terminate(self, entry):
+        self._scrub_start = time.time()
+        self._last_checkpoint = self._scrub_start
+
+        # create scrub state machine
+        self._state_machine = state_machine.StateMachine(
+            ScrubService.STATES,
+            ScrubService.STATES[ScrubService.ALLOCATION_STATE],
+            ScrubService.STATES[ScrubService.FINAL_STATE]
+        )
+        self.run_machine(entry)
+
+    ## Called when BDSClientSocket invoke the on_finsh method to wake up
+    ## the ServiceSocket. Let StateMachine handle the wake up call.
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    def on_finish(self, entry):
+        self.run_machine(entry)
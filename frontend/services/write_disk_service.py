@@ -17,6 +17,7 @@ from common.services import form_service
 from common.utilities import constants
 from common.utilities import util
 from frontend.pollables import bds_client_socket
+from frontend.utilities import cache
 from frontend.utilities import disk_util
 from frontend.utilities import disk_manager
 from frontend.utilities import service_util
@@ -33,6 +34,11 @@ from frontend.utilities import service_util
 ## it simpler to build a custom state machine.
 ## For each writing operation, he parity needs to be updated too. If one of
 ## these is offline, we shall update the cache we have for each disk.
+## When a whole stripe is written (always when there is a single logical disk,
+## or when writing with the stripe layout), the parity is computed from the
+## new blocks and nothing is read.
+## Blocks that are in the block cache aren't read again, and the block cache
+## is updated with the blocks we have written once the write has succeeded.
 ## Most complex class in the project, requires many operations.
 class WriteToDiskService(
         form_service.FileFormService,
@@ -46,9 +52,24 @@ class WriteToDiskService(
     ## Reading Modes
     (
         REGULAR,
-        RECONSTRUCT
+        RECONSTRUCT,
+        FULL_STRIPE
+    ) = range(3)
+
+    ## Layouts of the file. DISK_LAYOUT writes the file to a single logical
+    ## disk, STRIPE_LAYOUT writes it across all the logical disks, stripe
+    ## after stripe
+    (
+        DISK_LAYOUT,
+        STRIPE_LAYOUT
     ) = range(2)
 
+    ## Layout names, as recieved in the layout field of the form
+    LAYOUT_NAMES = {
+        "disk": DISK_LAYOUT,
+        "stripe": STRIPE_LAYOUT,
+    }
+
     ## Constructor for WriteToDiskService
     # @param entry (pollable) the entry (probably @ref
     # common.pollables.service_socket) using the service
@@ -72,32 +93,58 @@ class WriteToDiskService(
         ## Finished writing data
         self._finished_data = True
 
-        ## Mode in which we will write
-        self._block_mode = WriteToDiskService.REGULAR
-
         ## Current writing state
         self._block_state = WriteToDiskService.READ_STATE
 
-        ## Current block data
-        self._block_data = ""
+        ## Blocks we're writing, list of [block_num, disk_num, block_data]
+        self._blocks = []
 
-        ## Current block num
+        ## First block num requested
         self._current_block = None
 
+        ## Layout of the file
+        self._layout = WriteToDiskService.DISK_LAYOUT
+
+        ## Position of the next block of the file in the layout
+        self._position = None
+
+        ## Writing mode and faulty disk of each stripe we're writing,
+        ## block_num : (block_mode, faulty_disk_UUID)
+        self._block_modes = {}
+
+        ## First block_num of the extent we requested from each disk,
+        ## disk_UUID : block_num
+        self._extents = {}
+
+        ## Blocks we took from the block cache instead of reading,
+        ## block_num : { disk_UUID : block_data }
+        self._cached_blocks = {}
+
+        ## Blocks we're writing, added to the block cache once written,
+        ## block_num : { disk_UUID : block_data }
+        self._written_blocks = {}
+
+        ## Blocks of disks being rebuilt in the stripes we're writing, that
+        ## need to be rebuilt again once written, list of
+        ## (disk_UUID, block_num)
+        self._rebuild_blocks = []
+
         ## UUID of volume we're dealing with
         self._volume_UUID = None
 
         ## Logical disk num of disk we're writing to
         self._disk_num = None
 
-        ## UUID of the physical disk we're writing to
-        self._current_phy_UUID = None
+        ## UUIDs of faulty disks we tried writing to
+        self._faulty_disk_UUIDs = []
 
-        ## UUID of the physical parity disk we're writing to
-        self._current_phy_parity_UUID = None
+        ## UUIDs of faulty disks that were being rebuilt
+        self._rebuilding_disk_UUIDs = []
 
-        ## UUID of faulty disk we tried writing to
-        self._faulty_disk_UUID = None
+        ## Stripes we're writing, counted in the stripes_in_flight of the
+        ## volume until the write has finished, so the scrubber knows they
+        ## might not match yet
+        self._stripes_in_flight = []
 
         ## Volume we're dealing with
         self._volume = None
@@ -183,6 +230,19 @@ class WriteToDiskService(
                     "%s:\t Invalid first block requested: %s" %
                     (entry, self._current_block))
 
+        # check validity of layout (if finished getting)
+        if next_state and self._arg_name == "layout":
+            if (
+                self._args["layout"][0] not in
+                WriteToDiskService.LAYOUT_NAMES.keys()
+            ):
+                raise RuntimeError(
+                    "%s:\t Invalid layout: %s" %
+                    (self._entry, self._args["layout"][0]))
+            self._layout = WriteToDiskService.LAYOUT_NAMES[
+                self._args["layout"][0]
+            ]
+
     ## Override file handle from FileFormService. This is where we split the
     ## file content into blocks and send them to the relevant disks.
     ## @param buf (string) buf read from socket
@@ -194,51 +254,132 @@ class WriteToDiskService(
         self._rest_of_data += buf
         self._finished_data = next_state
 
+        if self.next_blocks():
+            self.handle_blocks()
+
+    ## Returns where a block of the file is written, based on the layout.
+    ## In DISK_LAYOUT the position is the block_num in the logical disk, in
+    ## STRIPE_LAYOUT the position counts the data blocks of the stripes.
+    ## @param position (int) position of the block in the layout
+    ## @returns block_num, disk_num (tuple) stripe and logical disk of block
+    def get_location(self, position):
+        if self._layout == WriteToDiskService.STRIPE_LAYOUT:
+            return (
+                position // (len(self._disks) - 1),
+                position % (len(self._disks) - 1)
+            )
+        return position, self._disk_num
+
+    ## Takes the next blocks to write out of the data we have recieved. Waits
+    ## until there are MAX_EXTENT_BLOCKS blocks (or the file has ended), so
+    ## that the blocks are written in as few requests as possible.
+    ## @returns got_blocks (bool) if there are blocks to write
+    def next_blocks(self):
+        blocks = len(self._rest_of_data) // constants.BLOCK_SIZE
+        if self._finished_data:
+            # the last block might not be full
+            blocks = (
+                len(self._rest_of_data) + constants.BLOCK_SIZE - 1
+            ) // constants.BLOCK_SIZE
+        elif blocks < constants.MAX_EXTENT_BLOCKS:
+            return False
+        blocks = min(blocks, constants.MAX_EXTENT_BLOCKS)
+        if blocks == 0:
+            return False
+
+        if self._position is None:
+            # first blocks, start from the first block requested
+            self._position = self._current_block
+            if self._layout == WriteToDiskService.STRIPE_LAYOUT:
+                self._position = (
+                    self._current_block * (len(self._disks) - 1) +
+                    self._disk_num
+                )
+
+        # don't split a stripe between two writes if there is more to write
         if (
-            len(self._rest_of_data) >= constants.BLOCK_SIZE or
-            (self._finished_data and self._rest_of_data != "")
+            self._layout == WriteToDiskService.STRIPE_LAYOUT and
+            blocks * constants.BLOCK_SIZE < len(self._rest_of_data)
         ):
-            self._block_data, self._rest_of_data = (
-                self._rest_of_data[:constants.BLOCK_SIZE],
-                self._rest_of_data[constants.BLOCK_SIZE:]
+            blocks -= min(
+                blocks - 1,
+                (self._position + blocks) % (len(self._disks) - 1)
             )
-            self._block_data = self._block_data.ljust(
-                constants.BLOCK_SIZE, chr(0))
-            self.handle_block()
+
+        self._blocks = []
+        for index in range(blocks):
+            block_num, disk_num = self.get_location(self._position + index)
+            self._blocks.append([
+                block_num,
+                disk_num,
+                self._rest_of_data[
+                    index * constants.BLOCK_SIZE:
+                    (index + 1) * constants.BLOCK_SIZE
+                ].ljust(constants.BLOCK_SIZE, chr(0))
+            ])
+        self._rest_of_data = self._rest_of_data[
+            blocks * constants.BLOCK_SIZE:
+        ]
+        return True
+
+    ## Returns the blocks we're writing, grouped by stripe
+    ## @returns stripes (dict) block_num : { disk_num : block_data }
+    def get_stripes(self):
+        stripes = {}
+        for block_num, disk_num, block_data in self._blocks:
+            stripes.setdefault(block_num, {})[disk_num] = block_data
+        return stripes
 
     ## Called when BDSClientSocket invoke the on_finish method to wake up
-    ## the ServiceSocket. Read/Write (move on to next state)
+    ## the ServiceSocket. Read/Write (move on to next state). If a disk failed
+    ## to connect, the blocks are handled again without it. Writing the
+    ## stripes again is safe, the parity is computed from what was written.
     ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
     ## to
     def on_finish(self, entry):
-        if not self._disk_manager.check_if_finished():
+        try:
+            if not self._disk_manager.check_if_finished():
+                return
+        except util.DiskRefused as disk_error:
+            self.add_faulty_disk(disk_error)
+            self.handle_blocks()
             return
         if not self._disk_manager.check_common_status_code("200"):
             raise RuntimeError(
                 "Got bad status code from BDS"
             )
+        # let rebuilds back off if they slow us down
+        entry.application_context["rebuild_scheduler"].add_latency(
+            self._disk_manager.get_latency()
+        )
 
         if self._block_state == WriteToDiskService.READ_STATE:
             self._block_state = WriteToDiskService.WRITE_STATE
-            self.handle_block()
+            self.handle_blocks()
             return
         elif self._block_state == WriteToDiskService.WRITE_STATE:
-            # prepare for next block, start regularly:
-            self._block_mode = WriteToDiskService.REGULAR
-            self._faulty_disk_UUID = None
+            self.release_stripes()
+
+            # blocks are on the disks, the cache can have them now
+            for block_num, blocks in self._written_blocks.items():
+                self._entry.application_context[
+                    "block_cache"
+                ].add_written_blocks(self._volume_UUID, block_num, blocks)
+
+            # the rebuild may have read the stripes before they were written
+            for disk_UUID, block_num in self._rebuild_blocks:
+                disk_cache = self._disks[disk_UUID]["cache"]
+                if (
+                    self._disks[disk_UUID]["state"] == constants.REBUILD and
+                    disk_cache.check_if_add(block_num)
+                ):
+                    disk_cache.add_block(block_num, None)
+
+            # prepare for next blocks, start regularly:
             self._block_state = WriteToDiskService.READ_STATE
-            self._current_block += 1
-            if (
-                len(self._rest_of_data) >= constants.BLOCK_SIZE or
-                (self._finished_data and self._rest_of_data != "")
-            ):
-                self._block_data, self._rest_of_data = (
-                    self._rest_of_data[:constants.BLOCK_SIZE],
-                    self._rest_of_data[constants.BLOCK_SIZE:]
-                )
-                self._block_data = self._block_data.ljust(
-                    constants.BLOCK_SIZE, chr(0))
-                self.handle_block()
+            self._position += len(self._blocks)
+            if self.next_blocks():
+                self.handle_blocks()
                 return
 
         # if we reached here, we are ready to continue
@@ -247,123 +388,252 @@ class WriteToDiskService(
         else:
             entry.state = constants.SEND_STATUS_STATE
 
-    ## Hanlde a block that has been read from the file.
-    ## First try to write normally. If problem arises, move on to RECONSTRUCT
-    ## mode
-    def handle_block(self):
-        self._current_phy_UUID = disk_util.get_physical_disk_UUID(
-            self._disks,
-            self._disk_num,
-            self._current_block
-        )
-        self._current_phy_parity_UUID = disk_util.get_parity_disk_UUID(
-            self._disks,
-            self._current_block
+    ## Counts a stripe we're writing in the stripes_in_flight of the volume,
+    ## and marks the stripe_watches of the volume that watch it as written
+    ## @param block_num (int) block_num of the stripe
+    def hold_stripe(self, block_num):
+        stripes_in_flight = self._volume["stripes_in_flight"]
+        stripes_in_flight[block_num] = stripes_in_flight.get(block_num, 0) + 1
+        self._stripes_in_flight.append(block_num)
+        for watch in self._volume["stripe_watches"]:
+            if watch["first"] <= block_num < watch["last"]:
+                watch["written"] = True
+
+    ## Stops counting the stripes we were writing in the stripes_in_flight of
+    ## the volume
+    def release_stripes(self):
+        stripes_in_flight = self._volume["stripes_in_flight"]
+        for block_num in self._stripes_in_flight:
+            stripes_in_flight[block_num] -= 1
+            if stripes_in_flight[block_num] == 0:
+                del stripes_in_flight[block_num]
+        self._stripes_in_flight = []
+
+    ## Before pollable terminates service function. A write that didn't
+    ## finish doesn't hold its stripes anymore.
+    ## @param entry (@ref common.pollables.pollable.Pollable) entry we belong
+    ## to
+    def before_terminate(self, entry):
+        if self._volume is not None:
+            self.release_stripes()
+
+    ## Hanlde the blocks that have been read from the file. Stripes that are
+    ## written whole are handled in FULL_STRIPE mode, and need no reading.
+    ## Stripes in which the disk of a block or the parity disk is offline
+    ## (or refuses to connect) are handled in RECONSTRUCT mode, the rest
+    ## regularly. If a disk refuses to connect, we start reading the blocks
+    ## again.
+    def handle_blocks(self):
+        # First check availablity
+        online, offline = util.sort_disks(
+            self._entry.application_context["available_disks"]
         )
-
-        # first try writing the block regularly
-        try:
-            # First check availablity
-            online, offline = util.sort_disks(
-                self._entry.application_context["available_disks"]
-            )
-            if self._current_phy_UUID not in online.keys():
-                raise util.DiskRefused(self._current_phy_UUID)
-
-            # step 1 - get current_block and parity block contents
-            # step 2 - calculate new blocks to write
-            if self._block_mode == WriteToDiskService.REGULAR:
+        for disk_UUID in self._disks.keys():
+            # a disk that is being rebuilt isn't up to date yet
+            if (
+                (
+                    disk_UUID not in online.keys() or
+                    self._disks[disk_UUID]["state"] != constants.ONLINE
+                ) and
+                disk_UUID not in self._faulty_disk_UUIDs
+            ):
+                self._faulty_disk_UUIDs.append(disk_UUID)
+                if self._disks[disk_UUID]["state"] == constants.REBUILD:
+                    self._rebuilding_disk_UUIDs.append(disk_UUID)
+                self.check_offline_cache(disk_UUID)
+
+        while True:
+            try:
+                # step 1 - get current blocks and parity blocks contents
+                # step 2 - calculate new blocks to write
                 if self._block_state == WriteToDiskService.READ_STATE:
-                    contexts = self.contexts_for_regular_get_block()
+                    request_info = self.create_get_request_info()
+                    if len(request_info) == 0:
+                        # only full stripes, nothing to read
+                        self._block_state = WriteToDiskService.WRITE_STATE
+                        continue
+                    contexts = service_util.create_get_blocks_contexts(
+                        self._disks,
+                        request_info
+                    )
                 else:
-                    contexts = self.contexts_for_regular_set_block()
+                    contexts = service_util.create_set_blocks_contexts(
+                        self._disks,
+                        self.create_set_request_info()
+                    )
                 self._disk_manager = disk_manager.DiskManager(
                     self._disks,
                     self._pollables,
                     self._entry,
                     contexts
                 )
+                return
 
-        except util.DiskRefused as disk_error:
-            logging.error(
-                (
-                    "%s:\t Got: %s, trying to connect with RECONSTRUCT"
-                ) % (
+            except util.DiskRefused as disk_error:
+                self.add_faulty_disk(disk_error)
+
+    ## Adds a disk that refused to connect to the faulty disks, its stripes
+    ## are handled in RECONSTRUCT mode from now on
+    ## @param disk_error (@ref common.utilities.util.DiskRefused) the error
+    def add_faulty_disk(self, disk_error):
+        logging.error(
+            (
+                "%s:\t Got: %s, trying to connect with RECONSTRUCT"
+            ) % (
+                self._entry,
+                disk_error
+            )
+        )
+        if disk_error.disk_UUID in self._faulty_disk_UUIDs:
+            raise RuntimeError(
+                "%s:\t Couldn't connect to %s, giving up" % (
                     self._entry,
-                    disk_error
+                    disk_error.disk_UUID
                 )
             )
-            self._faulty_disk_UUID = disk_error.disk_UUID
-            self._block_mode = WriteToDiskService.RECONSTRUCT
-            # start reading from the beginning again:
-            self._block_state = WriteToDiskService.READ_STATE
+        self._faulty_disk_UUIDs.append(disk_error.disk_UUID)
+        self.check_offline_cache(disk_error.disk_UUID)
+        # start reading from the beginning again:
+        self._block_state = WriteToDiskService.READ_STATE
 
-        # if didn't work, try with reconstruct
-        try:
-            # step 1 - get all other non-parity blocks
-            # step 2 - XOR and write in parity
-            if self._block_mode == WriteToDiskService.RECONSTRUCT:
-                if self._block_state == WriteToDiskService.READ_STATE:
-                    contexts = self.contexts_for_reconstruct_get_block()
-                else:
-                    contexts = self.contexts_for_reconstruct_set_block()
+    ## Makes sure a faulty disk keeps the blocks we write to it. A disk that
+    ## died without being disconnected (or refused to connect) still has a
+    ## cache in DORMANT_MODE, which doesn't keep blocks. The disk is set
+    ## offline with a cache in CACHE_MODE, like a disconnected disk, so it is
+    ## rebuilt once it is connected again.
+    ## @param disk_UUID (string) UUID of the faulty disk
+    def check_offline_cache(self, disk_UUID):
+        disk = self._disks[disk_UUID]
+        if disk["cache"].mode != cache.Cache.DORMANT_MODE:
+            return
+        logging.error(
+            "%s:\t Disk %s is faulty, caching its blocks" % (
+                self._entry,
+                disk_UUID
+            )
+        )
+        disk["state"] = constants.OFFLINE
+        disk["cache"].close()
+        disk["cache"] = cache.create_offline_cache(
+            self._entry.application_context,
+            disk_UUID,
+            cache.Cache.CACHE_MODE
+        )
+        self._entry.application_context["block_cache"].invalidate_volume(
+            self._volume_UUID
+        )
 
-                self._disk_manager = disk_manager.DiskManager(
-                    self._disks,
-                    self._pollables,
-                    self._entry,
-                    contexts
+    # Getting the blocks we want from block devices:
+    # GET BLOCKS, REGULAR AND RECONSTRUCT
+
+    ## create the request_info for reading the current stripes. For each
+    ## stripe in REGULAR mode we need the blocks we write and the parity
+    ## block (unless they are in the block cache), and for each stripe in
+    ## RECONSTRUCT mode we need the block from all the disks that are not
+    ## faulty. Each disk sends a single extent.
+    ## @returns request_info (dict) for get_blocks contexts
+    def create_get_request_info(self):
+        block_cache = self._entry.application_context["block_cache"]
+        self._block_modes = {}
+        self._cached_blocks = {}
+        disk_blocks = {}
+        stripes = self.get_stripes()
+        for block_num in sorted(stripes.keys()):
+            # a full stripe's parity is computed from the new blocks alone
+            if len(stripes[block_num]) == len(self._disks) - 1:
+                self._block_modes[block_num] = (
+                    WriteToDiskService.FULL_STRIPE,
+                    None
                 )
+                continue
 
-        except util.DiskRefused as disk_error:
-            # nothing to do
-            logging.error(
-                (
-                    "%s:\t Couldn't connect to two of the" +
-                    "BDSServers, giving up: %s"
-                ) % (
-                    self._entry,
-                    disk_error
+            involved_disks = [
+                disk_util.get_parity_disk_UUID(self._disks, block_num)
+            ]
+            for disk_num in stripes[block_num].keys():
+                involved_disks.append(
+                    disk_util.get_physical_disk_UUID(
+                        self._disks,
+                        disk_num,
+                        block_num
+                    )
                 )
-            )
 
-    # Getting the blocks we want from block devices:
-    # GET BLOCKS, REGULAR AND RECONSTRUCT
+            faulty_disk_UUID = None
+            for disk_UUID in involved_disks:
+                if disk_UUID in self._faulty_disk_UUIDs:
+                    faulty_disk_UUID = disk_UUID
 
-    ## Get contexts_for_reconstruct_get_block
-    ## @returns contexts (dict) for BDSClientSocket
-    def contexts_for_reconstruct_get_block(self):
-        return service_util.create_get_block_contexts(
-            self._disks,
-            {
-                disk_UUID: {
-                    "block_num" : self._current_block,
-                    "password" : self._volume["long_password"],
-                }
-                for disk_UUID in self._disks.keys()
-                if disk_UUID != self._faulty_disk_UUID
+            if faulty_disk_UUID is None:
+                self._block_modes[block_num] = (
+                    WriteToDiskService.REGULAR,
+                    None
+                )
+                needed_disks = []
+                for disk_UUID in involved_disks:
+                    block_data = block_cache.get_block(
+                        self._volume_UUID,
+                        block_num,
+                        disk_UUID
+                    )
+                    if block_data is None:
+                        needed_disks.append(disk_UUID)
+                    else:
+                        self._cached_blocks.setdefault(
+                            block_num,
+                            {}
+                        )[disk_UUID] = block_data
+            else:
+                self._block_modes[block_num] = (
+                    WriteToDiskService.RECONSTRUCT,
+                    faulty_disk_UUID
+                )
+                needed_disks = []
+                for disk_UUID in self._disks.keys():
+                    if disk_UUID == faulty_disk_UUID:
+                        continue
+                    if disk_UUID in self._faulty_disk_UUIDs:
+                        raise RuntimeError(
+                            (
+                                "%s:\t Couldn't connect to two of the" +
+                                "BDSServers, giving up"
+                            ) % self._entry
+                        )
+                    needed_disks.append(disk_UUID)
+
+            for disk_UUID in needed_disks:
+                disk_blocks.setdefault(disk_UUID, []).append(block_num)
+
+        # blocks were added in order, so each extent is first to last
+        self._extents = {}
+        request_info = {}
+        for disk_UUID, blocks in disk_blocks.items():
+            self._extents[disk_UUID] = blocks[0]
+            request_info[disk_UUID] = {
+                "first" : blocks[0],
+                "count" : blocks[-1] - blocks[0] + 1,
+                "password" : self._volume["long_password"]
             }
-        )
+        return request_info
 
-    ## Get contexts_for_regular_get_block
-    ## @returns contexts (dict) for BDSClientSocket
-    def contexts_for_regular_get_block(self):
-        context = {
-            "block_num" : self._current_block,
-            "password" : self._volume["long_password"]
-        }
-        return service_util.create_get_block_contexts(
-            self._disks,
-            {
-                self._current_phy_UUID: context,
-                self._current_phy_parity_UUID: context
-            }
+    ## Returns a block from the block cache or from the extent a disk sent
+    ## @param client_responses (dict) responses from the Block Devices
+    ## @param disk_UUID (string) disk that sent the block
+    ## @param block_num (int) block_num of the block
+    ## @returns block (string) the block
+    def get_block(self, client_responses, disk_UUID, block_num):
+        if disk_UUID in self._cached_blocks.get(block_num, {}):
+            return self._cached_blocks[block_num][disk_UUID]
+        return disk_util.get_block_from_extent(
+            client_responses[disk_UUID]["content"],
+            self._extents[disk_UUID],
+            block_num
         )
 
-    # SET BLOCKS, REGULAR AND RECONSTRUCT
+    # SET BLOCKS, FULL STRIPE, REGULAR AND RECONSTRUCT
 
-    ## Get contexts_for_regular_set_block. We need to find the exact data to
-    ## write.
+    ## Computes the new parity block of a stripe. We need to find the exact
+    ## data to write.
     ##
     ## ALGORITHM:
     ## Lets say:
@@ -374,109 +644,159 @@ class WriteToDiskService(
     ##
     ## then:
     ## p1 = p0 XOR (x1 XOR x0)
-    ## @returns contexts (dict) for BDSClientSocket
-    def contexts_for_regular_set_block(self):
-        # first update content
-        client_responses = self._disk_manager.get_responses()
-
-        x0 = client_responses[self._current_phy_UUID]["content"]
-        x1 = self._block_data
-        p0 = client_responses[self._current_phy_parity_UUID]["content"]
-        p1 = disk_util.compute_missing_block([x0, x1, p0])
-
-        # then return new client contexts
-        return service_util.create_set_block_contexts(
-            self._disks,
-            self.create_set_request_info(dict(zip(
-                [self._current_phy_UUID, self._current_phy_parity_UUID],
-                [x1, p1]
-            )))
-        )
-
-    ## Get contexts_for_reconstruct_set_block. We need to find the exact data
-    ## to write if one of the important disks is down.
+    ## and if we write more than one block in the stripe, we XOR each of
+    ## them (x1 XOR x0) into the parity.
     ##
-    ## ALGORITHM:
-    ## Lets say:
-    ## x0 - contents of desired block before update
-    ## x1 - contents of desired block after update
-    ## p0 - contents of parity block before update
-    ## p1 - contents of parity block after update
-
-    ## then:
-    ## p1 = p0 XOR (x1 XOR x0)
-
-    ## but:
-    ## either x or p is down, or in other words, we cannot access x0 or p0
+    ## If we write the full stripe, then p1 is simply the XOR of all the new
+    ## blocks, and we don't need x0 or p0 at all.
+    ##
+    ## If either x or p is down, or in other words, we cannot access x0 or p0
     ## In any case, we can represent x0 or p0 as XOR of the rest and continue
     ## regularly:
-
+    ##
     ## Lets say:
     ## a0, b0, c0 ... z0 are the contents of all the disks before update
-
+    ##
     ## if p is down:
     ## p1 = a0 XOR b0 ... XOR x0 XOR .. XOR z0 XOR (x1 XOR x0)
     ##   = a0 XOR b0 ... XOR z0 XOR (x1)         --> (x0 XOR x0 = "0")
     ## ---> Definition of p1!
-
+    ##
     ## if x is down:
     ## p1 = p0 XOR (x1 XOR (a0 XOR b0 ... XOR z0))
     ##   = x1 XOR (a0 XOR b0 XOR ... XOR z0)         --> (p0 XOR p0 = "0")
     ## ---> Definition of p1!
-    ## @returns contexts (dict) for BDSClientSocket
-    def contexts_for_reconstruct_set_block(self):
-        # first update content
-        client_responses = self._disk_manager.get_responses()
+    ## @param client_responses (dict) responses from the Block Devices
+    ## @param block_num (int) block_num of the stripe
+    ## @param new_blocks (dict) disk_num : contents of block after update
+    ## @returns p1 (string) contents of parity block after update
+    def compute_parity(self, client_responses, block_num, new_blocks):
+        block_mode, faulty_disk_UUID = self._block_modes[block_num]
+        if block_mode == WriteToDiskService.FULL_STRIPE:
+            return disk_util.compute_missing_block(new_blocks.values())
 
         # first lets find the faulty disks content:
+        faulty_content = None
+        if block_mode == WriteToDiskService.RECONSTRUCT:
+            blocks = []
+            for disk_UUID in self._disks.keys():
+                if disk_UUID != faulty_disk_UUID:
+                    blocks.append(
+                        self.get_block(client_responses, disk_UUID, block_num)
+                    )
+            faulty_content = disk_util.compute_missing_block(blocks)
+
+        # now lets XOR the parity with all the blocks before and after update
         blocks = []
-        for disk_UUID in self._disks.keys():
-            if disk_UUID != self._faulty_disk_UUID:
-                blocks.append(client_responses[disk_UUID]["content"])
-        faulty_content = disk_util.compute_missing_block(blocks)
-
-        # now lets set all the block content we have
-        x1 = self._block_data
-        if self._faulty_disk_UUID == self._current_phy_UUID:
-            x0 = faulty_content
-            p0 = client_responses[self._current_phy_parity_UUID]["content"]
-        else:
-            # must be the other way around:
-            x0 = client_responses[self._current_phy_UUID]["content"]
-            p0 = faulty_content
-        p1 = disk_util.compute_missing_block([x0, x1, p0])
-
-        # finally return new client contexts
-        return service_util.create_set_block_contexts(
-            self._disks,
-            self.create_set_request_info(dict(zip(
-                [self._current_phy_UUID, self._current_phy_parity_UUID],
-                [x1, p1]
-            )))
-        )
+        disk_UUIDs = [disk_util.get_parity_disk_UUID(self._disks, block_num)]
+        for disk_num, x1 in new_blocks.items():
+            blocks.append(x1)
+            disk_UUIDs.append(
+                disk_util.get_physical_disk_UUID(
+                    self._disks,
+                    disk_num,
+                    block_num
+                )
+            )
+        for disk_UUID in disk_UUIDs:
+            if disk_UUID == faulty_disk_UUID:
+                blocks.append(faulty_content)
+            else:
+                blocks.append(
+                    self.get_block(client_responses, disk_UUID, block_num)
+                )
+        return disk_util.compute_missing_block(blocks)
 
     # SHARED FUNCTION
 
-    ## create the request_info for the wanted contexts.
-    ## @returns request_info (dict) for BDSClientSocket
-    def create_set_request_info(self, disk_content):
-        # disk_content needs to be a dict of { disk_UUID : content }
+    ## create the request_info for writing the current blocks and their
+    ## parity blocks. Blocks of a faulty disk are added to its cache instead,
+    ## unless it has been rebuilt since we read the stripes.
+    ## The stripes are dropped from the block cache until they are written.
+    ## @returns request_info (dict) for set_blocks contexts
+    def create_set_request_info(self):
+        block_cache = self._entry.application_context["block_cache"]
+        client_responses = {}
+        if self._disk_manager is not None:
+            client_responses = self._disk_manager.get_responses()
+
+        # disks that were rebuilt since we read the stripes can be written
+        faulty_disk_UUIDs = []
+        for disk_UUID in self._faulty_disk_UUIDs:
+            if (
+                disk_UUID not in self._rebuilding_disk_UUIDs or
+                self._disks[disk_UUID]["state"] != constants.ONLINE
+            ):
+                faulty_disk_UUIDs.append(disk_UUID)
+
         request_info = {}
-        for disk_UUID, content in disk_content.items():
+        self._written_blocks = {}
+        self._rebuild_blocks = []
+        self.release_stripes()
+        stripes = self.get_stripes()
+        for block_num in sorted(stripes.keys()):
+            block_cache.invalidate_stripe(self._volume_UUID, block_num)
+            self.hold_stripe(block_num)
+            new_blocks = stripes[block_num]
+            disk_content = [(
+                disk_util.get_parity_disk_UUID(self._disks, block_num),
+                self.compute_parity(client_responses, block_num, new_blocks)
+            )]
+            for disk_num, x1 in new_blocks.items():
+                disk_content.append((
+                    disk_util.get_physical_disk_UUID(
+                        self._disks,
+                        disk_num,
+                        block_num
+                    ),
+                    x1
+                ))
+
+            # a reconstructed stripe is read again from the disks
             if (
-                disk_UUID == self._faulty_disk_UUID and
-                self._disks[disk_UUID]["cache"].check_if_add(self._current_block)
+                self._block_modes[block_num][0] !=
+                WriteToDiskService.RECONSTRUCT
             ):
-                self._disks[disk_UUID]["cache"].add_block(
-                    self._current_block,
-                    content
-                )
-                # adding to cache means no need for communication
-                # with server
-            else:
-                request_info[disk_UUID] = {
-                    "block_num": self._current_block,
-                    "password": self._volume["long_password"],
-                    "content": content
-                }
+                self._written_blocks[block_num] = dict(disk_content)
+
+            # a disk being rebuilt that we don't write to computes its block
+            # from the blocks we write. A disk that doesn't need the block
+            # yet might by the time it's written (the allocation map of its
+            # rebuild may be read before the write)
+            for disk_UUID, disk in self._disks.items():
+                if (
+                    disk["state"] == constants.REBUILD and
+                    (
+                        disk_UUID not in dict(disk_content) or
+                        not disk["cache"].check_if_add(block_num)
+                    )
+                ):
+                    self._rebuild_blocks.append((disk_UUID, block_num))
+
+            for disk_UUID, content in disk_content:
+                if disk_UUID in faulty_disk_UUIDs:
+                    # adding to cache means no need for communication
+                    # with server. If the cache doesn't need it, the
+                    # rebuild hasn't reached the block yet and the disk will
+                    # get it when it is rebuilt
+                    disk_cache = self._disks[disk_UUID]["cache"]
+                    if disk_cache.check_if_add(block_num):
+                        disk_cache.add_block(block_num, content)
+                    elif disk_cache.mode != cache.Cache.SCRATCH_MODE:
+                        raise RuntimeError(
+                            "%s:\t Disk %s doesn't cache blocks, can't "
+                            "write block %s" % (
+                                self._entry,
+                                disk_UUID,
+                                block_num
+                            )
+                        )
+                else:
+                    request_info.setdefault(
+                        disk_UUID,
+                        {
+                            "blocks": [],
+                            "password": self._volume["long_password"]
+                        }
+                    )["blocks"].append([block_num, content])
         return request_info
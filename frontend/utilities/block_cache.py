@@ -0,0 +1,238 @@
+#!/usr/bin/python
+## @package RAID5.frontend.utilities.block_cache
+# Module that defines the BlockCache class, a cache of recently read and
+# written physical blocks
+#
+
+import collections
+
+## BlockCache class that keeps the contents of recently read and written
+## physical blocks (data and parity) of all volumes, keyed by
+## (disk_UUID, block_num). Reads of cached blocks don't go to the Block
+## Devices (and aren't reconstructed again when a disk is offline), and
+## writes don't have to read the old blocks again. Writes go through to the
+## Block Devices, the cache is updated once they have succeeded.
+##
+## The cache is bounded by a memory budget, and uses 2Q eviction:
+## new blocks enter a small FIFO queue (recent), and only blocks that are
+## used again after they left it are kept in the main LRU queue (frequent).
+## Keys of blocks that left the FIFO queue are remembered in a ghost queue,
+## so a long sequential read doesn't flush the blocks that are used often.
+##
+## Every change of a volume increases its epoch, blocks that were read before
+## a change (epoch doesn't match) aren't added, since they may be out of date.
+class BlockCache(object):
+
+    ## Part of the memory budget for the recent queue
+    RECENT_PART = 0.25
+
+    ## Amount of ghost keys, as a part of the amount of blocks that fit in
+    ## the memory budget
+    GHOST_PART = 0.5
+
+    ## Constructor for BlockCache
+    ## @param max_size (int) memory budget in bytes, 0 disables the cache
+    ## @param block_size (int) size of a block, to count the ghost keys
+    def __init__(self, max_size, block_size):
+        ## Memory budget in bytes
+        self._max_size = max_size
+
+        ## Max amount of ghost keys
+        self._max_ghosts = int(
+            BlockCache.GHOST_PART * max_size // max(block_size, 1)
+        )
+
+        ## Blocks seen once, oldest first,
+        ## (disk_UUID, block_num) : block_data
+        self._recent = collections.OrderedDict()
+
+        ## Blocks used again, least recently used first,
+        ## (disk_UUID, block_num) : block_data
+        self._frequent = collections.OrderedDict()
+
+        ## Keys of blocks that left the recent queue, oldest first,
+        ## (disk_UUID, block_num) : None
+        self._ghosts = collections.OrderedDict()
+
+        ## Size of the blocks in the recent queue
+        self._recent_size = 0
+
+        ## Size of the blocks in the frequent queue
+        self._frequent_size = 0
+
+        ## Disks of each volume that have cached blocks,
+        ## volume_UUID : set of disk_UUIDs
+        self._volume_disks = {}
+
+        ## Epoch of each volume, volume_UUID : epoch
+        self._epochs = {}
+
+        ## Amount of lookups that found the block
+        self.hits = 0
+
+        ## Amount of lookups that didn't find the block
+        self.misses = 0
+
+    ## Returns the current epoch of a volume
+    ## @param volume_UUID (string) the volume
+    ## @returns epoch (int)
+    def get_epoch(self, volume_UUID):
+        return self._epochs.get(volume_UUID, 0)
+
+    ## Returns a cached block, and counts the hit or miss
+    ## @param volume_UUID (string) volume of the block
+    ## @param block_num (int) stripe of the block
+    ## @param disk_UUID (string) physical disk of the block
+    ## @returns block_data (string) content of the block, None if not cached
+    def get_block(self, volume_UUID, block_num, disk_UUID):
+        key = (disk_UUID, block_num)
+        if key in self._frequent:
+            # most recently used
+            block_data = self._frequent.pop(key)
+            self._frequent[key] = block_data
+        elif key in self._recent:
+            # stays in the recent queue, a second use there doesn't count
+            block_data = self._recent[key]
+        else:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return block_data
+
+    ## Adds blocks we have read. Ignored if the volume has changed since
+    ## the blocks were read.
+    ## @param volume_UUID (string) volume of the blocks
+    ## @param block_num (int) stripe of the blocks
+    ## @param blocks (dict) disk_UUID : block_data
+    ## @param epoch (int) epoch of the volume when the blocks were read
+    def add_read_blocks(self, volume_UUID, block_num, blocks, epoch):
+        if epoch == self.get_epoch(volume_UUID):
+            self.add_blocks(volume_UUID, block_num, blocks)
+
+    ## Adds blocks we have written. The volume has changed, so blocks that
+    ## are being read now won't be added.
+    ## @param volume_UUID (string) volume of the blocks
+    ## @param block_num (int) stripe of the blocks
+    ## @param blocks (dict) disk_UUID : block_data
+    def add_written_blocks(self, volume_UUID, block_num, blocks):
+        self._epochs[volume_UUID] = self.get_epoch(volume_UUID) + 1
+        self.add_blocks(volume_UUID, block_num, blocks)
+
+    ## Adds blocks of a stripe. Blocks that are cached are updated in place,
+    ## blocks that were seen before (ghosts) go to the frequent queue and
+    ## the rest to the recent queue.
+    ## @param volume_UUID (string) volume of the blocks
+    ## @param block_num (int) stripe of the blocks
+    ## @param blocks (dict) disk_UUID : block_data
+    def add_blocks(self, volume_UUID, block_num, blocks):
+        if self._max_size <= 0:
+            return
+
+        for disk_UUID, block_data in blocks.items():
+            self._volume_disks.setdefault(volume_UUID, set()).add(disk_UUID)
+            key = (disk_UUID, block_num)
+            if key in self._frequent:
+                self._frequent_size += (
+                    len(block_data) - len(self._frequent.pop(key))
+                )
+                self._frequent[key] = block_data
+            elif key in self._recent:
+                self._recent_size += (
+                    len(block_data) - len(self._recent[key])
+                )
+                self._recent[key] = block_data
+            elif key in self._ghosts:
+                del self._ghosts[key]
+                self._frequent[key] = block_data
+                self._frequent_size += len(block_data)
+            else:
+                self._recent[key] = block_data
+                self._recent_size += len(block_data)
+        self.evict()
+
+    ## Drops blocks until we're within the memory budget. The recent queue
+    ## gives up its oldest blocks while it's over its part of the budget,
+    ## otherwise the least recently used frequent blocks are dropped.
+    def evict(self):
+        while self._recent_size + self._frequent_size > self._max_size:
+            if len(self._recent) and (
+                self._recent_size > BlockCache.RECENT_PART * self._max_size or
+                len(self._frequent) == 0
+            ):
+                key, block_data = self._recent.popitem(last=False)
+                self._recent_size -= len(block_data)
+                self._ghosts[key] = None
+                while len(self._ghosts) > self._max_ghosts:
+                    self._ghosts.popitem(last=False)
+            else:
+                key, block_data = self._frequent.popitem(last=False)
+                self._frequent_size -= len(block_data)
+
+    ## Drops a block
+    ## @param key (tuple) (disk_UUID, block_num) of the block
+    ## @param keep_ghost (bool) if the key of a cached block is remembered
+    ## as a ghost, so it goes to the frequent queue when it is added again
+    def drop(self, key, keep_ghost=False):
+        if key in self._recent:
+            self._recent_size -= len(self._recent.pop(key))
+        elif key in self._frequent:
+            self._frequent_size -= len(self._frequent.pop(key))
+        elif keep_ghost:
+            # not cached, a ghost stays a ghost
+            return
+
+        self._ghosts.pop(key, None)
+        if keep_ghost:
+            self._ghosts[key] = None
+            while len(self._ghosts) > self._max_ghosts:
+                self._ghosts.popitem(last=False)
+
+    ## Drops a stripe, before it is written. The blocks are added again
+    ## once the write succeeds, as frequent blocks.
+    ## @param volume_UUID (string) volume of the stripe
+    ## @param block_num (int) the stripe
+    def invalidate_stripe(self, volume_UUID, block_num):
+        self._epochs[volume_UUID] = self.get_epoch(volume_UUID) + 1
+        for disk_UUID in self._volume_disks.get(volume_UUID, ()):
+            self.drop((disk_UUID, block_num), keep_ghost=True)
+
+    ## Drops a range of stripes, when they are discarded. The blocks aren't
+    ## remembered as ghosts.
+    ## @param volume_UUID (string) volume of the stripes
+    ## @param first (int) block_num of the first stripe
+    ## @param last (int) block_num after the last stripe
+    def invalidate_stripes(self, volume_UUID, first, last):
+        self._epochs[volume_UUID] = self.get_epoch(volume_UUID) + 1
+        disk_UUIDs = self._volume_disks.get(volume_UUID, ())
+        for queue in (self._recent, self._frequent):
+            for key in list(queue.keys()):
+                if key[0] in disk_UUIDs and first <= key[1] < last:
+                    self.drop(key)
+
+    ## Drops all the blocks of a volume, when the disks of the volume change
+    ## @param volume_UUID (string) the volume
+    def invalidate_volume(self, volume_UUID):
+        self._epochs[volume_UUID] = self.get_epoch(volume_UUID) + 1
+        disk_UUIDs = self._volume_disks.pop(volume_UUID, set())
+        for queue in (self._recent, self._frequent, self._ghosts):
+            for key in list(queue.keys()):
+                if key[0] in disk_UUIDs:
+                    self.drop(key)
+
+    ## Returns the statistics of the cache, for sizing it
+    ## @returns stats (dict) name : value
+    def get_stats(self):
+        lookups = self.hits + self.misses
+        return collections.OrderedDict([
+            ("hits", self.hits),
+            ("misses", self.misses),
+            (
+                "hit_ratio",
+                "%.2f" % (float(self.hits) / lookups if lookups else 0)
+            ),
+            ("recent_blocks", len(self._recent)),
+            ("frequent_blocks", len(self._frequent)),
+            ("ghost_blocks", len(self._ghosts)),
+            ("size", self._recent_size + self._frequent_size),
+            ("max_size", self._max_size),
+        ])
@@ -6,6 +6,7 @@
 import errno
 import logging
 import os
+import re
 import socket
 import time
 import traceback
@@ -15,10 +16,24 @@ from common.services import base_service
 from common.utilities import constants
 from common.utilities import util
 from frontend.pollables import bds_client_socket
+from frontend.utilities import checkpoint
 from frontend.utilities import disk_util
+from frontend.utilities import spill_log
 
-## Cache class that saves the data that needs to be written to disks that are
-## offline. A cache instance will be present in every disk dictionary.
+## Pattern of a byte of the bitmap with a dirty block
+DIRTY_BYTE = re.compile(b"[^\x00]")
+
+## Cache class that tracks the blocks that need to be written to disks that
+## are offline. A cache instance will be present in every disk dictionary.
+## The dirty blocks are marked in a bitmap (one bit per block), so marking a
+## block is O(1) and the dirty blocks are found in order by scanning the
+## bitmap, skipping clean bytes. The data of the first dirty blocks is kept
+## as well (up to MAX_CACHE_SIZE), once the memory is full the data is
+## spilled to a SpillLog file, so it is replayed instead of being rebuilt
+## from the other disks. Without a spill file the rest of the dirty blocks
+## are rebuilt from the other disks.
+## The dirty blocks and the pointer can be kept in a Checkpoint file as
+## well, so they aren't lost if the frontend restarts.
 class Cache(object):
     ## Cache mode
     (
@@ -34,29 +49,49 @@ class Cache(object):
         SCRATCH_MODE: "SCRATCH MODE",
     }
 
-    ## Cache topology
-    (
-        INCLUDE_DATA,
-        EXCLUDE_DATA,
-    ) = range(2)
-
     ## Constructor for Cache class.
     ## @param mode (optional) (int) mode in which the cache will operate
-    def __init__(self, mode=DORMANT_MODE):
-        ## topology for the cache. initially set to INCLUDE_DATA but once we
-        ## fill the cache up too much we will drop it
-        self._topology = Cache.INCLUDE_DATA
+    ## @param spill_file (optional) (string) file for the data that doesn't
+    ## fit in memory, None if the data is dropped
+    ## @param checkpoint_file (optional) (string) file for the rebuild
+    ## progress, None if it isn't kept
+    def __init__(
+        self,
+        mode=DORMANT_MODE,
+        spill_file=None,
+        checkpoint_file=None,
+    ):
+        ## Bitmap of dirty blocks, bit (block_num % 8) of byte
+        ## (block_num // 8) is set if block_num is dirty
+        self._bitmap = bytearray()
+
+        ## Amount of dirty blocks
+        self._dirty = 0
+
+        ## No dirty blocks before this block_num, where the next scan starts
+        self._scan = 0
 
-        ## blocks we saved in the cache. Always a dict; block_num:block_data.
+        ## Data of dirty blocks we saved in the cache, block_num:block_data.
+        ## Bounded by MAX_CACHE_SIZE.
         self._blocks = {}
 
+        ## Log of the data of dirty blocks that didn't fit in memory
+        self._spill = None
+        if spill_file is not None:
+            self._spill = spill_log.SpillLog(spill_file)
+
+        ## Checkpoint of the dirty blocks and the pointer
+        self._checkpoint = None
+        if checkpoint_file is not None:
+            self._checkpoint = checkpoint.Checkpoint(checkpoint_file)
+
         ## Cache mode
         self._mode = mode
 
         ## Points to which block we are currently (relevant for SCRATCH_MODE)
         self._pointer = 0
 
-        ## Blocks handled when rebuilding (relevant for SCRATCH_MODE)
+        ## Blocks handled when rebuilding
         self._blocks_handled = 0
 
     ## Mode property
@@ -90,17 +125,14 @@ class Cache(object):
             self._mode == Cache.DORMANT_MODE or
             (
                 self._mode == Cache.CACHE_MODE and
-                self.size() == 0
+                self._dirty == 0
             )
         )
 
-    ## Returns the cache size in bytes
+    ## Returns the size in bytes of the data saved in the cache
     ## @returns size (int) size of cache
     def size(self):
-        return (
-            len(self._blocks.keys()) *
-            constants.BLOCK_SIZE
-        )
+        return len(self._blocks) * constants.BLOCK_SIZE
 
     ## Returns the percentage of the disk that has been rebuilt. relevant for
     ## SCRATCH_MODE
@@ -111,23 +143,21 @@ class Cache(object):
             return 100
         elif self._mode == Cache.CACHE_MODE:
             # to avoid zero divison error
-            if len(self._blocks.keys()) == 0:
+            if self._dirty == 0:
                 return 100
             return (
                 float(self._blocks_handled) / (
                     self._blocks_handled +
-                    len(self._blocks.keys())
+                    self._dirty
                 ) * 100
             )
         else:
             return -1
 
-    ## Checks if the Cache has an overflow in size
+    ## Checks if the data spill of the Cache is full
     ## @returns overflow (bool) Cache has overflown
     def cache_overflow(self):
-        if self._topology == Cache.EXCLUDE_DATA:
-            return False
-        return self.size() > constants.MAX_CACHE_SIZE
+        return self.size() >= constants.MAX_CACHE_SIZE
 
     ## Checks if a block should be added to the Cache. Should not be added if
     ## Cache is in DORMANT_MODE or if in SCRATCH_MODE and haven't reached
@@ -145,36 +175,178 @@ class Cache(object):
             return False
         return True
 
-    ## Adds a block to the cache. Considers cache overflow
+    ## Checks if a block is dirty
+    ## @param block_num (int) the block
+    ## @returns dirty (bool) if block is dirty
+    def is_dirty(self, block_num):
+        index = block_num >> 3
+        return (
+            index < len(self._bitmap) and
+            bool(self._bitmap[index] & (1 << (block_num & 7)))
+        )
+
+    ## Marks a block as dirty and saves its data, in memory or in the spill
+    ## log. If both are unavailable the block will be rebuilt from the other
+    ## disks.
     ## @param block_num (int) current block_num in writing
-    ## @param block_data (int) current block_data in writing
+    ## @param block_data (int) current block_data in writing, None to only
+    ## mark the block (keeps data that is already saved)
     def add_block(self, block_num, block_data):
-        # handle overflow:
+        index = block_num >> 3
+        if index >= len(self._bitmap):
+            grow = max(index + 1, 2 * len(self._bitmap)) - len(self._bitmap)
+            self._bitmap.extend(bytearray(grow))
+        if not self.is_dirty(block_num):
+            self._bitmap[index] |= 1 << (block_num & 7)
+            self._dirty += 1
+            if self._checkpoint is not None:
+                self._checkpoint.mark(block_num)
+        self._scan = min(self._scan, block_num)
+        if block_data is None:
+            return
+
+        # keep the data where we kept it before, in memory if there's room
+        if block_num in self._blocks:
+            self._blocks[block_num] = block_data
+        elif self._spill is not None and block_num in self._spill:
+            self._spill.append(block_num, block_data)
+        elif not self.cache_overflow():
+            self._blocks[block_num] = block_data
+        elif self._spill is not None:
+            self._spill.append(block_num, block_data)
+
+    ## Marks an extent of blocks as dirty, without data. Whole bytes of the
+    ## bitmap are set at once. The blocks aren't marked in the checkpoint
+    ## file, the caller should save a checkpoint.
+    ## @param first (int) block_num of the first block
+    ## @param count (int) amount of blocks
+    def add_extent(self, first, count):
+        if count <= 0:
+            return
+        last = first + count
+        index = (last - 1) >> 3
+        if index >= len(self._bitmap):
+            grow = max(index + 1, 2 * len(self._bitmap)) - len(self._bitmap)
+            self._bitmap.extend(bytearray(grow))
+
+        block_num = first
+        while block_num < last:
+            if block_num & 7 == 0 and block_num + 8 <= last:
+                start, end = block_num >> 3, last >> 3
+                self._dirty += 8 * (end - start) - sum(
+                    bin(byte).count("1") for byte in self._bitmap[start:end]
+                )
+                self._bitmap[start:end] = b"\xff" * (end - start)
+                block_num = end << 3
+                continue
+            if not self.is_dirty(block_num):
+                self._bitmap[block_num >> 3] |= 1 << (block_num & 7)
+                self._dirty += 1
+            block_num += 1
+        self._scan = min(self._scan, first)
+
+    ## Returns the first dirty block from a block_num on
+    ## @param block_num (int) block_num to start from
+    ## @returns block_num (int) first dirty block, None if there is none
+    def find_dirty(self, block_num):
+        index = block_num >> 3
+        if index < len(self._bitmap):
+            # the rest of the first byte
+            byte = self._bitmap[index] >> (block_num & 7)
+            if byte:
+                return block_num + ((byte & -byte).bit_length() - 1)
+            index += 1
+
+        match = DIRTY_BYTE.search(self._bitmap, index)
+        if match is None:
+            return None
+        byte = self._bitmap[match.start()]
+        return (match.start() << 3) + ((byte & -byte).bit_length() - 1)
+
+    ## Returns the next blocks in the cache, an extent of contiguous blocks,
+    ## and marks them as clean.
+    ## @param max_blocks (int) max amount of blocks returned
+    ## @returns blocks (list) list of [block_num, block_data], block_data is
+    ## None if not stored in cache
+    def next_blocks(self, max_blocks):
+        blocks = []
+        block_num = self.find_dirty(self._scan)
+        while (
+            block_num is not None and
+            len(blocks) < max_blocks and
+            self.is_dirty(block_num)
+        ):
+            block_data = self._blocks.pop(block_num, None)
+            if block_data is None and self._spill is not None:
+                block_data = self._spill.pop(block_num)
+            blocks.append([block_num, block_data])
+            self._bitmap[block_num >> 3] &= ~(1 << (block_num & 7))
+            self._dirty -= 1
+            self._blocks_handled += 1
+            block_num += 1
+
+        if block_num is None:
+            block_num = len(self._bitmap) << 3
+        self._scan = block_num
+
+        if self._dirty == 0 and self._spill is not None:
+            self._spill.close()
+        return blocks
+
+    ## Saves the dirty blocks and the pointer to the checkpoint file. Blocks
+    ## that are being rebuilt are saved as dirty, until they are set.
+    ## @param volume_UUID (string) UUID of the volume
+    ## @param level (int) generation level of the rest of the volume
+    ## @param in_flight (optional) (tuple) block_nums that are being rebuilt
+    def save_checkpoint(self, volume_UUID, level, in_flight=()):
+        if self._checkpoint is None:
+            return
+        bitmap = bytearray(self._bitmap)
+        for block_num in in_flight:
+            index = block_num >> 3
+            if index >= len(bitmap):
+                bitmap.extend(bytearray(index + 1 - len(bitmap)))
+            bitmap[index] |= 1 << (block_num & 7)
+        self._checkpoint.save(
+            volume_UUID,
+            level,
+            self._mode,
+            self._pointer,
+            bitmap
+        )
+
+    ## Loads the dirty blocks and the pointer from the checkpoint file, if it
+    ## was saved for the same volume and generation level
+    ## @param volume_UUID (string) UUID of the volume
+    ## @param level (int) generation level of the rest of the volume
+    ## @returns loaded (bool) if the checkpoint was loaded
+    def load_checkpoint(self, volume_UUID, level):
+        if self._checkpoint is None:
+            return False
+        saved = self._checkpoint.load()
         if (
-            self._topology == Cache.INCLUDE_DATA and
-            self.cache_overflow()
+            saved is None or
+            saved["volume_UUID"] != volume_UUID or
+            saved["level"] != level or
+            saved["mode"] not in (Cache.CACHE_MODE, Cache.SCRATCH_MODE)
         ):
-            self.change_topology()
+            return False
 
-        # add block depending on topology,
-        if self._topology == Cache.EXCLUDE_DATA:
-            block_data = None
-        self._blocks[block_num] = block_data
+        self._mode = saved["mode"]
+        self._pointer = saved["pointer"]
+        self._bitmap = saved["bitmap"]
+        self._dirty = sum(bin(byte).count("1") for byte in self._bitmap)
+        self._scan = 0
+        self._blocks = {}
+        return True
 
-    ## Returns the next_block in the cache. Works for both topoligies.
-    ## @returns block_num, block_data (tuple) Returns the block data if exists
-    # and None if not of the next block in cache
-    def next_block(self):
-        if self._mode == Cache.SCRATCH_MODE:
-            block_num = self._pointer
-            block_data = None
-            self._pointer += 1
-        else:
-            block_num = sorted(self._blocks.keys())[0]
-            block_data = self._blocks[block_num]
-            del self._blocks[block_num]
-            self._blocks_handled += 1
-        return block_num, block_data
+    ## Drops the cache's spill log and checkpoint, the cache isn't used
+    ## anymore
+    def close(self):
+        if self._spill is not None:
+            self._spill.close()
+        if self._checkpoint is not None:
+            self._checkpoint.close()
 
     ## representation of Cache objec with first few cache entries.
     ## @returns (str) representation of cache
@@ -185,20 +357,44 @@ class Cache(object):
         if self._mode == Cache.SCRATCH_MODE:
             s += "Current pointer index:\t%s" % self._pointer
         else:
-            for block_num in self._blocks.keys()[:6]:
-                if self._topology == Cache.EXCLUDE_DATA:
-                    data = "--EXCLUDING DATA--"
-                else:
+            s += "dirty blocks:\t%s\n" % self._dirty
+            block_num = self.find_dirty(self._scan)
+            for i in range(6):
+                if block_num is None:
+                    break
+                if block_num in self._blocks:
                     data = "%s..." % self._blocks[block_num][:100].replace(
                         "\n", "")
+                elif self._spill is not None and block_num in self._spill:
+                    data = "--SPILLED--"
+                else:
+                    data = "--EXCLUDING DATA--"
 
                 s += "%s:\t\t%s\n" % (block_num, data)
+                block_num = self.find_dirty(block_num + 1)
         return s
 
-    ## Changes topology from INCLUDE_DATA to EXCLUDE_DATA
-    def change_topology(self):
-        self._topology = Cache.EXCLUDE_DATA
-
-        # remove all the data for new topology
-        for block_num, data in self._blocks.items():
-            self._blocks[block_num] = None
+## Creates the cache of a disk that went offline, with its spill log and
+## checkpoint files in the directories of the application_context
+## @param application_context (dict) the application_context
+## @param disk_UUID (string) UUID of the disk
+## @param mode (int) mode in which the cache will operate
+## @returns cache (Cache) the new cache
+def create_offline_cache(application_context, disk_UUID, mode):
+    spill_file = None
+    if application_context["spill_dir"]:
+        spill_file = os.path.join(
+            application_context["spill_dir"],
+            "%s.log" % disk_UUID
+        )
+    checkpoint_file = None
+    if application_context["checkpoint_dir"]:
+        checkpoint_file = os.path.join(
+            application_context["checkpoint_dir"],
+            "%s.ckpt" % disk_UUID
+        )
+    return Cache(
+        mode=mode,
+        spill_file=spill_file,
+        checkpoint_file=checkpoint_file
+    )
@@ -0,0 +1,130 @@
+#!/usr/bin/python
+## @package RAID5.frontend.utilities.checkpoint
+# Module that defines the Checkpoint class, a file that keeps the rebuild
+# progress of a disk, so a rebuild can continue after the frontend restarts
+#
+
+import errno
+import os
+
+from common.utilities import constants
+
+## Size of the header of the checkpoint file
+HEADER_SIZE = 128
+
+## Checkpoint class that keeps the rebuild progress of a disk in a file. The
+## file has a header and the dirty bitmap of the disk's Cache:
+## volume_UUID $ level $ mode $ pointer, padded to HEADER_SIZE
+## bitmap
+## The level is the generation level of the rest of the volume, the progress
+## is only valid while it doesn't change.
+## Blocks are marked in the file as soon as they become dirty (without
+## syncing), the whole bitmap is saved and synced every once in a while. So
+## the file always has at least all the dirty blocks, if the frontend
+## restarts blocks might be rebuilt again but are never missed.
+class Checkpoint(object):
+
+    ## Constructor for Checkpoint
+    ## @param file_name (string) name of the checkpoint file
+    def __init__(self, file_name):
+        ## Name of the checkpoint file
+        self._file_name = file_name
+
+        ## File descriptor of the checkpoint file, None once closed
+        self._fd = None
+
+        directory = os.path.dirname(self._file_name)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._fd = os.open(
+            self._file_name,
+            os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0),
+            0o600
+        )
+
+    ## Loads the checkpoint from the file
+    ## @returns checkpoint (dict) with the keys volume_UUID, level, mode,
+    ## pointer and bitmap, None if the file has no valid checkpoint
+    def load(self):
+        if self._fd is None:
+            return None
+        data = self.read_at(0, os.fstat(self._fd).st_size)
+        header = data[:HEADER_SIZE].strip().split(constants.MY_SEPERATOR)
+        if len(data) < HEADER_SIZE or len(header) != 4:
+            return None
+        try:
+            return {
+                "volume_UUID": header[0],
+                "level": int(header[1]),
+                "mode": int(header[2]),
+                "pointer": int(header[3]),
+                "bitmap": bytearray(data[HEADER_SIZE:]),
+            }
+        except ValueError:
+            return None
+
+    ## Saves a checkpoint to the file and syncs it. The bitmap is written
+    ## first, so if we stop in the middle the old header is only behind.
+    ## @param volume_UUID (string) UUID of the volume
+    ## @param level (int) generation level of the rest of the volume
+    ## @param mode (int) mode of the Cache
+    ## @param pointer (int) pointer of the Cache
+    ## @param bitmap (bytearray) dirty bitmap of the Cache
+    def save(self, volume_UUID, level, mode, pointer, bitmap):
+        if self._fd is None:
+            return
+        header = constants.MY_SEPERATOR.join(
+            str(field) for field in (volume_UUID, level, mode, pointer)
+        )
+        if len(header) >= HEADER_SIZE:
+            raise RuntimeError("Checkpoint header too long: %s" % header)
+
+        self.write_at(HEADER_SIZE, bytes(bitmap))
+        os.ftruncate(self._fd, HEADER_SIZE + len(bitmap))
+        self.write_at(0, header.ljust(HEADER_SIZE - 1) + "\n")
+        os.fsync(self._fd)
+
+    ## Marks a dirty block in the file, without syncing
+    ## @param block_num (int) the block
+    def mark(self, block_num):
+        if self._fd is None:
+            return
+        offset = HEADER_SIZE + (block_num >> 3)
+        byte = bytearray(self.read_at(offset, 1) or b"\x00")
+        byte[0] |= 1 << (block_num & 7)
+        self.write_at(offset, bytes(byte))
+
+    ## Closes and removes the checkpoint file
+    def close(self):
+        if self._fd is None:
+            return
+        os.close(self._fd)
+        self._fd = None
+        try:
+            os.remove(self._file_name)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+    ## Writes data at an offset of the checkpoint file
+    ## @param offset (int) the offset
+    ## @param data (string) data to write
+    def write_at(self, offset, data):
+        os.lseek(self._fd, offset, os.SEEK_SET)
+        while data:
+            data = data[os.write(self._fd, data):]
+
+    ## Reads data from an offset of the checkpoint file
+    ## @param offset (int) the offset
+    ## @param length (int) amount of bytes to read
+    ## @returns data (string) the data, shorter at the end of the file
+    def read_at(self, offset, length):
+        os.lseek(self._fd, offset, os.SEEK_SET)
+        data = []
+        while length > 0:
+            buf = os.read(self._fd, length)
+            if not buf:
+                break
+            data.append(buf)
+            length -= len(buf)
+        return b"".join(data)
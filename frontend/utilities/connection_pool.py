@@ -0,0 +1,148 @@
+#!/usr/bin/python
+## @package RAID5.frontend.utilities.connection_pool
+# Module that implements the ConnectionPool class, a pool of persistent
+# connections to a Block Device Server
+#
+
+import errno
+import logging
+import socket
+
+from common.utilities import constants
+from common.utilities import util
+from frontend.pollables import bds_client_socket
+
+## ConnectionPool keeps the keep-alive connections of a single Block Device.
+## Services borrow an idle connection for each request (through the
+## @ref frontend.utilities.disk_manager.DiskManager), and the connection
+## returns to the pool once the response has been recieved.
+class ConnectionPool(object):
+
+    ## Constructor for ConnectionPool
+    ## @param address (tuple) TCP address of the Block Device
+    ## @param application_context (dict) the application_context of the
+    ## Frontend server
+    ## @param pollables (dict) pointer to the pollables in the system so that
+    ## we can add new BDSClientSockets
+    def __init__(self, address, application_context, pollables):
+        ## TCP address of the Block Device
+        self._address = address
+
+        ## Application context of the Frontend server
+        self._application_context = application_context
+
+        ## All of the pollables in the Frontend Server
+        self._pollables = pollables
+
+        ## Idle connections, the most recently used is last
+        self._idle = []
+
+    ## Borrows a connection from the pool. Creates a new connection if there
+    ## are no idle connections.
+    ## @param disk_UUID (string) UUID of the Block Device, for errors
+    ## @returns connection (BDSClientSocket) connection ready for a request
+    def borrow(self, disk_UUID):
+        while len(self._idle):
+            connection = self._idle.pop()
+            if connection.state == constants.IDLE_STATE:
+                return connection
+        return self.connect(disk_UUID)
+
+    ## Creates a new connection to the Block Device and adds it to the
+    ## pollables. The connection is made without blocking, it finishes
+    ## connecting once the socket is writable (see
+    ## @ref frontend.pollables.bds_client_socket.BDSClientSocket). A connection
+    ## that is refused right away is reported to the service as a DiskRefused
+    ## error.
+    ## @param disk_UUID (string) UUID of the Block Device, for errors
+    ## @returns connection (BDSClientSocket) the new connection
+    def connect(self, disk_UUID):
+        new_socket = socket.socket(
+            family=socket.AF_INET,
+            type=socket.SOCK_STREAM,
+        )
+        # set to non blocking
+        new_socket.setblocking(0)
+        try:
+            error = new_socket.connect_ex(self._address)
+        except socket.error as e:
+            error = e.errno
+        if error not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            # connection refused from disk! build disk refused and raise..
+            new_socket.close()
+            self.mark_failed()
+            raise util.DiskRefused(disk_UUID)
+
+        # requests are sent in a few large chunks, don't let the small
+        # first chunk (request line and headers) delay the rest
+        new_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        connection = bds_client_socket.BDSClientSocket(
+            new_socket,
+            self._application_context,
+            self,
+            connecting=error != 0,
+        )
+        self._pollables[new_socket.fileno()] = connection
+        logging.debug(
+            "Added a new BDS client, %s" % connection
+        )
+        return connection
+
+    ## Returns a connection to the pool after it finished a request.
+    ## @param connection (BDSClientSocket) the connection returned
+    ## @returns pooled (bool) False if the pool is full and the connection
+    ## should be closed
+    def release(self, connection):
+        if (
+            len(self._idle) >=
+            self._application_context["pool_max_idle"]
+        ):
+            return False
+        self._idle.append(connection)
+        return True
+
+    ## Returns a borrowed connection that hasn't been used to the pool
+    ## @param connection (BDSClientSocket) the connection returned
+    def put_back(self, connection):
+        if not self.release(connection):
+            connection.state = constants.CLOSING_STATE
+
+    ## Removes a closing connection from the pool
+    ## @param connection (BDSClientSocket) the connection removed
+    def remove(self, connection):
+        if connection in self._idle:
+            self._idle.remove(connection)
+
+    ## Called when a connection to the Block Device failed. The idle
+    ## connections are most likely broken too, so they are all evicted.
+    def mark_failed(self):
+        for connection in self._idle:
+            connection.state = constants.CLOSING_STATE
+        self._idle = []
+
+    ## Returns a representatin of the ConnectionPool Object
+    # @returns representation (str)
+    def __repr__(self):
+        return "ConnectionPool Object: %s, %s idle" % (
+            util.printable_address(self._address),
+            len(self._idle),
+        )
+
+
+## Returns the pool of a Block Device, creates the pool if it is the first
+## connection to that Block Device.
+## @param application_context (dict) the application_context of the
+## Frontend server
+## @param pollables (dict) pointer to the pollables in the system
+## @param address (tuple) TCP address of the Block Device
+## @returns pool (ConnectionPool) the pool of the Block Device
+def get_pool(application_context, pollables, address):
+    pools = application_context["connection_pools"]
+    if address not in pools.keys():
+        pools[address] = ConnectionPool(
+            address,
+            application_context,
+            pollables
+        )
+    return pools[address]
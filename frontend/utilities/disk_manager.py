@@ -12,7 +12,7 @@ import traceback
 
 from common.utilities import constants
 from common.utilities import util
-from frontend.pollables import bds_client_socket
+from frontend.utilities import connection_pool
 
 
 ## DiskManager manages multiple disk requests, and notifies when
@@ -42,6 +42,9 @@ class DiskManager(object):
         ## Disks we are handling
         self._disks = disks
 
+        ## Time the requests were sent
+        self._start_time = time.time()
+
         for disk_UUID, context in client_contexts.items():
             # add to database
             self._disk_requests[disk_UUID] = {
@@ -50,55 +53,56 @@ class DiskManager(object):
                     "finished": False,
                     "status": "",
                     "content": "",
+                    "refused": False,
                 }
             }
             # if disk is in offline state, don't even try to connect,
             if self._disks[disk_UUID]["state"] == constants.OFFLINE:
                 raise util.DiskRefused(disk_UUID)
 
-            # try to add the client to pollables
-            self.add_bds_client(
-                parent,
-                self._disk_requests[disk_UUID]["context"],
-                self._disk_requests[disk_UUID]["update"],
+        # borrow all the connections before sending anything, so a disk
+        # that refuses to connect right away won't leave only some of the
+        # requests sent
+        bds_clients = {}
+        try:
+            for disk_UUID, request in self._disk_requests.items():
+                bds_clients[disk_UUID] = self.borrow_bds_client(
+                    parent,
+                    request["context"]
+                )
+        except util.DiskRefused:
+            for bds_client in bds_clients.values():
+                bds_client.pool.put_back(bds_client)
+            raise
+
+        for disk_UUID, request in self._disk_requests.items():
+            bds_clients[disk_UUID].start_request(
+                request["context"],
+                request["update"],
+                parent
+            )
+            logging.debug(
+                "%s :\t Sending request on BDS client, %s"
+                % (
+                    parent,
+                    bds_clients[disk_UUID]
+                )
             )
         # set parent to sleeping state until finished
         self._parent.state = constants.SLEEPING_STATE
 
-    ## Adds a BDSClientSocket to the list of pollables
+    ## Borrows a BDSClientSocket from the connection pool of the disk
+    ## @param parent (pollable) the parent that is called when finished
     ## @param client_context (dict) dictionary specifying the request
-    ## context for the current BDSClientSocket
-    ## @param client_update (dict) dictionary specifying the client_update
-    ## for the current BDSClientSocket
-    def add_bds_client(self, parent, client_context, client_update):
-        new_socket = socket.socket(
-            family=socket.AF_INET,
-            type=socket.SOCK_STREAM,
-        )
-        try:
-            new_socket.connect((client_context["disk_address"]))
-        except socket.error as e:
-            # connection refused from disk! build disk refused and raise..
-            raise util.DiskRefused(client_context["disk_UUID"])
-
-        # set to non blocking
-        new_socket.setblocking(0)
-
-        # add to database, need to specify block_num
-        new_bds_client = bds_client_socket.BDSClientSocket(
-            new_socket,
-            client_context,
-            client_update,
-            parent
-        )
-        self._pollables[new_socket.fileno()] = new_bds_client
-        logging.debug(
-            "%s :\t Added a new BDS client, %s"
-            % (
-                parent,
-                new_bds_client
-            )
+    ## context for the BDSClientSocket
+    ## @returns bds_client (BDSClientSocket) connection for the request
+    def borrow_bds_client(self, parent, client_context):
+        pool = connection_pool.get_pool(
+            parent.application_context,
+            self._pollables,
+            client_context["disk_address"]
         )
+        return pool.borrow(client_context["disk_UUID"])
 
     ## Returns the client_updates from the BDSClientSockets. The responses
     ## from ech of the Block Devices
@@ -109,6 +113,12 @@ class DiskManager(object):
             ret[disk_UUID] = request["update"]
         return ret
 
+    ## Returns the time since the requests were sent, the latency of the
+    ## requests once they have finished
+    ## @returns latency (float) seconds since the requests were sent
+    def get_latency(self):
+        return time.time() - self._start_time
+
     ## Checks if all the responses returned the same status code
     ## @param common_status_code (int) the common_status_code we're checking
     ## @returns all_common (bool) if all the responses have the same code
@@ -119,7 +129,9 @@ class DiskManager(object):
         return True
 
     ## Checks if all the disks have gotten a response. Also checks that they
-    ## got the same status code.
+    ## got the same status code. A disk that failed to connect once the
+    ## requests were sent is reported like a disk that refused to connect
+    ## right away, by a DiskRefused error.
     ## @returns all_finished (bool) if all the BDSClientSockets have finished
     def check_if_finished(self):
         # check easy case first
@@ -130,6 +142,10 @@ class DiskManager(object):
             if not data["update"]["finished"]:
                 return False
 
+        for disk_UUID, data in self._disk_requests.items():
+            if data["update"]["refused"]:
+                raise util.DiskRefused(disk_UUID)
+
         common_status_code = self._disk_requests[
             self._disk_requests.keys()[0]
         ]["update"]["status"]
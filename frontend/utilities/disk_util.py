@@ -13,41 +13,29 @@ import traceback
 from common.services import base_service
 from common.utilities import constants
 from common.utilities import util
+from frontend.utilities import xor_engine
 
-## Checks if a list of blocks contains only empty blocks
-## @param blocks (list) list of blocks
-## @returns all_empty (bool) if all the disks are empty
-def all_empty(blocks):
-    for block in blocks:
-        if len(block):
-            return False
-    return True
+## Extracts a single block from the content of a range of blocks. Blocks
+## past the end of the content are empty, like blocks past the end of a disk
+## @param content (string) content of the range of blocks
+## @param first (int) block_num of the first block in the range
+## @param block_num (int) block_num of the wanted block
+## @returns block (string) the wanted block
+def get_block_from_extent(content, first, block_num):
+    offset = (block_num - first) * constants.BLOCK_SIZE
+    return content[offset:offset + constants.BLOCK_SIZE]
 
 ## Computes the missing block using parity and XOR by RAID5 protocol
-## @param blocks (list) list of blocks
-## @returns missing_block (string) the missing block
+## @param blocks (list) list of blocks (or extents of blocks)
+## @returns missing_block (string) the missing block, at least BLOCK_SIZE
+## long
 def compute_missing_block(blocks):
     if blocks == []:
         return None
-    new_block = blocks[0]
-    for block in blocks[1:]:
-        new_block = xor_blocks(new_block, block)
-    return new_block
-
-## XOR's two blocks
-## @param block1 (string) first block
-## @param block2 (string) second block
-## @returns xored_block (string) the XOR between the two blocks
-def xor_blocks(block1, block2):
-    # add block size in case of uneven byte arrays
-    b1 = bytearray(block1) + bytearray(constants.BLOCK_SIZE)
-    b2 = bytearray(block2) + bytearray(constants.BLOCK_SIZE)
-    b = bytearray(constants.BLOCK_SIZE)
-
-    for i in range(len(b)):
-        b[i] = b1[i] ^ b2[i]
-
-    return str(b)
+    return xor_engine.xor(
+        blocks,
+        max([len(block) for block in blocks] + [constants.BLOCK_SIZE])
+    )
 
 ## Extracts the disk_UUID of a physical disk given the logic disk_UUID
 ## @param disks (dict) dictionary of disks
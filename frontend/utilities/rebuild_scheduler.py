@@ -0,0 +1,184 @@
+#!/usr/bin/python
+## @package RAID5.frontend.utilities.rebuild_scheduler
+# Module that defines the TokenBucket and RebuildScheduler classes, that limit
+# the traffic of disk rebuilds so they don't starve client reads and writes
+#
+
+import time
+
+## TokenBucket class. Tokens are added at a constant rate, up to the size of
+## the bucket. Traffic is allowed while there are tokens, and may take more
+## tokens than there are (the bucket goes into debt), so a large request
+## doesn't wait forever.
+class TokenBucket(object):
+
+    ## Constructor for TokenBucket
+    ## @param rate (float) tokens added per second
+    ## @param burst (float) max amount of tokens in the bucket
+    def __init__(self, rate, burst):
+        ## Tokens added per second
+        self._rate = rate
+
+        ## Max amount of tokens in the bucket
+        self._burst = burst
+
+        ## Amount of tokens in the bucket, negative if in debt
+        self._tokens = burst
+
+        ## Time the bucket was last refilled
+        self._last_refill = time.time()
+
+    ## Adds the tokens since the last refill
+    ## @param factor (float) part of the rate the tokens are added at
+    def refill(self, factor):
+        now = time.time()
+        self._tokens = min(
+            self._burst,
+            self._tokens + (now - self._last_refill) * self._rate * factor
+        )
+        self._last_refill = now
+
+    ## Time until there are tokens in the bucket
+    ## @param factor (float) part of the rate the tokens are added at
+    ## @returns delay (float) seconds until there are tokens, 0 if there are
+    def get_delay(self, factor):
+        self.refill(factor)
+        if self._tokens > 0:
+            return 0
+        return -self._tokens / (self._rate * factor)
+
+    ## Takes tokens from the bucket
+    ## @param amount (float) amount of tokens to take
+    def consume(self, amount):
+        self._tokens -= amount
+
+
+## RebuildScheduler class that gives the rebuild traffic of every disk a
+## budget of bandwidth and of requests per second, using a token bucket for
+## each. Rebuilds ask for the delay before sending an extent, and consume
+## the budgets of all the disks they send to.
+##
+## Reads and writes of clients report the latency of their requests to the
+## Block Devices. While that latency is higher than the target latency, the
+## budgets are cut down by the same ratio, so rebuilds back off when they
+## slow the clients down.
+class RebuildScheduler(object):
+
+    ## Seconds a latency sample counts for. Once clients haven't sent any
+    ## requests for that long, rebuilds get their whole budget again
+    LATENCY_TIMEOUT = 1
+
+    ## Weight of a new latency sample in the average latency
+    LATENCY_WEIGHT = 0.2
+
+    ## Smallest part of the budget rebuilds get when backing off
+    MIN_FACTOR = 0.05
+
+    ## Seconds of traffic a bucket can save up
+    BURST_TIME = 0.25
+
+    ## Constructor for RebuildScheduler
+    ## @param bandwidth (int) bytes per second a rebuild can send to a disk,
+    ## 0 for no limit
+    ## @param iops (int) requests per second a rebuild can send to a disk,
+    ## 0 for no limit
+    ## @param target_latency (float) latency (in seconds) of client requests
+    ## above which rebuilds back off, 0 to never back off
+    ## @param block_size (int) size of a block
+    def __init__(self, bandwidth, iops, target_latency, block_size):
+        ## Bytes per second a rebuild can send to a disk, 0 for no limit
+        self._bandwidth = bandwidth
+
+        ## Requests per second a rebuild can send to a disk, 0 for no limit
+        self._iops = iops
+
+        ## Latency of client requests above which rebuilds back off
+        self._target_latency = target_latency
+
+        ## Size of a block
+        self._block_size = block_size
+
+        ## Token buckets of the disks,
+        ## disk_UUID : (bandwidth bucket, iops bucket), None if no limit
+        self._buckets = {}
+
+        ## Average latency of client requests
+        self._latency = 0
+
+        ## Time of the last latency sample
+        self._last_sample = 0
+
+    ## Adds the latency of a client request
+    ## @param latency (float) seconds the request took
+    def add_latency(self, latency):
+        if time.time() - self._last_sample > RebuildScheduler.LATENCY_TIMEOUT:
+            self._latency = latency
+        else:
+            self._latency += RebuildScheduler.LATENCY_WEIGHT * (
+                latency - self._latency
+            )
+        self._last_sample = time.time()
+
+    ## Returns the part of the budgets rebuilds currently get
+    ## @returns factor (float) between MIN_FACTOR and 1
+    def get_factor(self):
+        if (
+            self._target_latency <= 0 or
+            self._latency <= self._target_latency or
+            time.time() - self._last_sample > RebuildScheduler.LATENCY_TIMEOUT
+        ):
+            return 1.0
+        return max(
+            RebuildScheduler.MIN_FACTOR,
+            self._target_latency / self._latency
+        )
+
+    ## Returns the bandwidth rebuilds currently get per disk
+    ## @returns bandwidth (float) bytes per second, None if no limit
+    def get_bandwidth(self):
+        if self._bandwidth <= 0:
+            return None
+        return self._bandwidth * self.get_factor()
+
+    ## Returns the token buckets of a disk, creates them if needed
+    ## @param disk_UUID (string) UUID of the disk
+    ## @returns buckets (tuple) (bandwidth bucket, iops bucket), None if no
+    ## limit
+    def get_buckets(self, disk_UUID):
+        if disk_UUID not in self._buckets:
+            buckets = [None, None]
+            if self._bandwidth > 0:
+                buckets[0] = TokenBucket(
+                    self._bandwidth,
+                    self._bandwidth * RebuildScheduler.BURST_TIME
+                )
+            if self._iops > 0:
+                buckets[1] = TokenBucket(
+                    self._iops,
+                    max(1, self._iops * RebuildScheduler.BURST_TIME)
+                )
+            self._buckets[disk_UUID] = tuple(buckets)
+        return self._buckets[disk_UUID]
+
+    ## Time until a rebuild can send requests to disks
+    ## @param disk_UUIDs (list) UUIDs of the disks
+    ## @returns delay (float) seconds until all the disks have budget, 0 if
+    ## they have
+    def get_delay(self, disk_UUIDs):
+        factor = self.get_factor()
+        delay = 0
+        for disk_UUID in disk_UUIDs:
+            for bucket in self.get_buckets(disk_UUID):
+                if bucket is not None:
+                    delay = max(delay, bucket.get_delay(factor))
+        return delay
+
+    ## Takes a request from the budget of a disk
+    ## @param disk_UUID (string) UUID of the disk
+    ## @param blocks (int) amount of blocks in the request
+    def consume(self, disk_UUID, blocks):
+        bandwidth_bucket, iops_bucket = self.get_buckets(disk_UUID)
+        if bandwidth_bucket is not None:
+            bandwidth_bucket.consume(blocks * self._block_size)
+        if iops_bucket is not None:
+            iops_bucket.consume(1)
@@ -13,11 +13,15 @@ import socket
 import time
 import traceback
 
+from block_device.services import get_allocation_service
 from block_device.services import get_block_service
+from block_device.services import get_blocks_service
 from block_device.services import get_disk_info_service
 from block_device.services import set_disk_info_service
 from block_device.services import set_block_service
+from block_device.services import set_blocks_service
 from block_device.services import login_service
+from block_device.services import trim_service
 from block_device.services import update_level_service
 from common.services import form_service
 from common.services import base_service
@@ -83,6 +87,68 @@ def create_get_block_contexts(disks, request_info):
         }
     return client_contexts
 
+## Creates get_blocks service request_contexts
+## @param disks (dict) current disks we're handling
+## @request_info (dict) specific request info for this context,
+## {
+##    disk_UUID : {
+##        "first": first block_num,
+##        "count": amount of blocks,
+##        "password" : long_password
+##    }
+## }
+## @returns request_contexts (dict) returns built request contexts for this
+## service
+def create_get_blocks_contexts(disks, request_info):
+    client_contexts = {}
+    for disk_UUID, info in request_info.items():
+        client_contexts[disk_UUID] = {
+            "headers": {
+                "Authorization" : "Basic %s" % (
+                    base64.b64encode(info["password"])
+                )
+            },
+            "args": {"first": info["first"], "count": info["count"]},
+            "disk_UUID": disk_UUID,
+            "disk_address": disks[disk_UUID]["address"],
+            "method": "GET",
+            "service": (
+                get_blocks_service.GetBlocksService.get_name()
+            ),
+            "content": ""
+        }
+    return client_contexts
+
+## Creates get_allocation service request_contexts
+## @param disks (dict) current disks we're handling
+## @request_info (dict) specific request info for this context,
+## {
+##    disk_UUID : {
+##        "password" : long_password
+##    }
+## }
+## @returns request_contexts (dict) returns built request contexts for this
+## service
+def create_get_allocation_contexts(disks, request_info):
+    client_contexts = {}
+    for disk_UUID, info in request_info.items():
+        client_contexts[disk_UUID] = {
+            "headers": {
+                "Authorization" : "Basic %s" % (
+                    base64.b64encode(info["password"])
+                )
+            },
+            "args": {},
+            "disk_UUID": disk_UUID,
+            "disk_address": disks[disk_UUID]["address"],
+            "method": "GET",
+            "service": (
+                get_allocation_service.GetAllocationService.get_name()
+            ),
+            "content": ""
+        }
+    return client_contexts
+
 ## Creates get_disk_info service request_contexts
 ## @param disks (dict) current disks we're handling
 ## @request_info (list) specific request info for this context,
@@ -137,6 +203,79 @@ def create_set_block_contexts(disks, request_info):
         }
     return client_contexts
 
+## Creates set_blocks service request_contexts. Contiguous blocks are sent
+## as a run of blocks, otherwise as a list of blocks
+## @param disks (dict) current disks we're handling
+## @request_info (dict) specific request info for this context,
+## {
+##     disk_UUID : {
+##         "blocks" : [[block_num, content], ...] (sorted by block_num)
+##         "password" : password
+##     }
+## }
+## @returns request_contexts (dict) returns built request contexts for this
+## service
+def create_set_blocks_contexts(disks, request_info):
+    client_contexts = {}
+    for disk_UUID, info in request_info.items():
+        block_nums = [block_num for block_num, content in info["blocks"]]
+        if block_nums == range(block_nums[0], block_nums[-1] + 1):
+            args = {"first": block_nums[0]}
+        else:
+            args = {"blocks": ",".join([str(b) for b in block_nums])}
+
+        client_contexts[disk_UUID] = {
+            "headers": {
+                "Authorization" : "Basic %s" % (
+                    base64.b64encode(info["password"])
+                )
+            },
+            "method": "GET",
+            "args": args,
+            "disk_UUID": disk_UUID,
+            "disk_address": disks[disk_UUID]["address"],
+            "service": (
+                set_blocks_service.SetBlocksService.get_name()
+            ),
+            "content": "".join([
+                content.ljust(constants.BLOCK_SIZE, chr(0))
+                for block_num, content in info["blocks"]
+            ]),
+        }
+    return client_contexts
+
+## Creates trim service request_contexts
+## @param disks (dict) current disks we're handling
+## @request_info (dict) specific request info for this context,
+## {
+##    disk_UUID : {
+##        "first": first block_num,
+##        "count": amount of blocks,
+##        "password" : long_password
+##    }
+## }
+## @returns request_contexts (dict) returns built request contexts for this
+## service
+def create_trim_contexts(disks, request_info):
+    client_contexts = {}
+    for disk_UUID, info in request_info.items():
+        client_contexts[disk_UUID] = {
+            "headers": {
+                "Authorization" : "Basic %s" % (
+                    base64.b64encode(info["password"])
+                )
+            },
+            "method": "GET",
+            "args": {"first": info["first"], "count": info["count"]},
+            "disk_UUID": disk_UUID,
+            "disk_address": disks[disk_UUID]["address"],
+            "service": (
+                trim_service.TrimService.get_name()
+            ),
+            "content": "",
+        }
+    return client_contexts
+
 ## Creates update_level service request_contexts
 ## @param disks (dict) current disks we're handling
 ## @request_info (dict) specific request info for this context,
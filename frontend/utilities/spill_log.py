@@ -0,0 +1,175 @@
+#!/usr/bin/python
+## @package RAID5.frontend.utilities.spill_log
+# Module that defines the SpillLog class, an append-only file of block data
+# for the cache of an offline disk
+#
+
+import errno
+import os
+
+## Minimum size of the superseded entries before the log is compacted
+MIN_COMPACT_SIZE = 2**20
+
+## SpillLog class that keeps the data of blocks that don't fit in memory in
+## an append-only file, with an index of the blocks in memory. The file is
+## only created once the first block is appended.
+## A block that is written again is appended again, and its previous entry
+## becomes garbage. Once there is more garbage than live data, the live
+## entries are copied to a new file, in the order they were appended.
+class SpillLog(object):
+
+    ## Constructor for SpillLog
+    ## @param file_name (string) name of the log file
+    def __init__(self, file_name):
+        ## Name of the log file
+        self._file_name = file_name
+
+        ## File descriptor of the log file, None until the file is created
+        self._fd = None
+
+        ## Entries of the log, block_num : (offset, length)
+        self._index = {}
+
+        ## Size of the log file
+        self._size = 0
+
+        ## Size of the superseded entries
+        self._garbage = 0
+
+    ## Amount of blocks in the log
+    ## @returns length (int)
+    def __len__(self):
+        return len(self._index)
+
+    ## Checks if a block is in the log
+    ## @param block_num (int) the block
+    ## @returns contained (bool)
+    def __contains__(self, block_num):
+        return block_num in self._index
+
+    ## Opens (and truncates) the log file
+    def open(self):
+        directory = os.path.dirname(self._file_name)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._fd = os.open(
+            self._file_name,
+            os.O_RDWR | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0),
+            0o600
+        )
+        self._size = 0
+        self._garbage = 0
+
+    ## Appends the data of a block to the log. The previous entry of the
+    ## block is discarded first, as discarding the only entry truncates the
+    ## file.
+    ## @param block_num (int) the block
+    ## @param block_data (string) data of the block
+    def append(self, block_num, block_data):
+        if self._fd is None:
+            self.open()
+        self.discard(block_num)
+        self.write_at(self._size, block_data)
+        self._index[block_num] = (self._size, len(block_data))
+        self._size += len(block_data)
+
+        if (
+            self._garbage > MIN_COMPACT_SIZE and
+            self._garbage > self._size - self._garbage
+        ):
+            self.compact()
+
+    ## Returns the data of a block
+    ## @param block_num (int) the block
+    ## @returns block_data (string) data of the block, None if not in log
+    def read(self, block_num):
+        if block_num not in self._index:
+            return None
+        offset, length = self._index[block_num]
+        return self.read_at(self._fd, offset, length)
+
+    ## Returns the data of a block and removes it from the log
+    ## @param block_num (int) the block
+    ## @returns block_data (string) data of the block, None if not in log
+    def pop(self, block_num):
+        block_data = self.read(block_num)
+        self.discard(block_num)
+        return block_data
+
+    ## Removes a block from the log, its entry becomes garbage. Once the log
+    ## has no blocks the file is truncated.
+    ## @param block_num (int) the block
+    def discard(self, block_num):
+        entry = self._index.pop(block_num, None)
+        if entry is not None:
+            self._garbage += entry[1]
+        if len(self._index) == 0 and self._size:
+            os.ftruncate(self._fd, 0)
+            self._size = 0
+            self._garbage = 0
+
+    ## Copies the live entries to a new log file, in the order they were
+    ## appended, and replaces the log file with it
+    def compact(self):
+        tmp_name = "%s.tmp" % self._file_name
+        fd = os.open(
+            tmp_name,
+            os.O_RDWR | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0),
+            0o600
+        )
+        index = {}
+        size = 0
+        try:
+            for block_num, (offset, length) in sorted(
+                self._index.items(),
+                key=lambda item: item[1][0]
+            ):
+                block_data = self.read_at(self._fd, offset, length)
+                while block_data:
+                    block_data = block_data[os.write(fd, block_data):]
+                index[block_num] = (size, length)
+                size += length
+            os.rename(tmp_name, self._file_name)
+        except BaseException:
+            os.close(fd)
+            os.remove(tmp_name)
+            raise
+
+        os.close(self._fd)
+        self._fd = fd
+        self._index = index
+        self._size = size
+        self._garbage = 0
+
+    ## Closes and removes the log file
+    def close(self):
+        if self._fd is None:
+            return
+        os.close(self._fd)
+        self._fd = None
+        self._index = {}
+        try:
+            os.remove(self._file_name)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+    ## Writes data at an offset of the log file
+    ## @param offset (int) the offset
+    ## @param data (string) data to write
+    def write_at(self, offset, data):
+        os.lseek(self._fd, offset, os.SEEK_SET)
+        while data:
+            data = data[os.write(self._fd, data):]
+
+    ## Reads data from an offset of a file, with pread if it's available
+    ## @param fd (int) file descriptor of the file
+    ## @param offset (int) the offset
+    ## @param length (int) amount of bytes to read
+    ## @returns data (string) the data
+    @staticmethod
+    def read_at(fd, offset, length):
+        if hasattr(os, "pread"):
+            return os.pread(fd, length, offset)
+        os.lseek(fd, offset, os.SEEK_SET)
+        return os.read(fd, length)
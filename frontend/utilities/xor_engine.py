@@ -0,0 +1,105 @@
+#!/usr/bin/python
+## @package RAID5.frontend.utilities.xor_engine
+# Module that defines the XOR engines used to compute parity and to
+# reconstruct blocks. Each engine XORs many blocks (or whole extents) at once.
+#
+
+import binascii
+
+# numpy is optional, only used if installed
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+## XORs blocks using numpy. The blocks are XORed into a single result array,
+## 8 bytes at a time, without creating intermediate strings.
+## @param blocks (list) list of blocks (strings), shorter blocks are padded
+## with zeros
+## @param size (int) size of the result
+## @returns xored_block (string) the XOR of all the blocks
+def numpy_xor(blocks, size):
+    # round up so we can always look at the result as 64 bit words
+    result = numpy.zeros((size + 7) // 8 * 8, dtype=numpy.uint8)
+    words = result.view(numpy.uint64)
+    for block in blocks:
+        length = min(len(block), size)
+        whole = length // 8
+        if whole:
+            words[:whole] ^= numpy.frombuffer(
+                block,
+                dtype=numpy.uint64,
+                count=whole
+            )
+        if length % 8:
+            result[whole * 8:length] ^= numpy.frombuffer(
+                block,
+                dtype=numpy.uint8,
+                count=length - whole * 8,
+                offset=whole * 8
+            )
+    return result[:size].tobytes()
+
+## XORs blocks using python's big integers. Every block is converted to a
+## single integer, so the XOR itself is done in C.
+## @param blocks (list) list of blocks (strings), shorter blocks are padded
+## with zeros
+## @param size (int) size of the result
+## @returns xored_block (string) the XOR of all the blocks
+def bigint_xor(blocks, size):
+    value = 0
+    for block in blocks:
+        block = block[:size]
+        if len(block):
+            # shift so that the block is padded with zeros at the end
+            value ^= bytes_to_int(block) << (8 * (size - len(block)))
+    return int_to_bytes(value, size)
+
+## Converts a big endian string to an integer
+## @param buf (string) buf to convert
+## @returns value (int) the integer value of buf
+def bytes_to_int(buf):
+    if hasattr(int, "from_bytes"):
+        return int.from_bytes(buf, "big")
+    return int(binascii.hexlify(buf), 16)
+
+## Converts an integer to a big endian string
+## @param value (int) value to convert
+## @param size (int) size of the string
+## @returns buf (string) the string value of the integer
+def int_to_bytes(value, size):
+    if hasattr(value, "to_bytes"):
+        return value.to_bytes(size, "big")
+    if size == 0:
+        return ""
+    return binascii.unhexlify("%0*x" % (2 * size, value))
+
+## All the available engines
+ENGINES = {
+    "bigint": bigint_xor,
+}
+if numpy is not None:
+    ENGINES["numpy"] = numpy_xor
+
+## Default engine, the fastest available
+DEFAULT_ENGINE = "numpy" if numpy is not None else "bigint"
+
+## Engine currently in use
+_engine = ENGINES[DEFAULT_ENGINE]
+
+## Sets the engine in use
+## @param name (string) name of the engine, one of ENGINES
+def set_engine(name):
+    global _engine
+    _engine = ENGINES[name]
+
+## XORs blocks with the engine in use
+## @param blocks (list) list of blocks (strings), shorter blocks are padded
+## with zeros
+## @param size (optional) (int) size of the result, defaults to the size of
+## the longest block
+## @returns xored_block (string) the XOR of all the blocks
+def xor(blocks, size=None):
+    if size is None:
+        size = max([len(block) for block in blocks] + [0])
+    return _engine(blocks, size)
@@ -0,0 +1,50 @@
+#!/usr/bin/python
+## @package RAID5.spill_log_test
+# Module that checks the SpillLog of the caches of offline disks
+#
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from frontend.utilities import spill_log
+
+## Checks of the SpillLog class
+class SpillLogTest(unittest.TestCase):
+
+    ## Creates a log in a temporary directory
+    def setUp(self):
+        ## Temporary directory of the log file
+        self._directory = tempfile.mkdtemp()
+
+        ## The log
+        self._log = spill_log.SpillLog(
+            os.path.join(self._directory, "spill")
+        )
+
+    ## Closes the log and removes the temporary directory
+    def tearDown(self):
+        self._log.close()
+        shutil.rmtree(self._directory)
+
+    ## Rewriting the only block of the log keeps its new data
+    def test_rewrite_only_block(self):
+        self._log.append(5, "A" * 4096)
+        self._log.append(5, "B" * 4096)
+        self.assertEqual(len(self._log), 1)
+        self.assertEqual(self._log.pop(5), "B" * 4096)
+        self.assertEqual(len(self._log), 0)
+
+    ## Rewriting a block among others keeps the data of all the blocks
+    def test_rewrite_block(self):
+        self._log.append(5, "A" * 4096)
+        self._log.append(7, "C" * 4096)
+        self._log.append(5, "B" * 4096)
+        self.assertEqual(self._log.read(7), "C" * 4096)
+        self.assertEqual(self._log.pop(5), "B" * 4096)
+        self.assertEqual(self._log.pop(7), "C" * 4096)
+
+
+if __name__ == "__main__":
+    unittest.main()
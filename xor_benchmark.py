@@ -0,0 +1,61 @@
+#!/usr/bin/python
+## @package RAID5.xor_benchmark
+# Module that measures the throughput of the available XOR engines
+#
+
+import os
+import sys
+import time
+
+from common.utilities import constants
+from frontend.utilities import xor_engine
+
+## Number of times each XOR is repeated
+DEFAULT_ROUNDS = 200
+
+## Measures a single engine
+## @param engine (function) the engine to measure
+## @param blocks (list) the blocks to XOR
+## @param rounds (int) number of times to XOR the blocks
+## @returns throughput (float) MB of input XORed per second
+def measure(engine, blocks, rounds):
+    size = max([len(block) for block in blocks])
+    start = time.time()
+    for i in range(rounds):
+        engine(blocks, size)
+    elapsed = max(time.time() - start, 1e-9)
+    return float(sum([len(block) for block in blocks]) * rounds) / (
+        elapsed * 1024 * 1024
+    )
+
+## Measures all the engines, for a single block and for a whole extent
+## @param disks (int) number of disks in the volume
+## @param rounds (int) number of times to XOR the blocks
+def benchmark(disks, rounds):
+    for name, blocks_per_disk in (
+        ("block", 1),
+        ("extent", constants.MAX_EXTENT_BLOCKS),
+    ):
+        blocks = [
+            os.urandom(blocks_per_disk * constants.BLOCK_SIZE)
+            for disk_num in range(disks - 1)
+        ]
+        results = {}
+        for engine_name, engine in sorted(xor_engine.ENGINES.items()):
+            results[engine_name] = engine(blocks, len(blocks[0]))
+            print(
+                "%-8s %-8s %10.1f MB/s" % (
+                    name,
+                    engine_name,
+                    measure(engine, blocks, rounds),
+                )
+            )
+        if len(set(results.values())) != 1:
+            raise RuntimeError("Engines returned different results")
+
+
+if __name__ == "__main__":
+    benchmark(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 4,
+        int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_ROUNDS,
+    )